@@ -1253,6 +1253,16 @@ window.onload = function() {
             }
             return;
         }
+        // /events で届くイベントは結果の参照（位置・スコア・コードのハッシュ）だけを持つので、コード付きの結果を取り寄せてから表示する
+        const compact = Array.isArray(event.results) && event.results.some(r => r && r.code_sha256 && !r.code && !r.raw_code);
+        if (compact) {
+            const statusEl = document.getElementById('status');
+            if (statusEl) {
+                statusEl.textContent = 'Loading agent search results...';
+            }
+            vscode.postMessage({ command: 'loadAgentSearchEvent', eventId: event.id });
+            return;
+        }
         const query = event.original_query || event.query || '';
         const searchInput = document.getElementById('searchInput');
         if (searchInput && query) {
@@ -1764,6 +1774,16 @@ window.onload = function() {
                 if (msg.type === 'agentSearchEvents') {
                         addAgentSearchEvents(msg.events);
                 }
+                if (msg.type === 'agentSearchEventDetail') {
+                        if (msg.event) {
+                                applyAgentSearchEvent(msg.event);
+                        } else {
+                                const statusEl = document.getElementById('status');
+                                if (statusEl) {
+                                        statusEl.textContent = msg.message || 'Failed to load agent search results.';
+                                }
+                        }
+                }
                 if (msg.type === 'indexProgress') {
                         applyIndexProgress(msg.progress);
                 }
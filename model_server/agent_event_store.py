@@ -0,0 +1,169 @@
+"""Bounded, indexed store for agent search events.
+
+Events live in a ring buffer of `max_events` with an id -> event dict beside
+it, so lookups, parent links and usage reports are O(1) and the oldest event
+is dropped in O(1). Stored events carry compact result references (identity,
+location, scores, a hash of the code) instead of the full results; the full
+results, code included, are kept only for the newest `full_result_events`
+events. When `log_path` is set, every event is also appended with its full
+results to a JSON-lines log, and the full results of any event still in the
+ring are read back from its recorded offset.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+
+# 検索結果のうちメモリ上のイベントには残さない大きなフィールド
+BULKY_RESULT_FIELDS = ("code", "raw_code", "text", "commit_hunks")
+
+
+def code_sha256(result: dict) -> Optional[str]:
+    code = str(result.get("raw_code") or result.get("code") or result.get("text") or "")
+    return hashlib.sha256(code.encode("utf-8")).hexdigest() if code else None
+
+
+def compact_result(result: dict) -> dict:
+    """`result` without its code and hunk bodies, plus the hash of its code."""
+    ref = {key: value for key, value in result.items() if key not in BULKY_RESULT_FIELDS}
+    digest = code_sha256(result)
+    if digest:
+        ref["code_sha256"] = digest
+    return ref
+
+
+class AgentEventStore:
+    def __init__(self, max_events: int = 100, full_result_events: int = 20, log_path: Optional[str] = None):
+        self.max_events = max_events
+        self.full_result_events = full_result_events
+        self.log_path = log_path or None
+        # /events はこの番号の変化だけを見て送る（追加・使用報告のたびに進む）
+        self.version = 0
+        self._lock = threading.Lock()
+        self._events: deque[dict] = deque()
+        self._by_id: dict[int, dict] = {}
+        self._full_results: "OrderedDict[int, list[dict]]" = OrderedDict()
+        self._log_offsets: dict[int, int] = {}
+        self._log_file = None
+        self._next_id = 1
+
+    def append(self, event: dict) -> dict:
+        """Store `event` with a new id and compact results; returns a copy of the stored event."""
+        results = event.get("results") if isinstance(event.get("results"), list) else None
+        with self._lock:
+            stored = {"id": self._next_id, "created_at": time.time(), **event}
+            self._next_id += 1
+            if results is not None:
+                stored["results"] = [compact_result(result) for result in results]
+                self._full_results[stored["id"]] = results
+                while len(self._full_results) > self.full_result_events:
+                    self._full_results.popitem(last=False)
+            if self.log_path:
+                self._write_log(stored["id"], {"event": {**stored, "results": results}} if results is not None else {"event": stored})
+            self._events.append(stored)
+            self._by_id[stored["id"]] = stored
+            parent = self._by_id.get(stored.get("parent_event_id"))
+            if parent is not None:
+                # 返したコピーが参照中のリストは書き換えず、新しいリストに差し替える
+                children = parent.get("child_event_ids", [])
+                if stored["id"] not in children:
+                    parent["child_event_ids"] = [*children, stored["id"]]
+            while len(self._events) > self.max_events:
+                dropped = self._events.popleft()
+                self._by_id.pop(dropped["id"], None)
+                self._full_results.pop(dropped["id"], None)
+                self._log_offsets.pop(dropped["id"], None)
+            self.version += 1
+            return dict(stored)
+
+    def _write_log(self, event_id: Optional[int], record: dict) -> None:
+        # self._lock を保持した状態で呼ぶ。ログに書けなくてもイベントの記録は続ける
+        try:
+            if self._log_file is None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.log_path)), exist_ok=True)
+                self._log_file = open(self.log_path, "ab")
+            line = (json.dumps(record, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+            offset = self._log_file.tell()
+            self._log_file.write(line)
+            # full_results は別のハンドルで読むので、書いたらすぐ flush する
+            self._log_file.flush()
+            if event_id is not None:
+                self._log_offsets[event_id] = offset
+        except OSError:
+            pass
+
+    def close(self) -> None:
+        with self._lock:
+            if self._log_file is not None:
+                self._log_file.close()
+                self._log_file = None
+
+    def get(self, event_id: int) -> Optional[dict]:
+        """A shallow copy of the event, safe to serialize outside the lock."""
+        with self._lock:
+            event = self._by_id.get(event_id)
+            return dict(event) if event is not None else None
+
+    def full_results(self, event_id: int) -> Optional[list[dict]]:
+        """Full results of an event still in the ring: from memory for recent
+        events, else from the log, else the compact references."""
+        with self._lock:
+            event = self._by_id.get(event_id)
+            if event is None:
+                return None
+            results = self._full_results.get(event_id)
+            if results is not None:
+                return results
+            offset = self._log_offsets.get(event_id)
+            compact = event.get("results") or []
+        if offset is not None:
+            try:
+                with open(self.log_path, "rb") as f:
+                    f.seek(offset)
+                    record = json.loads(f.readline().decode("utf-8"))
+                logged = record.get("event", {})
+                if logged.get("id") == event_id and isinstance(logged.get("results"), list):
+                    return logged["results"]
+            except (OSError, ValueError):
+                pass
+        return compact
+
+    def recent(self, since_id: int = 0, limit: int = 20) -> list[dict]:
+        """Up to `limit` newest events with id > since_id, oldest first."""
+        limit = max(1, min(limit, self.max_events))
+        with self._lock:
+            found = []
+            for event in reversed(self._events):
+                if event["id"] <= since_id or len(found) >= limit:
+                    break
+                found.append(dict(event))
+        found.reverse()
+        return found
+
+    def add_usage(self, usage: dict) -> Optional[dict]:
+        """Attach a usage report to its event; returns a copy of the event if it is still stored."""
+        with self._lock:
+            self.version += 1
+            if self.log_path:
+                self._write_log(None, {"usage": usage})
+            event = self._by_id.get(usage.get("event_id"))
+            if event is None:
+                return None
+            reports = [*event.get("usage_reports", []), usage]
+            event["usage_reports"] = reports
+            event["referenced_ranks"] = sorted({
+                int(rank)
+                for report in reports
+                for rank in report.get("referenced_ranks", [])
+                if isinstance(rank, int) or str(rank).isdigit()
+            })
+            event["referenced_locations"] = sorted({
+                str(location)
+                for report in reports
+                for location in report.get("referenced_locations", [])
+                if location
+            })
+            return dict(event)
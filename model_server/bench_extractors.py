@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""Micro-benchmark: per-file tree-sitter extraction overhead with and without
+the compiled query cache (extractors/queries.py).
+
+    python bench_extractors.py [--files 300]
+
+"Recompile" clears the cache before every file, which reproduces the old
+behaviour of calling Language.query() per file.
+"""
+from __future__ import annotations
+
+import argparse
+import time
+
+from extractors import queries
+from extractors.java_extractor import extract_java_functions
+from extractors.python_extractor import _extract_python_functions_with_tree_sitter
+from extractors.typescript_extractor import extract_typescript_functions
+
+SAMPLES = {
+    "python (tree-sitter)": (
+        _extract_python_functions_with_tree_sitter,
+        b"class Service:\n    def run(self):\n        return 1\n\ndef helper():\n    return 2\n",
+    ),
+    "java": (
+        extract_java_functions,
+        b"class Service {\n  int run() { return 1; }\n  int stop() { return 0; }\n}\n",
+    ),
+    "typescript": (
+        extract_typescript_functions,
+        b"class Service {\n  run(): number { return 1; }\n}\nfunction helper(): number { return 2; }\n",
+    ),
+}
+
+
+def per_file_ms(extract, source: bytes, files: int, recompile: bool) -> float:
+    extract(source)  # warm parsers
+    start = time.perf_counter()
+    for _ in range(files):
+        if recompile:
+            queries._local.queries = {}
+        extract(source)
+    return (time.perf_counter() - start) * 1000 / files
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=300)
+    args = parser.parse_args()
+    print(f"{'language':<22}{'recompile ms/file':>20}{'cached ms/file':>18}{'speedup':>10}")
+    for name, (extract, source) in SAMPLES.items():
+        before = per_file_ms(extract, source, args.files, recompile=True)
+        after = per_file_ms(extract, source, args.files, recompile=False)
+        print(f"{name:<22}{before:>20.3f}{after:>18.3f}{before / after:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""Okapi BM25 over an inverted index.
+
+The index is built once from tokenized documents (or from per-document term
+positions that were persisted earlier) and can then answer many queries
+without re-tokenizing the corpus. `scores` also accepts ``"quoted phrases"``
+(terms must appear consecutively) and ``prefix*`` terms (expanded against the
+sorted vocabulary); `term_scores` scores plain tokens only.
+"""
+import bisect
+import math
+import re
+
+_TOKEN_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+")
+_QUERY_PATTERN = re.compile(r'"(?P<phrase>[^"]*)"|(?P<term>[A-Za-z_][A-Za-z0-9_]*|\d+)(?P<prefix>\*)?')
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+
+def tokenize_for_bm25(text: str) -> list[str]:
+    return [token.lower() for token in _TOKEN_PATTERN.findall(text)]
+
+
+def term_positions(tokens: list[str]) -> dict[str, list[int]]:
+    positions: dict[str, list[int]] = {}
+    for position, token in enumerate(tokens):
+        positions.setdefault(token, []).append(position)
+    return positions
+
+
+def parse_query(query: str) -> list[tuple[str, list[str]]]:
+    """Split a query into ("term" | "prefix" | "phrase", tokens) clauses."""
+    clauses: list[tuple[str, list[str]]] = []
+    for match in _QUERY_PATTERN.finditer(query):
+        if match.group("phrase") is not None:
+            tokens = tokenize_for_bm25(match.group("phrase"))
+            if len(tokens) == 1:
+                clauses.append(("term", tokens))
+            elif tokens:
+                clauses.append(("phrase", tokens))
+        elif match.group("prefix"):
+            clauses.append(("prefix", [match.group("term").lower()]))
+        else:
+            clauses.append(("term", [match.group("term").lower()]))
+    return clauses
+
+
+class BM25Index:
+    def __init__(self):
+        # term -> (doc ids, term frequencies), both in ascending doc order
+        self.postings: dict[str, tuple[list[int], list[int]]] = {}
+        # term -> {doc id: positions}; only kept when phrase lookups are needed
+        self.positions: dict[str, dict[int, list[int]]] = {}
+        self.doc_lengths: list[int] = []
+        self.avg_doc_length: float = 0.0
+        self._vocabulary: list[str] | None = None
+
+    @classmethod
+    def from_tokens(cls, documents: list[list[str]], store_positions: bool = True) -> "BM25Index":
+        return cls.from_term_positions(
+            [term_positions(tokens) for tokens in documents],
+            [len(tokens) for tokens in documents],
+            store_positions,
+        )
+
+    @classmethod
+    def from_term_positions(
+        cls,
+        documents: list[dict[str, list[int]]],
+        doc_lengths: list[int],
+        store_positions: bool = True,
+    ) -> "BM25Index":
+        index = cls()
+        for doc_id, terms in enumerate(documents):
+            for term, positions in terms.items():
+                posting = index.postings.get(term)
+                if posting is None:
+                    posting = ([], [])
+                    index.postings[term] = posting
+                posting[0].append(doc_id)
+                posting[1].append(len(positions))
+                if store_positions:
+                    index.positions.setdefault(term, {})[doc_id] = positions
+        index.doc_lengths = list(doc_lengths)
+        if index.doc_lengths:
+            index.avg_doc_length = sum(index.doc_lengths) / len(index.doc_lengths)
+        return index
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    @property
+    def vocabulary(self) -> list[str]:
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.postings)
+        return self._vocabulary
+
+    def prefix_terms(self, prefix: str) -> list[str]:
+        vocabulary = self.vocabulary
+        start = bisect.bisect_left(vocabulary, prefix)
+        terms = []
+        for term in vocabulary[start:]:
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+        return terms
+
+    def phrase_docs(self, tokens: list[str]) -> set[int]:
+        """Documents containing `tokens` consecutively (needs positions)."""
+        per_term = [self.positions.get(token) for token in tokens]
+        if any(not entry for entry in per_term):
+            return set()
+        candidates = set(per_term[0])
+        for entry in per_term[1:]:
+            candidates &= entry.keys()
+        matched = set()
+        for doc_id in candidates:
+            following = [set(entry[doc_id]) for entry in per_term[1:]]
+            for start in per_term[0][doc_id]:
+                if all(start + offset in positions for offset, positions in enumerate(following, start=1)):
+                    matched.add(doc_id)
+                    break
+        return matched
+
+    def _term_scores(self, term: str) -> dict[int, float]:
+        posting = self.postings.get(term)
+        if posting is None:
+            return {}
+        doc_ids, freqs = posting
+        total_docs = len(self.doc_lengths)
+        df = len(doc_ids)
+        idf = math.log(1 + ((total_docs - df + 0.5) / (df + 0.5)))
+        avg = self.avg_doc_length
+        scores = {}
+        for doc_id, freq in zip(doc_ids, freqs):
+            denom = freq + BM25_K1 * (1 - BM25_B + BM25_B * (self.doc_lengths[doc_id] / avg))
+            scores[doc_id] = idf * ((freq * (BM25_K1 + 1)) / denom)
+        return scores
+
+    def term_scores(self, tokens: list[str]) -> dict[int, float]:
+        """BM25 of plain query tokens, without phrase or prefix operators."""
+        if not self.doc_lengths or self.avg_doc_length <= 0:
+            return {}
+        scores: dict[int, float] = {}
+        for token in tokens:
+            for doc_id, score in self._term_scores(token).items():
+                scores[doc_id] = scores.get(doc_id, 0.0) + score
+        return {doc_id: score for doc_id, score in scores.items() if score > 0}
+
+    def scores(self, query: str) -> dict[int, float]:
+        """BM25 of the query keyed by document index (only positive scores)."""
+        clauses = parse_query(query)
+        if not clauses or not self.doc_lengths or self.avg_doc_length <= 0:
+            return {}
+        scores: dict[int, float] = {}
+        required: set[int] | None = None
+        for kind, tokens in clauses:
+            if kind == "prefix":
+                # A prefix counts once per document: its best-matching expansion.
+                best: dict[int, float] = {}
+                for term in self.prefix_terms(tokens[0]):
+                    for doc_id, score in self._term_scores(term).items():
+                        if score > best.get(doc_id, 0.0):
+                            best[doc_id] = score
+                for doc_id, score in best.items():
+                    scores[doc_id] = scores.get(doc_id, 0.0) + score
+                continue
+            if kind == "phrase" and self.positions:
+                docs = self.phrase_docs(tokens)
+                required = docs if required is None else required & docs
+            for token in tokens:
+                for doc_id, score in self._term_scores(token).items():
+                    scores[doc_id] = scores.get(doc_id, 0.0) + score
+        if required is not None:
+            scores = {doc_id: score for doc_id, score in scores.items() if doc_id in required}
+        return {doc_id: score for doc_id, score in scores.items() if score > 0}
+
+
+def query_needs_positions(query: str) -> bool:
+    return any(kind == "phrase" for kind, _tokens in parse_query(query))
@@ -0,0 +1,40 @@
+"""Change token for a git diff selection.
+
+Collected diff hunks are cached by the selected refs. The fingerprint tells
+the cache when those hunks may be stale: it changes when either side of the
+diff resolves to a new commit, and for HEAD vs the working tree also when
+the `git status` listing or the size/mtime of a listed path changes.
+"""
+import hashlib
+import subprocess
+from pathlib import Path
+
+
+def diff_state_fingerprint(directory: str, base_ref: str, head_ref: str) -> str:
+    """Cheap token that changes whenever the selected diff can change: the
+    resolved commit ids of the refs and, for HEAD vs working tree, the
+    `git status` listing plus size/mtime of every listed path."""
+    root = Path(directory).resolve()
+    # With only a base ref the diff is base...HEAD, so HEAD is always resolved too.
+    revs = [base_ref or "HEAD", head_ref or "HEAD"]
+    parts: list[str] = []
+    proc = subprocess.run(["git", "rev-parse", *revs], cwd=str(root), capture_output=True, text=True)
+    parts.append(proc.stdout)
+    if not base_ref and not head_ref:
+        status = subprocess.run(
+            ["git", "status", "--porcelain", "-z", "--untracked-files=all"],
+            cwd=str(root),
+            capture_output=True,
+            text=True,
+        )
+        parts.append(status.stdout)
+        for entry in status.stdout.split("\0"):
+            rel_path = entry[3:] if len(entry) > 3 else entry
+            if not rel_path:
+                continue
+            try:
+                stat = (root / rel_path).stat()
+            except OSError:
+                continue
+            parts.append(f"{rel_path}:{stat.st_mtime_ns}:{stat.st_size}")
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
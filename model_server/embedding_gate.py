@@ -0,0 +1,79 @@
+"""Priority access to the embedding model, one batch at a time.
+
+Bulk encodes (index builds, diff preparation, /embed) take the model for one
+batch per slot and release it between batches, so they are preemptible at
+batch boundaries. Interactive encodes (search queries) wait only for the
+batch currently on the model: while one is waiting, bulk batches do not
+start. The time each encode spends waiting for its slot is recorded per
+class as the queueing delay.
+"""
+import contextlib
+import threading
+import time
+from collections import deque
+from typing import Iterator
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+DELAY_WINDOW = 256
+
+
+class EmbeddingGate:
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._busy = False
+        self._interactive_waiting = 0
+        self._delays = {INTERACTIVE: deque(maxlen=DELAY_WINDOW), BULK: deque(maxlen=DELAY_WINDOW)}
+        self._counts = {INTERACTIVE: 0, BULK: 0}
+        self._preemptions = 0
+
+    @contextlib.contextmanager
+    def slot(self, priority: str = BULK) -> Iterator[float]:
+        """Hold the model for one batch; yields the seconds spent waiting."""
+        interactive = priority == INTERACTIVE
+        queued_at = time.monotonic()
+        with self._cond:
+            if interactive:
+                self._interactive_waiting += 1
+            yielded = False
+            try:
+                while self._busy or (not interactive and self._interactive_waiting):
+                    if not interactive and self._interactive_waiting and not yielded:
+                        # 待っているクエリを先に通すため、一括処理が次のバッチを譲った
+                        self._preemptions += 1
+                        yielded = True
+                    self._cond.wait()
+            finally:
+                if interactive:
+                    self._interactive_waiting -= 1
+            self._busy = True
+            delay = time.monotonic() - queued_at
+            kind = INTERACTIVE if interactive else BULK
+            self._delays[kind].append(delay)
+            self._counts[kind] += 1
+        try:
+            yield delay
+        finally:
+            with self._cond:
+                self._busy = False
+                self._cond.notify_all()
+
+    def stats(self) -> dict:
+        """Queueing delay per priority class over the last DELAY_WINDOW slots."""
+        with self._cond:
+            last = {kind: (values[-1] if values else None) for kind, values in self._delays.items()}
+            delays = {kind: sorted(values) for kind, values in self._delays.items()}
+            counts = dict(self._counts)
+            preemptions = self._preemptions
+            interactive_waiting = self._interactive_waiting
+            busy = self._busy
+        report = {"busy": busy, "interactive_waiting": interactive_waiting, "bulk_preemptions": preemptions}
+        for kind, values in delays.items():
+            report[kind] = {
+                "count": counts[kind],
+                "last": last[kind],
+                "mean": (sum(values) / len(values)) if values else None,
+                "p95": values[min(len(values) - 1, int(len(values) * 0.95))] if values else None,
+                "max": values[-1] if values else None,
+            }
+        return report
@@ -0,0 +1,53 @@
+"""Embedding reuse across incremental index builds.
+
+A function's embedding depends only on its code text, so rows are matched to
+the previous build by content rather than by file/name/line. Functions that
+merely moved (lines inserted above them, an edit elsewhere in the same file)
+keep their vectors, only bodies that actually changed reach the encoder, and
+identical bodies are encoded once.
+"""
+import numpy as np
+
+
+def plan_embedding_reuse(prev_codes: list[str], codes: list[str]) -> tuple[np.ndarray, np.ndarray, list[str]]:
+    """(prev_rows, new_rows, new_codes) for the functions in `codes`.
+
+    prev_rows[i] is the previous row with the same code, or -1. Otherwise
+    new_rows[i] is the position of the code in `new_codes`, the distinct
+    codes that need encoding, and -1 where the row is reused.
+    """
+    prev_row_by_code: dict[str, int] = {}
+    for row, code in enumerate(prev_codes):
+        prev_row_by_code.setdefault(code, row)
+    prev_rows = np.full(len(codes), -1, dtype=np.int64)
+    new_rows = np.full(len(codes), -1, dtype=np.int64)
+    new_slot_by_code: dict[str, int] = {}
+    for i, code in enumerate(codes):
+        row = prev_row_by_code.get(code)
+        if row is not None:
+            prev_rows[i] = row
+            continue
+        slot = new_slot_by_code.get(code)
+        if slot is None:
+            slot = new_slot_by_code[code] = len(new_slot_by_code)
+        new_rows[i] = slot
+    return prev_rows, new_rows, list(new_slot_by_code)
+
+
+def assemble_embeddings(
+    prev_embeddings: np.ndarray | None,
+    prev_rows: np.ndarray,
+    new_embeddings: np.ndarray | None,
+    new_rows: np.ndarray,
+) -> np.ndarray | None:
+    """Embedding matrix in the order of the planned functions."""
+    if len(prev_rows) == 0:
+        return None
+    reused = prev_rows >= 0
+    source = prev_embeddings if prev_embeddings is not None else new_embeddings
+    embeddings = np.empty((len(prev_rows), source.shape[1]), dtype=source.dtype)
+    if reused.any():
+        embeddings[reused] = prev_embeddings[prev_rows[reused]]
+    if not reused.all():
+        embeddings[~reused] = new_embeddings[new_rows[~reused]]
+    return embeddings
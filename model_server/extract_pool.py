@@ -0,0 +1,121 @@
+"""Function extraction across processes.
+
+The Python extractor is pure-Python `ast` work, so threads serialize on the
+GIL. Large batches are therefore extracted by a persistent pool of worker
+processes. Each worker imports `extractors` once, so tree-sitter parsers and
+compiled queries stay warm between files and between index builds. Files are
+sent in chunks so each round trip carries many results. Small batches stay in
+process, where the pool start-up would dominate.
+
+OWLSPOTLIGHT_EXTRACT_WORKERS overrides the worker count; 0 or 1 disables the
+process pool.
+"""
+import atexit
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterator
+
+from extractors import extract_functions
+from file_inventory import language_for_path
+
+POOL_MIN_FILES = 64
+THREAD_MIN_FILES = 16
+CHUNK_SIZE = 32
+
+_pool: ProcessPoolExecutor | None = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def extraction_worker_count() -> int:
+    configured = os.environ.get("OWLSPOTLIGHT_EXTRACT_WORKERS", "").strip()
+    if configured.isdigit():
+        return int(configured)
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        cpus = os.cpu_count() or 1
+    # Leave one core for the server's event loop and embedding work.
+    return max(1, min(32, cpus - 1))
+
+
+def extract_file(path: str) -> list[dict]:
+    try:
+        functions = extract_functions(path)
+    except Exception as e:
+        print(f"⚠️ {path}: {e}")
+        return []
+    language = language_for_path(path)
+    for func in functions:
+        func["file"] = path
+        func["language"] = language
+    return functions
+
+
+def _extract_chunk(paths: list[str]) -> list[list[dict]]:
+    return [extract_file(path) for path in paths]
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False, cancel_futures=True)
+            # spawn: the server process holds model threads, which fork would copy unsafely.
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _pool_workers = workers
+        return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+atexit.register(shutdown_pool)
+
+
+def _iter_in_process(paths: list[str], workers: int) -> Iterator[tuple[str, list[dict]]]:
+    if len(paths) < THREAD_MIN_FILES or workers <= 1:
+        for path in paths:
+            yield path, extract_file(path)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        yield from zip(paths, executor.map(extract_file, paths))
+
+
+def iter_extracted(paths: list[str], max_workers: int | None = None) -> Iterator[tuple[str, list[dict]]]:
+    """Yield (path, functions) in `paths` order. Closing the generator early
+    cancels chunks that have not started yet."""
+    workers = max_workers if max_workers is not None else extraction_worker_count()
+    if workers <= 1 or len(paths) < POOL_MIN_FILES:
+        yield from _iter_in_process(paths, max(1, min(workers, 8)))
+        return
+    chunks = [paths[start:start + CHUNK_SIZE] for start in range(0, len(paths), CHUNK_SIZE)]
+    pending: deque = deque()
+    next_chunk = 0
+    done = 0
+    try:
+        pool = _get_pool(workers)
+        while next_chunk < len(chunks) or pending:
+            while next_chunk < len(chunks) and len(pending) < workers * 2:
+                pending.append((chunks[next_chunk], pool.submit(_extract_chunk, chunks[next_chunk])))
+                next_chunk += 1
+            chunk, future = pending.popleft()
+            yield from zip(chunk, future.result())
+            done += len(chunk)
+    except BrokenProcessPool as e:
+        print(f"[extract_pool] Worker pool failed, extracting in process: {e}")
+        shutdown_pool()
+        yield from _iter_in_process(paths[done:], 8)
+    finally:
+        for _chunk, future in pending:
+            future.cancel()
@@ -0,0 +1,70 @@
+"""Innermost-enclosing-interval lookup for class ownership.
+
+Class byte ranges of one file are swept once into a flat list of boundary
+positions, each labelled with the innermost class open from there to the next
+boundary. Resolving the class that owns a function is then a single bisect,
+and nested classes resolve to the inner class rather than to whichever
+range happens to be scanned first.
+"""
+import bisect
+from typing import Generic, TypeVar
+
+T = TypeVar("T")
+
+
+class EnclosingIntervals(Generic[T]):
+    def __init__(self, intervals: list[tuple[int, int, T]]):
+        """`intervals` are half-open [start, end) byte ranges with a payload.
+        Ranges are expected to nest (as syntax-tree nodes do)."""
+        events: list[tuple[int, int, int, int]] = []
+        for index, (start, end, _payload) in enumerate(intervals):
+            if end <= start:
+                continue
+            # At equal positions ends (0) sort before starts (1); among starts the
+            # longer range opens first so the shorter one ends up innermost.
+            events.append((start, 1, -end, index))
+            events.append((end, 0, 0, index))
+        events.sort()
+        self._payloads = [payload for _start, _end, payload in intervals]
+        self._positions: list[int] = []
+        self._owners: list[int] = []
+        open_stack: list[int] = []
+        for position_index, (position, kind, _neg_end, index) in enumerate(events):
+            if kind == 1:
+                open_stack.append(index)
+            elif open_stack and open_stack[-1] == index:
+                open_stack.pop()
+            elif index in open_stack:
+                open_stack.remove(index)
+            if position_index + 1 == len(events) or events[position_index + 1][0] != position:
+                self._positions.append(position)
+                self._owners.append(open_stack[-1] if open_stack else -1)
+
+    def innermost(self, position: int) -> T | None:
+        """Payload of the innermost interval containing `position`, if any."""
+        slot = bisect.bisect_right(self._positions, position) - 1
+        if slot < 0 or self._owners[slot] < 0:
+            return None
+        return self._payloads[self._owners[slot]]
+
+
+def class_intervals(class_query, root_node, source_bytes: bytes) -> EnclosingIntervals[dict]:
+    """Class ranges captured as @class.name / @class.def by `class_query`.
+    Payloads are {"name", "start", "end"} with tree-sitter (row, column) points."""
+    intervals: list[tuple[int, int, dict]] = []
+    for _, capture_dict in class_query.matches(root_node):
+        class_name_nodes = capture_dict.get("class.name", [])
+        class_def_nodes = capture_dict.get("class.def", [])
+        if not class_name_nodes or not class_def_nodes:
+            continue
+        class_name_node = class_name_nodes[0]
+        class_def_node = class_def_nodes[0]
+        class_name = source_bytes[class_name_node.start_byte:class_name_node.end_byte].decode(
+            "utf-8", errors="replace"
+        )
+        intervals.append((
+            class_def_node.start_byte,
+            class_def_node.end_byte,
+            {"name": class_name, "start": class_def_node.start_point, "end": class_def_node.end_point},
+        ))
+    return EnclosingIntervals(intervals)
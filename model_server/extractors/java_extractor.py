@@ -1,46 +1,32 @@
 from tree_sitter import Language, Parser
 import tree_sitter_java
 
+from .intervals import class_intervals
+from .queries import compiled_query
+
 # --- Initialize once ---
 _JAVA_LANGUAGE = Language(tree_sitter_java.language())
 _JAVA_PARSER = Parser(_JAVA_LANGUAGE)
-
-
-def extract_java_functions(source_bytes: bytes) -> list[dict]:
-    tree = _JAVA_PARSER.parse(source_bytes)
-    root_node = tree.root_node
-
-    class_query = _JAVA_LANGUAGE.query(
-        """
+_JAVA_CLASS_QUERY = """
     (class_declaration
       name: (identifier) @class.name
       body: (class_body) @class.body) @class.def
     """
-    )
-    class_matches = class_query.matches(root_node)
-
-    class_ranges = {}
-    for _, capture_dict in class_matches:
-        class_name_nodes = capture_dict.get("class.name", [])
-        class_def_nodes = capture_dict.get("class.def", [])
-        if class_name_nodes and class_def_nodes:
-            class_name_node = class_name_nodes[0]
-            class_def_node = class_def_nodes[0]
-            class_name = source_bytes[class_name_node.start_byte:class_name_node.end_byte].decode(
-                "utf-8", errors="replace"
-            )
-            class_ranges[class_name] = {
-                "start": class_def_node.start_point,
-                "end": class_def_node.end_point,
-            }
-
-    func_query = _JAVA_LANGUAGE.query(
-        """
+_JAVA_FUNCTION_QUERY = """
     (method_declaration
       name: (identifier) @func.name
       body: (block) @func.body) @func.def
     """
-    )
+
+
+def extract_java_functions(source_bytes: bytes) -> list[dict]:
+    tree = _JAVA_PARSER.parse(source_bytes)
+    root_node = tree.root_node
+
+    class_query = compiled_query(_JAVA_LANGUAGE, "java", "class", _JAVA_CLASS_QUERY)
+    class_ranges = class_intervals(class_query, root_node, source_bytes)
+
+    func_query = compiled_query(_JAVA_LANGUAGE, "java", "function", _JAVA_FUNCTION_QUERY)
     func_matches = func_query.matches(root_node)
 
     results = []
@@ -58,12 +44,8 @@ def extract_java_functions(source_bytes: bytes) -> list[dict]:
             "utf-8", errors="replace"
         )
 
-        func_start = func_def_node.start_point
-        belonging_class = None
-        for class_name, class_range in class_ranges.items():
-            if class_range["start"][0] <= func_start[0] <= class_range["end"][0]:
-                belonging_class = class_name
-                break
+        belonging_range = class_ranges.innermost(func_def_node.start_byte)
+        belonging_class = belonging_range["name"] if belonging_range else None
 
         results.append(
             {
@@ -72,6 +54,8 @@ def extract_java_functions(source_bytes: bytes) -> list[dict]:
                 "lineno": func_def_node.start_point[0] + 1,
                 "end_lineno": func_def_node.end_point[0] + 1,
                 "class_name": belonging_class,
+                "class_lineno": belonging_range["start"][0] + 1 if belonging_range else None,
+                "class_end_lineno": belonging_range["end"][0] + 1 if belonging_range else None,
             }
         )
     return results
@@ -3,9 +3,22 @@ import ast
 from tree_sitter import Language, Parser
 import tree_sitter_python
 
+from .intervals import class_intervals
+from .queries import compiled_query
+
 
 _PY_LANGUAGE = Language(tree_sitter_python.language())
 _PY_PARSER = Parser(_PY_LANGUAGE)
+_PY_CLASS_QUERY = """
+    (class_definition
+      name: (identifier) @class.name
+      body: (block) @class.body) @class.def
+    """
+_PY_FUNCTION_QUERY = """
+    (function_definition
+      name: (identifier) @func.name
+      body: (block) @func.body) @func.def
+    """
 
 
 def _source_segment(source_lines: list[str], node: ast.AST) -> str:
@@ -23,6 +36,9 @@ def _annotation_name(node: ast.AST | None) -> str | None:
         return None
 
 
+_HTTP_METHODS = {"get", "post", "put", "patch", "delete", "options", "head", "api_route", "route"}
+
+
 def _decorator_names(node: ast.FunctionDef | ast.AsyncFunctionDef | ast.ClassDef) -> list[str]:
     names: list[str] = []
     for decorator in node.decorator_list:
@@ -32,30 +48,26 @@ def _decorator_names(node: ast.FunctionDef | ast.AsyncFunctionDef | ast.ClassDef
     return names
 
 
-def _route_info(decorators: list[str]) -> list[dict]:
+def _route_info(decorator_nodes: list[ast.expr]) -> list[dict]:
+    """FastAPI-style routes read straight from the decorator AST nodes."""
     routes: list[dict] = []
-    http_methods = {"get", "post", "put", "patch", "delete", "options", "head", "api_route", "route"}
-    for decorator in decorators:
-        try:
-            parsed = ast.parse(decorator, mode="eval").body
-        except SyntaxError:
+    for decorator in decorator_nodes:
+        if not isinstance(decorator, ast.Call):
             continue
-        if not isinstance(parsed, ast.Call):
-            continue
-        func = parsed.func
+        func = decorator.func
         method_name = func.attr if isinstance(func, ast.Attribute) else None
-        if not method_name or method_name not in http_methods:
+        if not method_name or method_name not in _HTTP_METHODS:
             continue
         route_path = None
-        if parsed.args and isinstance(parsed.args[0], ast.Constant) and isinstance(parsed.args[0].value, str):
-            route_path = parsed.args[0].value
+        if decorator.args and isinstance(decorator.args[0], ast.Constant) and isinstance(decorator.args[0].value, str):
+            route_path = decorator.args[0].value
         routes.append({"framework": "fastapi", "method": method_name.upper(), "path": route_path})
     return routes
 
 
-def _framework_tags(node: ast.FunctionDef | ast.AsyncFunctionDef, decorators: list[str]) -> list[str]:
+def _framework_tags(node: ast.FunctionDef | ast.AsyncFunctionDef, decorators: list[str], routes: list[dict]) -> list[str]:
     tags: set[str] = set()
-    if _route_info(decorators):
+    if routes:
         tags.add("fastapi_route")
     if node.name.startswith("test_") or any(name in decorators for name in ["pytest.fixture", "fixture"]):
         tags.add("pytest")
@@ -92,35 +104,49 @@ def _call_name(node: ast.AST) -> str | None:
     return None
 
 
-def _assigned_names(node: ast.AST) -> list[str]:
-    names: set[str] = set()
-    for child in ast.walk(node):
-        if isinstance(child, ast.Name) and isinstance(child.ctx, ast.Store):
-            names.add(child.id)
-        elif isinstance(child, ast.arg):
-            continue
-    return sorted(names)
+class _StaticInfo:
+    __slots__ = ("calls", "assigned_names", "imports")
 
+    def __init__(self):
+        self.calls: set[str] = set()
+        self.assigned_names: set[str] = set()
+        self.imports: set[str] = set()
 
-def _called_names(node: ast.AST) -> list[str]:
-    names: set[str] = set()
-    for child in ast.walk(node):
-        if isinstance(child, ast.Call):
-            name = _call_name(child.func)
-            if name:
-                names.add(name)
-    return sorted(names)
 
+def _collect_static(nodes: list[ast.AST]) -> _StaticInfo:
+    """Calls, assigned names and imports of the given subtrees in one pass.
 
-def _import_names(node: ast.AST) -> list[str]:
-    imports: list[str] = []
-    for child in ast.walk(node):
-        if isinstance(child, ast.Import):
-            imports.extend(alias.name for alias in child.names)
-        elif isinstance(child, ast.ImportFrom):
-            module = child.module or ""
-            imports.extend(f"{module}.{alias.name}" if module else alias.name for alias in child.names)
-    return sorted(set(imports))
+    An explicit stack is used instead of ast.NodeVisitor: its per-node method
+    lookup and generic_visit recursion cost more than the collection itself."""
+    info = _StaticInfo()
+    stack = list(nodes)
+    while stack:
+        node = stack.pop()
+        node_type = type(node)
+        if node_type is ast.Name:
+            if isinstance(node.ctx, ast.Store):
+                info.assigned_names.add(node.id)
+            continue
+        if node_type is ast.Constant:
+            continue
+        if node_type is ast.Call:
+            name = _call_name(node.func)
+            if name:
+                info.calls.add(name)
+        elif node_type is ast.Import:
+            info.imports.update(alias.name for alias in node.names)
+            continue
+        elif node_type is ast.ImportFrom:
+            module = node.module or ""
+            info.imports.update(f"{module}.{alias.name}" if module else alias.name for alias in node.names)
+            continue
+        for field in node._fields:
+            value = getattr(node, field, None)
+            if type(value) is list:
+                stack.extend(child for child in value if isinstance(child, ast.AST))
+            elif isinstance(value, ast.AST) and field != "ctx":
+                stack.append(value)
+    return info
 
 
 def _enrich_code_for_embedding(code: str, metadata: dict) -> str:
@@ -153,17 +179,18 @@ def _function_item(
 ) -> dict:
     raw_code = _source_segment(source_lines, node)
     decorators = _decorator_names(node)
-    routes = _route_info(decorators)
+    routes = _route_info(node.decorator_list)
+    collected = _collect_static([node])
     metadata = {
         "docstring": ast.get_docstring(node),
         "params": _argument_names(node),
         "returns": _annotation_name(node.returns),
         "decorators": decorators,
-        "calls": _called_names(node),
-        "assigned_names": _assigned_names(node),
+        "calls": sorted(collected.calls),
+        "assigned_names": sorted(collected.assigned_names),
         "is_async": isinstance(node, ast.AsyncFunctionDef),
         "routes": routes,
-        "framework_tags": _framework_tags(node, decorators),
+        "framework_tags": _framework_tags(node, decorators, routes),
     }
     item = {
         "name": node.name,
@@ -186,13 +213,13 @@ def _code_block_item(nodes: list[ast.stmt], source_lines: list[str], index: int)
     end_line = max(getattr(node, "end_lineno", getattr(node, "lineno", 1)) for node in nodes)
     raw_code = "".join(source_lines[start_line - 1:end_line]).strip("\n")
     block_types = [type(node).__name__ for node in nodes]
-    synthetic_module = ast.Module(body=nodes, type_ignores=[])
+    collected = _collect_static(nodes)
     metadata = {
         "block_type": "+".join(dict.fromkeys(block_types)),
         "block_types": block_types,
-        "imports": _import_names(synthetic_module),
-        "calls": _called_names(synthetic_module),
-        "assigned_names": _assigned_names(synthetic_module),
+        "imports": sorted(collected.imports),
+        "calls": sorted(collected.calls),
+        "assigned_names": sorted(collected.assigned_names),
         "statement_count": len(nodes),
     }
     call_suffix = f":calls={','.join(metadata['calls'][:3])}" if metadata["calls"] else ""
@@ -275,37 +302,10 @@ def _extract_python_functions_with_tree_sitter(source_bytes: bytes) -> list[dict
     tree = _PY_PARSER.parse(source_bytes)
     root_node = tree.root_node
 
-    class_query = _PY_LANGUAGE.query(
-        """
-    (class_definition
-      name: (identifier) @class.name
-      body: (block) @class.body) @class.def
-    """
-    )
-    class_matches = class_query.matches(root_node)
-
-    class_ranges = {}
-    for _, capture_dict in class_matches:
-        class_name_nodes = capture_dict.get("class.name", [])
-        class_def_nodes = capture_dict.get("class.def", [])
-        if class_name_nodes and class_def_nodes:
-            class_name_node = class_name_nodes[0]
-            class_def_node = class_def_nodes[0]
-            class_name = source_bytes[class_name_node.start_byte:class_name_node.end_byte].decode(
-                "utf-8", errors="replace"
-            )
-            class_ranges[class_name] = {
-                "start": class_def_node.start_point,
-                "end": class_def_node.end_point,
-            }
+    class_query = compiled_query(_PY_LANGUAGE, "python", "class", _PY_CLASS_QUERY)
+    class_ranges = class_intervals(class_query, root_node, source_bytes)
 
-    func_query = _PY_LANGUAGE.query(
-        """
-    (function_definition
-      name: (identifier) @func.name
-      body: (block) @func.body) @func.def
-    """
-    )
+    func_query = compiled_query(_PY_LANGUAGE, "python", "function", _PY_FUNCTION_QUERY)
     func_matches = func_query.matches(root_node)
 
     results = []
@@ -323,12 +323,8 @@ def _extract_python_functions_with_tree_sitter(source_bytes: bytes) -> list[dict
             "utf-8", errors="replace"
         )
 
-        func_start = func_def_node.start_point
-        belonging_class = None
-        for class_name, class_range in class_ranges.items():
-            if class_range["start"][0] <= func_start[0] <= class_range["end"][0]:
-                belonging_class = class_name
-                break
+        belonging_range = class_ranges.innermost(func_def_node.start_byte)
+        belonging_class = belonging_range["name"] if belonging_range else None
 
         results.append(
             {
@@ -339,6 +335,8 @@ def _extract_python_functions_with_tree_sitter(source_bytes: bytes) -> list[dict
                 "lineno": func_def_node.start_point[0] + 1,
                 "end_lineno": func_def_node.end_point[0] + 1,
                 "class_name": belonging_class,
+                "class_lineno": belonging_range["start"][0] + 1 if belonging_range else None,
+                "class_end_lineno": belonging_range["end"][0] + 1 if belonging_range else None,
                 "symbol_kind": "method" if belonging_class else "function",
                 "python_static": {"fallback": "tree_sitter"},
             }
@@ -362,7 +360,10 @@ def extract_python_functions(source_bytes: bytes) -> list[dict]:
             if isinstance(node, ast.ClassDef):
                 for child in node.body:
                     if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
-                        results.append(_function_item(child, source_lines, node.name))
+                        item = _function_item(child, source_lines, node.name)
+                        item["class_lineno"] = node.lineno
+                        item["class_end_lineno"] = getattr(node, "end_lineno", node.lineno)
+                        results.append(item)
                 continue
             if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
                 results.append(_function_item(node, source_lines, class_name))
@@ -371,8 +372,6 @@ def extract_python_functions(source_bytes: bytes) -> list[dict]:
 
     results.extend(_extract_module_code_blocks(tree, source_lines))
     function_names = {item["name"] for item in results if item.get("symbol_kind") in {"function", "method"}}
-    import_dependency: dict[str, list[str]] = {}
-    call_graph: dict[str, list[str]] = {}
     for item in results:
         static = item.get("python_static", {})
         local_calls = sorted({call for call in static.get("calls", []) if call.split(".")[-1] in function_names})
@@ -386,15 +385,7 @@ def extract_python_functions(source_bytes: bytes) -> list[dict]:
         static["local_calls"] = local_calls
         static["external_import_calls"] = external_import_calls
         item["python_static"] = static
-        if item.get("symbol_kind") in {"function", "method"}:
-            call_graph[item["name"]] = local_calls
-        if static.get("imports"):
-            import_dependency[item["name"]] = static["imports"]
-
-    for item in results:
-        static = item.get("python_static", {})
-        static["call_graph"] = call_graph
-        static["import_dependency"] = import_dependency
-        item["python_static"] = static
+    # File-wide call_graph / import_dependency are derived from local_calls and
+    # imports by graph_store.file_graph instead of being copied into every item.
 
     return sorted(results, key=lambda item: (item["lineno"], item.get("symbol_kind") == "code_block"))
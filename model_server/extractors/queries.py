@@ -0,0 +1,24 @@
+"""Compiled tree-sitter queries, built once per language.
+
+`Language.query()` compiles the S-expression source every time it is called,
+which used to happen for every extracted file. Queries are cached here by
+(language, query name). A compiled `Query` keeps its own match cursor and
+`matches()` releases the GIL, so the cache is per thread: every extraction
+thread (and every process of the extraction pool) compiles each query once
+and reuses it for all later files.
+"""
+import threading
+
+_local = threading.local()
+
+
+def compiled_query(language, language_name: str, query_name: str, source: str):
+    cache = getattr(_local, "queries", None)
+    if cache is None:
+        cache = _local.queries = {}
+    key = (language_name, query_name)
+    query = cache.get(key)
+    if query is None:
+        query = language.query(source)
+        cache[key] = query
+    return query
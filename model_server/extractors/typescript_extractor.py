@@ -1,6 +1,10 @@
 from tree_sitter_language_pack import get_parser
+import bisect
 import re
 
+from .intervals import EnclosingIntervals, class_intervals
+from .queries import compiled_query
+
 _PARSER_LANGUAGE_BY_KIND = {
     "typescript": "typescript",
     "tsx": "tsx",
@@ -10,6 +14,30 @@ _PARSER_LANGUAGE_BY_KIND = {
 
 _PARSER_CACHE = {}
 
+_CLASS_QUERY = """
+            (class_declaration
+              name: (_) @class.name
+              body: (class_body) @class.body) @class.def
+            """
+
+# Minimal, grammar-stable patterns
+_FUNCTION_QUERY = """
+    ; standalone function declarations
+    (function_declaration
+      name: (identifier) @func.name
+      body: (statement_block) @func.body) @func.def
+
+    ; class methods
+    (method_definition
+      name: (property_identifier) @func.name
+      body: (statement_block) @func.body) @func.def
+
+    ; private methods (#name)
+    (method_definition
+      name: (private_property_identifier) @func.name
+      body: (statement_block) @func.body) @func.def
+    """
+
 
 def _get_parser_and_language(language_kind: str):
     parser_language = _PARSER_LANGUAGE_BY_KIND.get(language_kind, "typescript")
@@ -19,37 +47,45 @@ def _get_parser_and_language(language_kind: str):
     return _PARSER_CACHE[parser_language]
 
 
-def _build_class_ranges(root_node, source_bytes, language):
-    class_ranges = {}
+def _build_class_ranges(root_node, source_bytes, language, language_name: str) -> EnclosingIntervals[dict]:
     try:
-        class_query = language.query(
-            """
-            (class_declaration
-              name: (_) @class.name
-              body: (class_body) @class.body) @class.def
-            """
-        )
-        class_matches = class_query.matches(root_node)
-        for _, capture_dict in class_matches:
-            class_name_nodes = capture_dict.get("class.name", [])
-            class_def_nodes = capture_dict.get("class.def", [])
-            if class_name_nodes and class_def_nodes:
-                class_name_node = class_name_nodes[0]
-                class_def_node = class_def_nodes[0]
-                class_name = source_bytes[class_name_node.start_byte:class_name_node.end_byte].decode(
-                    "utf-8", errors="replace"
-                )
-                class_ranges[(class_name, class_def_node.start_byte, class_def_node.end_byte)] = {
-                    "name": class_name,
-                    "start": class_def_node.start_point,
-                    "end": class_def_node.end_point,
-                }
+        class_query = compiled_query(language, language_name, "class", _CLASS_QUERY)
+        return class_intervals(class_query, root_node, source_bytes)
     except Exception as e:
         print(f"[TS extractor] class query error: {e}")
-    return class_ranges
+        return EnclosingIntervals([])
+
+
+_JSDOC_PATTERN = re.compile(rb"/\*\*([\s\S]*?)\*/", re.MULTILINE)
+# What may sit between a JSDoc and the node it documents: whitespace,
+# declaration modifiers and decorators (one level of nested parentheses).
+_JSDOC_GAP_PATTERN = re.compile(
+    rb"(?:\s"
+    rb"|(?:export|default|declare|abstract|public|private|protected|static|async|override|readonly)\b"
+    rb"|@[\w.$]+(?:\((?:[^()]|\([^()]*\))*\))?)*"
+)
+
 
+def _jsdoc_index(source_bytes: bytes) -> tuple[list[int], list[bytes]]:
+    """End offsets (ascending) and texts of all /** */ comments."""
+    ends: list[int] = []
+    texts: list[bytes] = []
+    for match in _JSDOC_PATTERN.finditer(source_bytes):
+        ends.append(match.end())
+        texts.append(match.group(0))
+    return ends, texts
 
-_JSDOC_PATTERN = re.compile(r"/\*\*([\s\S]*?)\*/", re.MULTILINE)
+
+def _attached_jsdoc(source_bytes: bytes, jsdoc_ends: list[int], jsdoc_texts: list[bytes], start_byte: int) -> str | None:
+    """The JSDoc directly preceding `start_byte`, if any."""
+    position = bisect.bisect_right(jsdoc_ends, start_byte) - 1
+    if position < 0:
+        return None
+    if not _JSDOC_GAP_PATTERN.fullmatch(source_bytes, jsdoc_ends[position], start_byte):
+        return None
+    text = jsdoc_texts[position].decode("utf-8", errors="replace")
+    # remove /** and */ and leading *
+    return re.sub(r"^\s*\* ?", "", text[3:-2], flags=re.MULTILINE).strip() or None
 
 
 def extract_typescript_functions(source_bytes: bytes, language_kind: str = "typescript") -> list[dict]:
@@ -61,39 +97,21 @@ def extract_typescript_functions(source_bytes: bytes, language_kind: str = "type
     and skip variable-assigned/arrow functions.
     """
     parser, language = _get_parser_and_language(language_kind)
+    language_name = _PARSER_LANGUAGE_BY_KIND.get(language_kind, "typescript")
     tree = parser.parse(source_bytes)
     root_node = tree.root_node
 
-    class_ranges = _build_class_ranges(root_node, source_bytes, language)
-
-    # Minimal, grammar-stable patterns
-    query_src = """
-    ; standalone function declarations
-    (function_declaration
-      name: (identifier) @func.name
-      body: (statement_block) @func.body) @func.def
-
-    ; class methods
-    (method_definition
-      name: (property_identifier) @func.name
-      body: (statement_block) @func.body) @func.def
-
-    ; private methods (#name)
-    (method_definition
-      name: (private_property_identifier) @func.name
-      body: (statement_block) @func.body) @func.def
-    """
+    class_ranges = _build_class_ranges(root_node, source_bytes, language, language_name)
 
     try:
-        func_query = language.query(query_src)
+        func_query = compiled_query(language, language_name, "function", _FUNCTION_QUERY)
         func_matches = func_query.matches(root_node)
     except Exception as e:
         print(f"[TS extractor] function query error: {e}")
         return []
 
-    # Prepare JSDoc list over the original text
-    source_text = source_bytes.decode("utf-8", errors="replace")
-    jsdocs = [(m.start(), m.end(), m.group(0)) for m in _JSDOC_PATTERN.finditer(source_text)]
+    # JSDoc end offsets in bytes, matching tree-sitter node offsets
+    jsdoc_ends, jsdoc_texts = _jsdoc_index(source_bytes)
 
     results = []
     for _, capture_dict in func_matches:
@@ -115,24 +133,11 @@ def extract_typescript_functions(source_bytes: bytes, language_kind: str = "type
             "utf-8", errors="replace"
         )
 
-        # Attach JSDoc if the closest preceding one exists
-        docstring_content = None
-        func_start_byte = func_def_node.start_byte
-        closest_jsdoc = None
-        for jsdoc_start, jsdoc_end, jsdoc_text in reversed(jsdocs):
-            if jsdoc_end <= func_start_byte:
-                closest_jsdoc = jsdoc_text
-                break
-        if closest_jsdoc:
-            # remove /** and */ and leading *
-            docstring_content = re.sub(r"^\s*\* ?", "", closest_jsdoc[3:-2], flags=re.MULTILINE).strip()
-
-        func_start = func_def_node.start_point
-        belonging_class = None
-        for class_range in class_ranges.values():
-            if class_range["start"][0] <= func_start[0] <= class_range["end"][0]:
-                belonging_class = class_range["name"]
-                break
+        # Attach a JSDoc only when it sits directly before the declaration
+        docstring_content = _attached_jsdoc(source_bytes, jsdoc_ends, jsdoc_texts, func_def_node.start_byte)
+
+        belonging_range = class_ranges.innermost(func_def_node.start_byte)
+        belonging_class = belonging_range["name"] if belonging_range else None
 
         item = {
             "name": func_name,
@@ -141,6 +146,8 @@ def extract_typescript_functions(source_bytes: bytes, language_kind: str = "type
             "lineno": func_def_node.start_point[0] + 1,
             "end_lineno": func_def_node.end_point[0] + 1,
             "class_name": belonging_class,
+            "class_lineno": belonging_range["start"][0] + 1 if belonging_range else None,
+            "class_end_lineno": belonging_range["end"][0] + 1 if belonging_range else None,
         }
         if docstring_content:
             item["docstring"] = docstring_content
@@ -0,0 +1,177 @@
+"""Cached per-repository file inventory for search scoping.
+
+Resolving a search scope needs the repository's visible source files (git
+ls-files plus the ignore files) and its working-tree changes. Both cost a
+subprocess and a pass over every path, so they are kept per repository root
+together with an extension histogram. The visible file list is refreshed when
+git's index or HEAD or an ignore file changes, and otherwise after `ttl`
+seconds so new untracked files show up; the changed-file list, which follows
+unsaved edits rather than git metadata, uses its own shorter `changed_ttl`.
+"""
+import os
+import threading
+import time
+from pathlib import PurePath
+from typing import Callable
+
+SUPPORTED_FILE_EXTENSIONS = (".py", ".java", ".ts", ".tsx", ".js", ".jsx")
+SOURCE_DIR_NAMES = {
+    "src",
+    "app",
+    "lib",
+    "packages",
+    "components",
+    "server",
+    "client",
+    "backend",
+    "frontend",
+}
+SCOPES = ("all", "source", "changed")
+# file_ext of the unified index that holds every supported extension.
+UNIFIED_FILE_EXT = "all"
+LANGUAGE_BY_EXTENSION = {
+    ".py": "python",
+    ".java": "java",
+    ".ts": "typescript",
+    ".tsx": "typescript",
+    ".js": "javascript",
+    ".jsx": "javascript",
+}
+_FINGERPRINT_FILES = (os.path.join(".git", "index"), os.path.join(".git", "HEAD"), ".gitignore", ".owlignore")
+
+
+def file_extension(path: str) -> str:
+    return os.path.splitext(path)[1].lower()
+
+
+def index_extensions(file_ext: str) -> tuple[str, ...]:
+    """Extensions covered by the index for `file_ext`."""
+    return SUPPORTED_FILE_EXTENSIONS if file_ext == UNIFIED_FILE_EXT else (file_ext,)
+
+
+def language_for_path(path: str) -> str | None:
+    return LANGUAGE_BY_EXTENSION.get(file_extension(path))
+
+
+def normalize_languages(values: list[str] | None) -> set[str]:
+    """Language names from names or extensions ("python", ".py", "tsx")."""
+    languages = set()
+    for value in values or []:
+        clean = str(value).strip().lower()
+        if not clean:
+            continue
+        if clean in LANGUAGE_BY_EXTENSION.values():
+            languages.add(clean)
+        elif ("." + clean.lstrip(".")) in LANGUAGE_BY_EXTENSION:
+            languages.add(LANGUAGE_BY_EXTENSION["." + clean.lstrip(".")])
+    return languages
+
+
+class FileInventory:
+    """Supported source files of one repository root, in listing order."""
+
+    def __init__(self, root: str, files: list[str], changed: list[str] | None = None):
+        self.root = root
+        self.files = [path for path in files if file_extension(path) in SUPPORTED_FILE_EXTENSIONS]
+        self.rel_paths = {path: PurePath(os.path.relpath(path, root)).as_posix() for path in self.files}
+        self._histograms: dict[str, dict[str, int]] = {}
+        self.changed: list[str] = []
+        self.set_changed(changed or [])
+        self._source = [
+            path
+            for path in self.files
+            if any(part.lower() in SOURCE_DIR_NAMES for part in self.rel_paths[path].split("/"))
+        ]
+
+    def set_changed(self, changed: list[str]) -> None:
+        self.changed = [path for path in changed if file_extension(path) in SUPPORTED_FILE_EXTENSIONS]
+        self._histograms.pop("changed", None)
+
+    def rel_path(self, path: str) -> str:
+        rel_path = self.rel_paths.get(path)
+        if rel_path is None:
+            rel_path = PurePath(os.path.relpath(path, self.root)).as_posix()
+        return rel_path
+
+    def scope_files(self, scope: str = "all", file_ext: str | None = None) -> list[str]:
+        if scope == "changed":
+            files = self.changed
+        elif scope == "source":
+            files = self._source
+        else:
+            files = self.files
+        if file_ext is None or file_ext == UNIFIED_FILE_EXT:
+            return list(files)
+        return [path for path in files if file_extension(path) == file_ext]
+
+    def histogram(self, scope: str = "all") -> dict[str, int]:
+        """File count per supported extension (zero counts included)."""
+        counts = self._histograms.get(scope)
+        if counts is None:
+            counts = {ext: 0 for ext in SUPPORTED_FILE_EXTENSIONS}
+            for path in self.scope_files(scope):
+                counts[file_extension(path)] += 1
+            self._histograms[scope] = counts
+        return dict(counts)
+
+    def auto_file_ext(self, scope: str = "all") -> tuple[str | None, dict[str, int]]:
+        """The most common extension in `scope` (ties go to the earlier
+        supported extension) and the histogram it was picked from."""
+        counts = self.histogram(scope)
+        detected = [(ext, count) for ext, count in counts.items() if count > 0]
+        if not detected:
+            return None, counts
+        detected.sort(key=lambda item: (-item[1], SUPPORTED_FILE_EXTENSIONS.index(item[0])))
+        return detected[0][0], counts
+
+
+class InventoryCache:
+    def __init__(
+        self,
+        list_files: Callable[[str], list[str]],
+        list_changed: Callable[[str], list[str]],
+        ttl: float = 10.0,
+        changed_ttl: float = 2.0,
+    ):
+        self.list_files = list_files
+        self.list_changed = list_changed
+        self.ttl = ttl
+        self.changed_ttl = changed_ttl
+        # root -> (inventory, fingerprint, listed at, changed listed at)
+        self._entries: dict[str, tuple[FileInventory, tuple, float, float]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(root: str) -> tuple:
+        stamps = []
+        for name in _FINGERPRINT_FILES:
+            try:
+                stat = os.stat(os.path.join(root, name))
+                stamps.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                stamps.append(None)
+        return tuple(stamps)
+
+    def get(self, root: str, need_changed: bool = False) -> FileInventory:
+        """Inventory of `root`; the changed-file list is refreshed only when
+        `need_changed` is set."""
+        with self._lock:
+            now = time.monotonic()
+            fingerprint = self.fingerprint(root)
+            entry = self._entries.get(root)
+            if entry is None or entry[1] != fingerprint or now - entry[2] > self.ttl:
+                inventory = FileInventory(root, self.list_files(root))
+                entry = (inventory, fingerprint, now, float("-inf"))
+            inventory, fingerprint, listed_at, changed_at = entry
+            if need_changed and now - changed_at > self.changed_ttl:
+                inventory.set_changed(self.list_changed(root))
+                changed_at = now
+            self._entries[root] = (inventory, fingerprint, listed_at, changed_at)
+            return inventory
+
+    def invalidate(self, root: str | None = None) -> None:
+        with self._lock:
+            if root is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(root, None)
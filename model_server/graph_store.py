@@ -0,0 +1,120 @@
+"""Per-file call graphs and import dependencies.
+
+Extractors record each item's `local_calls` and `imports` in its static
+metadata; the file-wide graph is derived from those once per file and kept
+here, keyed by file path, instead of being copied into every item. A
+repo-wide callee → callers index is built lazily on top of the per-file
+graphs and dropped whenever a file changes.
+"""
+import json
+import os
+
+# Keys older extractor versions copied into every item's python_static.
+LEGACY_FILE_GRAPH_KEYS = ("call_graph", "import_dependency")
+
+
+def file_graph(functions: list[dict]) -> dict:
+    """{"call_graph": {name: local calls}, "import_dependency": {name: imports}}
+    of one file's extracted items."""
+    call_graph: dict[str, list[str]] = {}
+    import_dependency: dict[str, list[str]] = {}
+    for func in functions:
+        static = func.get("python_static") or {}
+        if func.get("symbol_kind") in {"function", "method"} and "local_calls" in static:
+            call_graph[func["name"]] = static["local_calls"]
+        if static.get("imports"):
+            import_dependency[func["name"]] = static["imports"]
+    return {"call_graph": call_graph, "import_dependency": import_dependency}
+
+
+def strip_legacy_file_graphs(functions: list[dict]) -> int:
+    """Remove file-wide graphs that older indexes stored in every item;
+    returns the number of items changed."""
+    stripped = 0
+    for func in functions:
+        static = func.get("python_static")
+        if isinstance(static, dict) and any(key in static for key in LEGACY_FILE_GRAPH_KEYS):
+            for key in LEGACY_FILE_GRAPH_KEYS:
+                static.pop(key, None)
+            stripped += 1
+    return stripped
+
+
+class GraphStore:
+    def __init__(self):
+        self.files: dict[str, dict] = {}
+        self._callers: dict[str, list[tuple[str, str]]] | None = None
+
+    @classmethod
+    def from_functions(cls, functions: list[dict]) -> "GraphStore":
+        by_file: dict[str, list[dict]] = {}
+        for func in functions:
+            by_file.setdefault(func.get("file") or func.get("file_path", ""), []).append(func)
+        store = cls()
+        store.update_files(by_file)
+        return store
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def update_files(self, changed: dict[str, list[dict]], removed: list[str] | None = None) -> None:
+        for path in removed or []:
+            self.files.pop(path, None)
+        for path, functions in changed.items():
+            graph = file_graph(functions)
+            if graph["call_graph"] or graph["import_dependency"]:
+                self.files[path] = graph
+            else:
+                self.files.pop(path, None)
+        self._callers = None
+
+    def graph_for(self, path: str) -> dict:
+        return self.files.get(path) or {"call_graph": {}, "import_dependency": {}}
+
+    def callers_index(self) -> dict[str, list[tuple[str, str]]]:
+        """Repo-wide map from a callee's short name to (file, caller) pairs."""
+        if self._callers is None:
+            callers: dict[str, list[tuple[str, str]]] = {}
+            for path in sorted(self.files):
+                for caller, callees in self.files[path]["call_graph"].items():
+                    for callee in callees:
+                        callers.setdefault(callee.split(".")[-1], []).append((path, caller))
+            self._callers = callers
+        return self._callers
+
+    def callers(self, name: str) -> list[tuple[str, str]]:
+        return list(self.callers_index().get(name.split(".")[-1], []))
+
+    def callees(self, name: str, path: str | None = None) -> list[tuple[str, list[str]]]:
+        """(file, local calls) of every function named `name`, optionally in one file."""
+        paths = [path] if path is not None else sorted(self.files)
+        return [
+            (file_path, self.files[file_path]["call_graph"][name])
+            for file_path in paths
+            if file_path in self.files and name in self.files[file_path]["call_graph"]
+        ]
+
+    def save(self, path: str) -> None:
+        tmp = path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.files, f, ensure_ascii=False)
+            os.replace(tmp, path)
+        except Exception as e:
+            print(f"[graph_store] Failed to save {path}: {e}")
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    @classmethod
+    def load(cls, path: str) -> "GraphStore | None":
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                files = json.load(f)
+        except Exception as e:
+            print(f"[graph_store] Failed to load {path}: {e}")
+            return None
+        store = cls()
+        store.files = files
+        return store
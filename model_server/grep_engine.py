@@ -0,0 +1,163 @@
+"""Parallel grep over memory-mapped files.
+
+Files are split into shards that a thread pool scans concurrently. Each file
+is `mmap`ed and searched as bytes for the literal fragments every match must
+contain (see `grep_index.literal_requirements`); only the lines around those
+hits are decoded and checked with the real pattern. Results are yielded in
+file order as soon as the leading shards finish, and the remaining work is
+cancelled once `max_matches` is reached.
+"""
+import mmap
+import os
+import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from grep_index import literal_requirements
+
+MAX_LINE_CHARS = 500
+SHARD_SIZE = 64
+# Line separators that str.splitlines() honours besides "\n" / "\r\n"; files
+# containing any of them take the decode-everything path so line numbers match.
+_EXOTIC_LINE_BREAKS = re.compile(rb"\r(?!\n)|[\x0b\x0c\x1c-\x1e]|\xc2\x85|\xe2\x80[\xa8\xa9]")
+
+
+def default_worker_count() -> int:
+    return max(1, min(8, os.cpu_count() or 1))
+
+
+def compile_prefilter(pattern: str, regex: bool, case_sensitive: bool) -> re.Pattern | None:
+    """Bytes pattern matching the longest required fragment of every
+    alternative, or None when the pattern has no usable literal. It is always
+    ASCII case-insensitive, which keeps it a superset of the real pattern."""
+    try:
+        plan = literal_requirements(pattern, regex, case_sensitive)
+    except re.error:
+        return None
+    fragments = []
+    for alternative in plan:
+        if not alternative:
+            return None
+        fragments.append(max(alternative, key=len).encode("utf-8"))
+    if not fragments:
+        return None
+    return re.compile(b"|".join(re.escape(fragment) for fragment in sorted(set(fragments))), re.IGNORECASE)
+
+
+def _decode(raw: bytes) -> str:
+    try:
+        return raw.decode("utf-8")
+    except UnicodeDecodeError:
+        return raw.decode("utf-8", errors="replace")
+
+
+def _scan_text(data, compiled: re.Pattern, limit: int) -> list[tuple[int, str]]:
+    hits = []
+    for line_number, line in enumerate(_decode(bytes(data)).splitlines(), start=1):
+        if compiled.search(line):
+            hits.append((line_number, line[:MAX_LINE_CHARS]))
+            if len(hits) >= limit:
+                break
+    return hits
+
+
+def _scan_candidates(data, compiled: re.Pattern, prefilter: re.Pattern, limit: int) -> list[tuple[int, str]]:
+    hits = []
+    newlines = None
+    last_line_end = -1
+    size = len(data)
+    for found in prefilter.finditer(data):
+        offset = found.start()
+        if offset <= last_line_end:
+            continue
+        if newlines is None:
+            newlines = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == 10)
+        line_index = int(np.searchsorted(newlines, offset))
+        line_start = int(newlines[line_index - 1]) + 1 if line_index else 0
+        line_end = int(newlines[line_index]) if line_index < newlines.size else size
+        last_line_end = line_end
+        line = _decode(data[line_start:line_end])
+        if line.endswith("\r"):
+            line = line[:-1]
+        if compiled.search(line):
+            hits.append((line_index + 1, line[:MAX_LINE_CHARS]))
+            if len(hits) >= limit:
+                break
+    return hits
+
+
+def grep_file(path: str, compiled: re.Pattern, prefilter: re.Pattern | None, limit: int) -> list[tuple[int, str]]:
+    """(line number, line text) of the lines of `path` matching `compiled`."""
+    try:
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return []
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                if data.find(b"\0", 0, 4096) != -1:
+                    return []
+                if prefilter is None or _EXOTIC_LINE_BREAKS.search(data):
+                    return _scan_text(data, compiled, limit)
+                if prefilter.search(data) is None:
+                    return []
+                return _scan_candidates(data, compiled, prefilter, limit)
+    except (OSError, ValueError):
+        return []
+
+
+def iter_grep_matches(
+    root: str,
+    files: list[str],
+    compiled: re.Pattern,
+    prefilter: re.Pattern | None,
+    max_matches: int,
+    max_workers: int | None = None,
+    cancel_event: threading.Event | None = None,
+):
+    """Yield match dicts in `files` order, stopping after `max_matches`.
+    Closing the generator (or setting `cancel_event`) cancels pending shards."""
+    if max_matches <= 0 or not files:
+        return
+    stop = cancel_event or threading.Event()
+    workers = max_workers or default_worker_count()
+    shards = [files[start:start + SHARD_SIZE] for start in range(0, len(files), SHARD_SIZE)]
+
+    def scan_shard(shard: list[str]) -> list[dict]:
+        found = []
+        for file_path in shard:
+            if stop.is_set() or len(found) >= max_matches:
+                break
+            hits = grep_file(file_path, compiled, prefilter, max_matches - len(found))
+            if not hits:
+                continue
+            rel_path = os.path.relpath(file_path, root)
+            found.extend(
+                {"file": file_path, "path": rel_path, "line": line_number, "text": text}
+                for line_number, text in hits
+            )
+        return found
+
+    emitted = 0
+    executor = ThreadPoolExecutor(max_workers=workers)
+    pending: deque = deque()
+    next_shard = 0
+    try:
+        while next_shard < len(shards) or pending:
+            # Keep a bounded window in flight so an early hit stops further reads.
+            while next_shard < len(shards) and len(pending) < workers * 2:
+                pending.append(executor.submit(scan_shard, shards[next_shard]))
+                next_shard += 1
+            for match in pending.popleft().result():
+                yield match
+                emitted += 1
+                if emitted >= max_matches:
+                    return
+            if stop.is_set():
+                return
+    finally:
+        stop.set()
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
@@ -0,0 +1,308 @@
+"""Trigram index used to narrow the files `grep_repo` has to scan.
+
+Every indexed file contributes the set of byte trigrams of its (ASCII
+lower-cased) content. A query is planned into the literal fragments any match
+must contain; only files holding all trigrams of those fragments are scanned.
+Patterns without a usable literal (e.g. ``\\w+``) cannot be narrowed and fall
+back to a full scan.
+
+The postings are kept in a compact CSR layout built by `compact()`; files that
+change afterwards go to a small overlay until the next compaction, so keeping
+the index fresh on every call only costs a `stat` per file.
+"""
+import os
+import re
+import threading
+
+import numpy as np
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+FLAG_TEXT = 0
+FLAG_BINARY = 1
+FLAG_UNINDEXED = 2
+FLAG_REMOVED = 3
+
+MAX_INDEXED_BYTES = 8 * 1024 * 1024
+MAX_QUERY_ALTERNATIVES = 16
+_REPEAT_OPS = {sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT}
+if hasattr(sre_parse, "POSSESSIVE_REPEAT"):
+    _REPEAT_OPS.add(sre_parse.POSSESSIVE_REPEAT)
+_EMPTY_CODES = np.zeros(0, dtype=np.uint32)
+
+
+def trigram_codes(data: bytes) -> np.ndarray:
+    """Sorted unique trigram codes of `data` with ASCII letters lower-cased."""
+    if len(data) < 3:
+        return _EMPTY_CODES
+    raw = np.frombuffer(data, dtype=np.uint8)
+    upper = (raw >= 65) & (raw <= 90)
+    if upper.any():
+        raw = raw.copy()
+        raw[upper] += 32
+    codes = (raw[:-2].astype(np.uint32) << 16) | (raw[1:-1].astype(np.uint32) << 8) | raw[2:]
+    return np.unique(codes)
+
+
+def _usable_runs(text: str, ignorecase: bool) -> list[str]:
+    # re.IGNORECASE also matches i/k/s against non-ASCII characters (ı, İ, K
+    # Kelvin sign, ſ), so case-insensitive fragments are split there and at any
+    # non-ASCII character. U+FFFD may stand for any undecodable byte in the scanned text.
+    runs = re.split(r"[iksIKS]|[^\x00-\x7f]" if ignorecase else "\ufffd", text)
+    return [run for run in runs if run]
+
+
+def _sequence_requirements(items, ignorecase: bool) -> list[list[str]]:
+    """Alternatives (OR) of literal fragments (AND) required by a parsed regex
+    sequence. `[[]]` means the sequence requires nothing."""
+    alternatives: list[list[str]] = [[]]
+    run: list[str] = []
+
+    def flush():
+        if run:
+            literal = "".join(run)
+            for alternative in alternatives:
+                alternative.extend(_usable_runs(literal, ignorecase))
+            run.clear()
+
+    for op, av in items:
+        if op is sre_parse.LITERAL:
+            run.append(chr(av))
+            continue
+        flush()
+        sub = None
+        if op is sre_parse.SUBPATTERN:
+            _group, add_flags, _del_flags, pattern = av
+            sub = _sequence_requirements(pattern, ignorecase or bool(add_flags & re.IGNORECASE))
+        elif op in _REPEAT_OPS:
+            min_count, _max_count, pattern = av
+            if min_count >= 1:
+                sub = _sequence_requirements(pattern, ignorecase)
+        elif op is sre_parse.BRANCH:
+            sub = []
+            for branch in av[1]:
+                sub.extend(_sequence_requirements(branch, ignorecase))
+        elif getattr(sre_parse, "ATOMIC_GROUP", None) is op:
+            sub = _sequence_requirements(av, ignorecase)
+        if sub and sub != [[]] and len(alternatives) * len(sub) <= MAX_QUERY_ALTERNATIVES:
+            alternatives = [current + extra for current in alternatives for extra in sub]
+    flush()
+    return alternatives
+
+
+def literal_requirements(pattern: str, regex: bool, case_sensitive: bool) -> list[list[str]]:
+    """Plan a grep pattern into alternatives of required literal fragments."""
+    if not regex:
+        return [_usable_runs(pattern, not case_sensitive)]
+    parsed = sre_parse.parse(pattern, 0 if case_sensitive else re.IGNORECASE)
+    ignorecase = bool(parsed.state.flags & re.IGNORECASE)
+    return _sequence_requirements(list(parsed), ignorecase)
+
+
+def query_trigrams(pattern: str, regex: bool, case_sensitive: bool) -> list[np.ndarray] | None:
+    """Trigram codes per alternative, or None when the pattern cannot be narrowed."""
+    plan = []
+    for fragments in literal_requirements(pattern, regex, case_sensitive):
+        codes = [trigram_codes(fragment.encode("utf-8")) for fragment in fragments]
+        codes = [code for code in codes if code.size]
+        if not codes:
+            return None
+        plan.append(np.unique(np.concatenate(codes)))
+    return plan or None
+
+
+def read_file_trigrams(path: str) -> tuple[np.ndarray, int]:
+    try:
+        size = os.path.getsize(path)
+        if size > MAX_INDEXED_BYTES:
+            return _EMPTY_CODES, FLAG_UNINDEXED
+        with open(path, "rb") as f:
+            raw = f.read()
+    except OSError:
+        return _EMPTY_CODES, FLAG_UNINDEXED
+    if b"\0" in raw[:4096]:
+        return _EMPTY_CODES, FLAG_BINARY
+    return trigram_codes(raw), FLAG_TEXT
+
+
+class TrigramIndex:
+    def __init__(self, path: str | None = None):
+        self.path = path
+        self.paths: list[str] = []
+        self.path_ids: dict[str, int] = {}
+        self.stats: list[tuple[int, int]] = []
+        self.flags: list[int] = []
+        self.file_codes: list[np.ndarray] = []
+        # CSR postings over the files that existed at the last compaction.
+        self._base_count = 0
+        self._post_codes = _EMPTY_CODES
+        self._post_starts = np.zeros(1, dtype=np.int64)
+        self._post_files = np.zeros(0, dtype=np.int32)
+        # Files changed/removed since the compaction and the fresh codes of changed ones.
+        self._stale: set[int] = set()
+        self._overlay: dict[int, np.ndarray] = {}
+        self._lock = threading.Lock()
+        self.dirty = False
+        if path:
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self.path_ids)
+
+    def refresh(self, files: list[str]) -> int:
+        """Re-index new or modified files and drop removed ones; returns the
+        number of files that changed."""
+        with self._lock:
+            seen: set[int] = set()
+            changed = 0
+            for path in files:
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                stat_key = (st.st_mtime_ns, st.st_size)
+                file_id = self.path_ids.get(path)
+                if file_id is not None and self.stats[file_id] == stat_key:
+                    seen.add(file_id)
+                    continue
+                codes, flag = read_file_trigrams(path)
+                if file_id is None:
+                    file_id = len(self.paths)
+                    self.paths.append(path)
+                    self.path_ids[path] = file_id
+                    self.stats.append(stat_key)
+                    self.flags.append(flag)
+                    self.file_codes.append(codes)
+                else:
+                    self.stats[file_id] = stat_key
+                    self.flags[file_id] = flag
+                    self.file_codes[file_id] = codes
+                if file_id < self._base_count:
+                    self._stale.add(file_id)
+                self._overlay[file_id] = codes
+                seen.add(file_id)
+                changed += 1
+            for path, file_id in list(self.path_ids.items()):
+                if file_id in seen:
+                    continue
+                del self.path_ids[path]
+                self.flags[file_id] = FLAG_REMOVED
+                self.file_codes[file_id] = _EMPTY_CODES
+                self._overlay.pop(file_id, None)
+                if file_id < self._base_count:
+                    self._stale.add(file_id)
+                changed += 1
+            if changed:
+                self.dirty = True
+            if len(self._overlay) > max(256, len(self.path_ids) // 8):
+                self._compact()
+            return changed
+
+    def compact(self) -> None:
+        with self._lock:
+            self._compact()
+
+    def _compact(self) -> None:
+        alive = [file_id for file_id in range(len(self.paths)) if self.flags[file_id] != FLAG_REMOVED]
+        self.paths = [self.paths[file_id] for file_id in alive]
+        self.stats = [self.stats[file_id] for file_id in alive]
+        self.flags = [self.flags[file_id] for file_id in alive]
+        self.file_codes = [self.file_codes[file_id] for file_id in alive]
+        self.path_ids = {path: file_id for file_id, path in enumerate(self.paths)}
+        counts = np.fromiter((codes.size for codes in self.file_codes), dtype=np.int64, count=len(self.file_codes))
+        if counts.sum():
+            all_codes = np.concatenate(self.file_codes)
+            all_files = np.repeat(np.arange(len(self.file_codes), dtype=np.int32), counts)
+            order = np.argsort(all_codes, kind="stable")
+            all_codes = all_codes[order]
+            self._post_files = all_files[order]
+            self._post_codes, starts = np.unique(all_codes, return_index=True)
+            self._post_starts = np.append(starts, all_codes.size).astype(np.int64)
+        else:
+            self._post_codes = _EMPTY_CODES
+            self._post_starts = np.zeros(1, dtype=np.int64)
+            self._post_files = np.zeros(0, dtype=np.int32)
+        self._base_count = len(self.paths)
+        self._stale.clear()
+        self._overlay.clear()
+
+    def _base_files(self, codes: np.ndarray) -> np.ndarray:
+        positions = np.searchsorted(self._post_codes, codes)
+        if (positions >= self._post_codes.size).any() or (self._post_codes[np.minimum(positions, self._post_codes.size - 1)] != codes).any():
+            return np.zeros(0, dtype=np.int32)
+        slices = sorted(
+            (self._post_files[self._post_starts[pos]:self._post_starts[pos + 1]] for pos in positions),
+            key=len,
+        )
+        files = slices[0]
+        for other in slices[1:]:
+            files = np.intersect1d(files, other, assume_unique=True)
+            if not files.size:
+                break
+        return files
+
+    def candidate_paths(self, pattern: str, regex: bool, case_sensitive: bool) -> set[str] | None:
+        """Paths that may contain a match, or None when every file must be scanned."""
+        plan = query_trigrams(pattern, regex, case_sensitive)
+        if plan is None:
+            return None
+        with self._lock:
+            matched: set[int] = set()
+            for codes in plan:
+                base = self._base_files(codes) if self._post_codes.size else np.zeros(0, dtype=np.int32)
+                matched.update(int(file_id) for file_id in base if int(file_id) not in self._stale)
+                for file_id, file_codes in self._overlay.items():
+                    if file_codes.size and np.isin(codes, file_codes, assume_unique=True).all():
+                        matched.add(file_id)
+            matched.update(
+                file_id
+                for file_id in self.path_ids.values()
+                if self.flags[file_id] == FLAG_UNINDEXED
+            )
+            return {self.paths[file_id] for file_id in matched if self.flags[file_id] != FLAG_REMOVED}
+
+    def save(self) -> None:
+        if not self.path or not self.dirty:
+            return
+        with self._lock:
+            self._compact()
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            counts = np.fromiter((codes.size for codes in self.file_codes), dtype=np.int64, count=len(self.file_codes))
+            tmp = self.path + ".tmp.npz"
+            try:
+                np.savez(
+                    tmp,
+                    paths=np.array(self.paths, dtype=str),
+                    stats=np.array(self.stats, dtype=np.int64).reshape(-1, 2),
+                    flags=np.array(self.flags, dtype=np.int8),
+                    offsets=np.concatenate(([0], np.cumsum(counts))).astype(np.int64),
+                    codes=np.concatenate(self.file_codes) if counts.sum() else _EMPTY_CODES,
+                )
+                os.replace(tmp, self.path)
+                self.dirty = False
+            except Exception as e:
+                print(f"[grep_index] Failed to save {self.path}: {e}")
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path) as data:
+                paths = [str(path) for path in data["paths"]]
+                stats = [tuple(int(value) for value in row) for row in data["stats"]]
+                flags = [int(flag) for flag in data["flags"]]
+                offsets = data["offsets"]
+                codes = data["codes"].astype(np.uint32)
+        except Exception as e:
+            print(f"[grep_index] Failed to load {self.path}: {e}")
+            return
+        self.paths = paths
+        self.stats = stats
+        self.flags = flags
+        self.file_codes = [codes[offsets[i]:offsets[i + 1]] for i in range(len(paths))]
+        self._compact()
@@ -0,0 +1,108 @@
+"""File- and class-level vectors pooled from function embeddings.
+
+Each file (and each class within a file) is represented by the mean of its
+members' embeddings, so the same L2 geometry as the function index applies.
+A query can first pick the nearest files or classes and then rank only their
+members. Pooled vectors are recomputed only for files that changed; row
+mappings are rebuilt on every update because row positions shift.
+"""
+import numpy as np
+
+LEVELS = ("file", "class")
+
+
+def _function_file(func: dict) -> str:
+    return func.get("file_path", func.get("file", ""))
+
+
+class HierarchyIndex:
+    def __init__(self):
+        # file -> (file vector, {class name: class vector})
+        self.pooled: dict[str, tuple[np.ndarray, dict[str, np.ndarray]]] = {}
+        self.file_rows: dict[str, np.ndarray] = {}
+        self.class_rows: dict[tuple[str, str], np.ndarray] = {}
+        self._matrices: dict[str, tuple[list, np.ndarray, np.ndarray]] = {}
+
+    def __len__(self) -> int:
+        return len(self.file_rows)
+
+    def update(
+        self,
+        functions: list[dict],
+        embeddings: np.ndarray,
+        changed_files: list[str] | None = None,
+        removed_files: list[str] | None = None,
+    ) -> None:
+        """Re-pool `changed_files` (all files when None). `functions` must be
+        row-aligned with `embeddings`."""
+        file_rows: dict[str, list[int]] = {}
+        class_rows: dict[tuple[str, str], list[int]] = {}
+        for row, func in enumerate(functions):
+            file_path = _function_file(func)
+            file_rows.setdefault(file_path, []).append(row)
+            if func.get("class_name"):
+                class_rows.setdefault((file_path, func["class_name"]), []).append(row)
+        self.file_rows = {path: np.array(rows, dtype=np.int64) for path, rows in file_rows.items()}
+        self.class_rows = {key: np.array(rows, dtype=np.int64) for key, rows in class_rows.items()}
+
+        for path in removed_files or []:
+            self.pooled.pop(path, None)
+        for path in [path for path in self.pooled if path not in self.file_rows]:
+            del self.pooled[path]
+        if changed_files is None:
+            targets = list(self.file_rows)
+        else:
+            # Files never pooled before (e.g. first update after a load) are included too.
+            changed = set(changed_files)
+            targets = [path for path in self.file_rows if path in changed or path not in self.pooled]
+        classes_by_file: dict[str, list[str]] = {}
+        for file_path, class_name in self.class_rows:
+            classes_by_file.setdefault(file_path, []).append(class_name)
+        for path in targets:
+            file_vector = embeddings[self.file_rows[path]].mean(axis=0)
+            class_vectors = {
+                class_name: embeddings[self.class_rows[(path, class_name)]].mean(axis=0)
+                for class_name in classes_by_file.get(path, [])
+            }
+            self.pooled[path] = (file_vector, class_vectors)
+        self._matrices = {}
+
+    def _matrix(self, level: str) -> tuple[list, np.ndarray, np.ndarray]:
+        if level not in self._matrices:
+            if level == "file":
+                keys = sorted(self.pooled)
+                vectors = [self.pooled[path][0] for path in keys]
+            else:
+                keys = sorted(self.class_rows)
+                vectors = [self.pooled[file_path][1][class_name] for file_path, class_name in keys]
+            matrix = np.vstack(vectors).astype(np.float32) if vectors else np.zeros((0, 0), dtype=np.float32)
+            norms = np.einsum("ij,ij->i", matrix, matrix) if vectors else np.zeros(0, dtype=np.float32)
+            self._matrices[level] = (keys, matrix, norms)
+        return self._matrices[level]
+
+    def distances(self, query_embedding: np.ndarray, level: str) -> tuple[list, np.ndarray]:
+        """Squared L2 distance from the query to every file or class vector."""
+        keys, matrix, norms = self._matrix(level)
+        if not keys:
+            return keys, np.zeros(0, dtype=np.float32)
+        query = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+        return keys, np.maximum(norms - 2.0 * (matrix @ query) + float(query @ query), 0.0)
+
+    def nearest(self, query_embedding: np.ndarray, level: str, k: int) -> list[tuple]:
+        """(key, distance) of the `k` nearest files or classes, nearest first.
+        File keys are paths; class keys are (file, class name)."""
+        keys, dists = self.distances(query_embedding, level)
+        if not keys or k <= 0:
+            return []
+        k = min(k, len(keys))
+        top = np.argpartition(dists, k - 1)[:k] if k < len(keys) else np.arange(len(keys))
+        top = top[np.argsort(dists[top], kind="stable")]
+        return [(keys[i], float(dists[i])) for i in top]
+
+    def member_rows(self, keys: list, level: str) -> np.ndarray:
+        """Sorted function rows belonging to the given files or classes."""
+        table = self.file_rows if level == "file" else self.class_rows
+        parts = [table[key] for key in keys if key in table]
+        if not parts:
+            return np.zeros(0, dtype=np.int64)
+        return np.unique(np.concatenate(parts))
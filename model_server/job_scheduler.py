@@ -0,0 +1,234 @@
+"""Priority job scheduler for indexing, diff preparation and embedding work.
+
+Heavy work is submitted as a job instead of running inline in the request
+handler. Each job names the resource it needs ("index" for the resident
+function index, "diff" for the diff hunk index, "embed" for bulk /embed
+calls); a resource runs one job at a time, and among runnable jobs the
+lowest priority value wins, so interactive searches overtake queued bulk
+builds. Jobs submitted with the same key while an earlier one is still
+queued or running share that job and its result. The queue is bounded:
+submit raises JobQueueFull instead of letting work pile up.
+
+Every job owns a progress operation, registered at submit time, so a job
+can be cancelled (and its progress read) while it is still waiting.
+"""
+import asyncio
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Optional
+
+import progress
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BUILD = 10
+PRIORITY_BULK = 20
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+TERMINAL_STATUSES = (DONE, FAILED, CANCELLED)
+
+
+class JobQueueFull(Exception):
+    """Raised when the scheduler already holds `max_queued` waiting jobs."""
+
+
+class Job:
+    def __init__(
+        self,
+        job_id: str,
+        kind: str,
+        resource: str,
+        fn: Callable[[], Any],
+        priority: int,
+        key: Optional[tuple],
+        operation: progress.Operation,
+        seq: int,
+    ):
+        self.id = job_id
+        self.kind = kind
+        self.resource = resource
+        self.fn = fn
+        self.priority = priority
+        self.key = key
+        self.operation = operation
+        self.seq = seq
+        self.status = QUEUED
+        self.future: Future = Future()
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # 重複排除で同じジョブを受け取った submit の数（最初の 1 件を含む）
+        self.submissions = 1
+
+    @property
+    def operation_id(self) -> str:
+        return self.operation.id
+
+    def summary(self, include_result: bool = False) -> dict:
+        info = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "resource": self.resource,
+            "priority": self.priority,
+            "status": self.status,
+            "operation_id": self.operation.id,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "queue_delay": (self.started_at - self.submitted_at) if self.started_at else None,
+            "submissions": self.submissions,
+            "error": self.error,
+        }
+        if include_result and self.status == DONE:
+            info["result"] = self.result
+        return info
+
+    async def wait_async(self) -> Any:
+        """Result of the job; raises what the job raised. Cancelling the
+        awaiting request does not cancel the job, which other submitters
+        may share."""
+        return await asyncio.shield(asyncio.wrap_future(self.future))
+
+
+class JobScheduler:
+    def __init__(self, workers: int = 3, max_queued: int = 64, max_finished: int = 50):
+        self.max_queued = max_queued
+        self.max_finished = max_finished
+        self._cond = threading.Condition()
+        self._queued: list[Job] = []
+        self._running: dict[str, Job] = {}  # resource -> job
+        self._jobs: dict[str, Job] = {}
+        self._finished: list[str] = []
+        self._by_key: dict[tuple, Job] = {}
+        self._seq = itertools.count()
+        self._workers = [
+            threading.Thread(target=self._worker, name=f"owl-job-{i}", daemon=True) for i in range(max(1, workers))
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(
+        self,
+        kind: str,
+        fn: Callable[[], Any],
+        resource: str,
+        priority: int = PRIORITY_BUILD,
+        key: Optional[tuple] = None,
+        operation_id: Optional[str] = None,
+    ) -> Job:
+        """Queue `fn` (run in a worker thread inside the job's progress
+        operation), or return the queued/running job with the same `key`."""
+        with self._cond:
+            if key is not None:
+                existing = self._by_key.get(key)
+                if existing is not None and existing.status in (QUEUED, RUNNING):
+                    existing.submissions += 1
+                    if existing.status == QUEUED and priority < existing.priority:
+                        existing.priority = priority
+                    return existing
+            if len(self._queued) >= self.max_queued:
+                raise JobQueueFull(f"{len(self._queued)} jobs are already queued")
+            seq = next(self._seq)
+            operation = progress.begin(kind, operation_id)
+            job = Job(f"job-{seq + 1}", kind, resource, fn, priority, key, operation, seq)
+            self._jobs[job.id] = job
+            self._queued.append(job)
+            if key is not None:
+                self._by_key[key] = job
+            self._cond.notify_all()
+            return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def jobs(self) -> list[Job]:
+        with self._cond:
+            return sorted(self._jobs.values(), key=lambda job: job.seq)
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a queued job outright, or signal a running one through its
+        progress operation. False when the job is unknown or finished."""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in TERMINAL_STATUSES:
+                return False
+            if job.status == QUEUED:
+                self._queued.remove(job)
+                self._drop(job)
+                return True
+        progress.request_cancel(job.operation_id)
+        return True
+
+    def cancel_operation(self, operation_id: Optional[str] = None) -> list[str]:
+        """Drop queued jobs of `operation_id` (all queued jobs when omitted);
+        running work is cancelled through progress.request_cancel."""
+        with self._cond:
+            dropped = [job for job in self._queued if operation_id is None or job.operation_id == operation_id]
+            for job in dropped:
+                self._queued.remove(job)
+                self._drop(job)
+            return [job.id for job in dropped]
+
+    def _drop(self, job: Job) -> None:
+        # self._cond を保持した状態で呼ぶ。キューから外したジョブを待っている側へ知らせる
+        message = "Cancelled before it started."
+        self._finish(job, CANCELLED, error=message)
+        job.future.set_exception(progress.OperationCancelled(message))
+
+    def _finish(self, job: Job, status: str, result: Any = None, error: Optional[str] = None) -> None:
+        # self._cond を保持した状態で呼ぶ
+        job.status = status
+        job.result = result
+        job.error = error
+        job.finished_at = time.time()
+        if job.key is not None and self._by_key.get(job.key) is job:
+            del self._by_key[job.key]
+        self._finished.append(job.id)
+        for stale in self._finished[:-self.max_finished]:
+            self._jobs.pop(stale, None)
+        del self._finished[:-self.max_finished]
+        progress.end(job.operation)
+        self._cond.notify_all()
+
+    def _next_job(self) -> Job:
+        # self._cond を保持した状態で呼ぶ
+        while True:
+            runnable = [job for job in self._queued if job.resource not in self._running]
+            if runnable:
+                job = min(runnable, key=lambda item: (item.priority, item.seq))
+                self._queued.remove(job)
+                self._running[job.resource] = job
+                job.status = RUNNING
+                job.started_at = time.time()
+                return job
+            self._cond.wait()
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                job = self._next_job()
+            status, result, error = DONE, None, None
+            exc: Optional[BaseException] = None
+            try:
+                with progress.operation(job.kind, job.operation_id) as op:
+                    op.raise_if_cancelled()
+                    result = job.fn()
+            except progress.OperationCancelled as e:
+                status, error, exc = CANCELLED, str(e), e
+            except BaseException as e:  # noqa: BLE001 - surfaced to the waiting request
+                status, error, exc = FAILED, f"{type(e).__name__}: {e}", e
+            with self._cond:
+                self._running.pop(job.resource, None)
+                self._finish(job, status, result, error)
+            if exc is None:
+                job.future.set_result(result)
+            else:
+                job.future.set_exception(exc)
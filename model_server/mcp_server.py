@@ -3,19 +3,21 @@
 
 from __future__ import annotations
 
+import asyncio
+import http.client
+import io
 import json
-import fnmatch
 import os
-import subprocess
+import select
 import sys
 import threading
 import urllib.error
-import urllib.request
+import urllib.parse
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Any
-
-from pathspec import PathSpec
-from pathspec.patterns import GitWildMatchPattern
+from typing import Any, Iterator
 
 
 PROTOCOL_VERSION = "2025-06-18"
@@ -24,31 +26,12 @@ DEFAULT_WORKSPACE = os.environ.get("OWLSPOTLIGHT_WORKSPACE", "")
 DEFAULT_SEARCH_MODE = "semantic"
 DEFAULT_TOP_K = 30
 DEFAULT_SEARCH_TIMEOUT = float(os.environ.get("OWLSPOTLIGHT_SEARCH_TIMEOUT", "1800"))
+DEFAULT_TOOL_TIMEOUT = float(os.environ.get("OWLSPOTLIGHT_TOOL_TIMEOUT", "300"))
+MAX_CONCURRENT_TOOL_CALLS = max(1, int(os.environ.get("OWLSPOTLIGHT_MCP_CONCURRENCY", "8")))
+MAX_IDLE_CONNECTIONS = 8
+# Methods safe to resend when a reused connection drops after the request went out.
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
 SUPPORTED_FILE_EXTENSIONS = (".py", ".java", ".ts", ".tsx", ".js", ".jsx")
-IGNORED_DIR_NAMES = {
-    ".git",
-    ".mypy_cache",
-    ".owl_index",
-    ".pytest_cache",
-    ".venv",
-    ".vscode-test",
-    "__pycache__",
-    "build",
-    "dist",
-    "node_modules",
-    "out",
-}
-SOURCE_DIR_NAMES = {
-    "src",
-    "app",
-    "lib",
-    "packages",
-    "components",
-    "server",
-    "client",
-    "backend",
-    "frontend",
-}
 _write_lock = threading.Lock()
 _client_info: dict[str, Any] = {}
 _last_search_event_id_by_directory: dict[str, int] = {}
@@ -84,119 +67,6 @@ def resolve_directory(value: Any) -> str:
     return os.getcwd()
 
 
-def is_supported_source_path(path: Path) -> bool:
-    return path.is_file() and path.suffix.lower() in SUPPORTED_FILE_EXTENSIONS
-
-
-def should_skip_path(path: Path) -> bool:
-    return any(part in IGNORED_DIR_NAMES for part in path.parts)
-
-
-def load_ignore_spec(directory: str) -> PathSpec | None:
-    root = Path(directory).resolve()
-    lines: list[str] = []
-    for ignore_file in (".gitignore", ".owlignore"):
-        ignore_path = root / ignore_file
-        if not ignore_path.exists():
-            continue
-        lines.extend(
-            line.rstrip("\n")
-            for line in ignore_path.read_text(encoding="utf-8").splitlines()
-            if line.strip() and not line.lstrip().startswith("#")
-        )
-    if not lines:
-        return None
-    return PathSpec.from_lines(GitWildMatchPattern, lines)
-
-
-def is_owl_ignored(path: Path, directory: str, spec: PathSpec | None = None) -> bool:
-    ignore_spec = spec if spec is not None else load_ignore_spec(directory)
-    if ignore_spec is None:
-        return False
-    root = Path(directory).resolve()
-    try:
-        rel_path = path.resolve().relative_to(root)
-    except ValueError:
-        return True
-    return bool(ignore_spec.match_file(str(rel_path)))
-
-
-def git_visible_files(directory: str) -> list[Path]:
-    root = Path(directory).resolve()
-    ignore_spec = load_ignore_spec(directory)
-    try:
-        output = subprocess.check_output(
-            ["git", "ls-files", "--cached", "--others", "--exclude-standard"],
-            cwd=root,
-            text=True,
-            stderr=subprocess.DEVNULL,
-        )
-    except Exception:
-        return []
-
-    paths: list[Path] = []
-    for line in output.splitlines():
-        rel_path = line.strip()
-        if not rel_path:
-            continue
-        path = (root / rel_path).resolve()
-        try:
-            path.relative_to(root)
-        except ValueError:
-            continue
-        if is_supported_source_path(path) and not is_owl_ignored(path, directory, ignore_spec):
-            paths.append(path)
-    return paths
-
-
-def candidate_source_files(directory: str) -> list[Path]:
-    git_files = git_visible_files(directory)
-    if git_files:
-        return git_files
-
-    root = Path(directory).resolve()
-    ignore_spec = load_ignore_spec(directory)
-    files: list[Path] = []
-    for path in root.rglob("*"):
-        if should_skip_path(path) or not is_supported_source_path(path):
-            continue
-        if is_owl_ignored(path, directory, ignore_spec):
-            continue
-        files.append(path)
-    return files
-
-
-def detected_file_counts(directory: str, scope: str = "all") -> dict[str, int]:
-    counts = {ext: 0 for ext in SUPPORTED_FILE_EXTENSIONS}
-    if scope == "changed":
-        for ext in SUPPORTED_FILE_EXTENSIONS:
-            counts[ext] = len(changed_files(directory, ext))
-        return counts
-    if scope == "source":
-        for ext in SUPPORTED_FILE_EXTENSIONS:
-            counts[ext] = len(source_files(directory, ext))
-        return counts
-
-    for path in candidate_source_files(directory):
-        counts[path.suffix.lower()] += 1
-    return counts
-
-
-def resolve_file_ext(directory: str, requested_ext: Any, scope: str) -> tuple[str, dict[str, int]]:
-    requested = str(requested_ext or "auto").strip().lower()
-    if requested and requested != "auto":
-        if requested not in SUPPORTED_FILE_EXTENSIONS:
-            raise ValueError(f"Unsupported file_ext: {requested}")
-        return requested, {}
-
-    counts = detected_file_counts(directory, scope if scope in {"all", "source", "changed"} else "all")
-    detected = [(ext, count) for ext, count in counts.items() if count > 0]
-    if not detected:
-        raise ValueError(f"No supported source files found in {directory}")
-    detected.sort(key=lambda item: (-item[1], SUPPORTED_FILE_EXTENSIONS.index(item[0])))
-    return detected[0][0], counts
-
-
 def truncate_text(text: str, limit: int = 900) -> str:
     clean = " ".join(text.split()) if "\n" not in text else text.strip()
     if len(clean) <= limit:
@@ -239,72 +109,139 @@ def error_response(request_id: str | int | None, code: int, message: str) -> dic
     return {"jsonrpc": "2.0", "id": request_id, "error": {"code": code, "message": message}}
 
 
+class ServerConnectionPool:
+    """Keep-alive HTTP/1.1 connections to the model server, reused across
+    tool calls instead of opening a new socket per request."""
+
+    def __init__(self, max_idle: int = MAX_IDLE_CONNECTIONS):
+        self.max_idle = max_idle
+        self._idle: dict[tuple[str, str], deque[http.client.HTTPConnection]] = {}
+        self._lock = threading.Lock()
+
+    def _acquire(self, scheme: str, netloc: str, timeout: float) -> tuple[http.client.HTTPConnection, bool]:
+        while True:
+            with self._lock:
+                idle = self._idle.get((scheme, netloc))
+                conn = idle.pop() if idle else None
+            if conn is None:
+                break
+            conn.timeout = timeout
+            try:
+                if conn.sock is not None:
+                    # An idle socket that is readable has been closed by the server
+                    # (or holds stray bytes); discard it before sending anything on it.
+                    if select.select([conn.sock], [], [], 0)[0]:
+                        conn.close()
+                        continue
+                    conn.sock.settimeout(timeout)
+                return conn, True
+            except (OSError, ValueError):
+                conn.close()
+        connection_class = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        return connection_class(netloc, timeout=timeout), False
+
+    def _release(self, scheme: str, netloc: str, conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            idle = self._idle.setdefault((scheme, netloc), deque())
+            if len(idle) < self.max_idle:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def close(self) -> None:
+        with self._lock:
+            connections = [conn for idle in self._idle.values() for conn in idle]
+            self._idle.clear()
+        for conn in connections:
+            conn.close()
+
+    def _open(
+        self, method: str, url: str, body: bytes | None, timeout: float
+    ) -> tuple[http.client.HTTPConnection, http.client.HTTPResponse, tuple[str, str]]:
+        parsed = urllib.parse.urlsplit(url)
+        path = parsed.path or "/"
+        if parsed.query:
+            path += "?" + parsed.query
+        headers = {"Connection": "keep-alive"}
+        if body is not None:
+            headers["Content-Type"] = "application/json"
+        while True:
+            conn, reused = self._acquire(parsed.scheme, parsed.netloc, timeout)
+            sent = False
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                sent = True
+                return conn, conn.getresponse(), (parsed.scheme, parsed.netloc)
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError) as exc:
+                conn.close()
+                # The server may have dropped an idle connection; retry on a fresh one.
+                # Once a POST has gone out the server may already be running it, so
+                # only requests that never left, or idempotent ones, are resent.
+                if reused and (not sent or method in IDEMPOTENT_METHODS):
+                    continue
+                raise urllib.error.URLError(exc) from exc
+            except (OSError, http.client.HTTPException) as exc:
+                conn.close()
+                raise urllib.error.URLError(exc) from exc
+
+    def _finish(self, key: tuple[str, str], conn: http.client.HTTPConnection, res: http.client.HTTPResponse) -> None:
+        if res.will_close:
+            conn.close()
+        else:
+            self._release(key[0], key[1], conn)
+
+    def request(self, method: str, url: str, body: bytes | None = None, timeout: float = 30.0) -> tuple[int, bytes]:
+        """(status, body) of one request. Errors are raised as urllib.error
+        exceptions so callers handle both transports the same way."""
+        conn, res, key = self._open(method, url, body, timeout)
+        try:
+            data = res.read()
+        except (OSError, http.client.HTTPException) as exc:
+            conn.close()
+            raise urllib.error.URLError(exc) from exc
+        self._finish(key, conn, res)
+        if res.status >= 400:
+            raise urllib.error.HTTPError(url, res.status, res.reason, res.headers, io.BytesIO(data))
+        return res.status, data
+
+    def stream_lines(self, method: str, url: str, body: bytes | None = None, timeout: float = 30.0) -> Iterator[bytes]:
+        """Non-empty lines of a streamed (NDJSON) response as they arrive.
+        Closing the generator early drops the connection instead of reusing it."""
+        conn, res, key = self._open(method, url, body, timeout)
+        if res.status >= 400:
+            data = res.read()
+            self._finish(key, conn, res)
+            raise urllib.error.HTTPError(url, res.status, res.reason, res.headers, io.BytesIO(data))
+        completed = False
+        try:
+            while True:
+                line = res.readline()
+                if not line:
+                    completed = True
+                    break
+                if line.strip():
+                    yield line
+        except (OSError, http.client.HTTPException) as exc:
+            raise urllib.error.URLError(exc) from exc
+        finally:
+            if completed:
+                self._finish(key, conn, res)
+            else:
+                conn.close()
+
+
+_connection_pool = ServerConnectionPool()
+
+
 def post_json(url: str, payload: dict[str, Any], timeout: float = 120.0) -> dict[str, Any]:
     body = json.dumps(payload).encode("utf-8")
-    request = urllib.request.Request(
-        url,
-        data=body,
-        headers={"Content-Type": "application/json"},
-        method="POST",
-    )
-    with urllib.request.urlopen(request, timeout=timeout) as res:
-        return json.loads(res.read().decode("utf-8"))
+    _status, data = _connection_pool.request("POST", url, body, timeout=timeout)
+    return json.loads(data.decode("utf-8"))
 
 
 def get_json(url: str, timeout: float = 30.0) -> dict[str, Any]:
-    request = urllib.request.Request(url, method="GET")
-    with urllib.request.urlopen(request, timeout=timeout) as res:
-        return json.loads(res.read().decode("utf-8"))
-
-
-def changed_files(directory: str, file_ext: str) -> list[str]:
-    root = Path(directory).resolve()
-    ignore_spec = load_ignore_spec(directory)
-    rel_paths: list[str] = []
-    for args in (
-        ["git", "diff", "--name-only", "--diff-filter=ACMR", "HEAD"],
-        ["git", "ls-files", "--others", "--exclude-standard"],
-    ):
-        try:
-            output = subprocess.check_output(args, cwd=root, text=True, stderr=subprocess.DEVNULL)
-        except Exception:
-            output = ""
-        rel_paths.extend(line.strip() for line in output.splitlines() if line.strip())
-
-    files: list[str] = []
-    seen: set[str] = set()
-    for rel_path in rel_paths:
-        path = (root / rel_path).resolve()
-        if (
-            path in seen
-            or path.suffix.lower() != file_ext
-            or not path.exists()
-            or should_skip_path(path)
-            or is_owl_ignored(path, directory, ignore_spec)
-        ):
-            continue
-        try:
-            path.relative_to(root)
-        except ValueError:
-            continue
-        seen.add(path)
-        files.append(str(path))
-    return files
-
-
-def source_files(directory: str, file_ext: str) -> list[str]:
-    root = Path(directory).resolve()
-    files: list[str] = []
-    for path in candidate_source_files(directory):
-        if path.suffix.lower() != file_ext:
-            continue
-        try:
-            rel_parts = path.relative_to(root).parts
-        except ValueError:
-            continue
-        if any(part.lower() in SOURCE_DIR_NAMES for part in rel_parts):
-            files.append(str(path))
-    return files
+    _status, data = _connection_pool.request("GET", url, timeout=timeout)
+    return json.loads(data.decode("utf-8"))
 
 
 def normalize_glob_patterns(value: Any) -> list[str]:
@@ -320,43 +257,6 @@ def normalize_glob_patterns(value: Any) -> list[str]:
     return patterns
 
 
-def path_matches_glob(rel_path: str, patterns: list[str]) -> bool:
-    rel = rel_path.replace("\\", "/").lstrip("./")
-    name = rel.rsplit("/", 1)[-1]
-    for pattern in patterns:
-        if pattern.endswith("/**"):
-            prefix = pattern[:-3].rstrip("/")
-            if rel == prefix or rel.startswith(prefix + "/"):
-                return True
-        if pattern.endswith("/"):
-            prefix = pattern.rstrip("/")
-            if rel == prefix or rel.startswith(prefix + "/"):
-                return True
-        if fnmatch.fnmatchcase(rel, pattern):
-            return True
-        if "/" not in pattern and fnmatch.fnmatchcase(name, pattern):
-            return True
-    return False
-
-
-def glob_filtered_files(directory: str, file_ext: str, include_globs: list[str], exclude_globs: list[str]) -> list[str]:
-    root = Path(directory).resolve()
-    files: list[str] = []
-    for path in candidate_source_files(directory):
-        if path.suffix.lower() != file_ext:
-            continue
-        try:
-            rel_path = path.resolve().relative_to(root).as_posix()
-        except ValueError:
-            continue
-        if include_globs and not path_matches_glob(rel_path, include_globs):
-            continue
-        if exclude_globs and path_matches_glob(rel_path, exclude_globs):
-            continue
-        files.append(str(path))
-    return files
-
-
 def tool_definitions() -> list[dict[str, Any]]:
     return [
         {
@@ -376,10 +276,15 @@ def tool_definitions() -> list[dict[str, Any]]:
                     },
                     "file_ext": {
                         "type": "string",
-                        "description": "File extension to search. Use auto unless the target language is known; auto detects supported files while respecting .owlignore plus git ignore/exclude rules.",
+                        "description": "File extension to search. Use auto unless the target language is known; auto searches one index covering every supported language while respecting .owlignore plus git ignore/exclude rules.",
                         "enum": ["auto", ".py", ".java", ".ts", ".tsx", ".js", ".jsx"],
                         "default": "auto",
                     },
+                    "languages": {
+                        "type": "array",
+                        "items": {"type": "string", "enum": ["python", "java", "typescript", "javascript"]},
+                        "description": "Optional languages to keep when file_ext is auto, for example [\"python\"].",
+                    },
                     "top_k": {"type": "integer", "minimum": 1, "maximum": 50, "default": DEFAULT_TOP_K},
                     "scope": {
                         "type": "string",
@@ -442,6 +347,10 @@ def tool_definitions() -> list[dict[str, Any]]:
                         "type": "string",
                         "description": "OwlSpotlight HTTP server URL. Defaults to OWLSPOTLIGHT_SERVER_URL or http://127.0.0.1:8000.",
                     },
+                    "operation_id": {
+                        "type": "string",
+                        "description": "Cancel only this operation (the operation_id returned in search meta). Omit to cancel every running operation.",
+                    },
                 },
                 "additionalProperties": False,
             },
@@ -603,6 +512,8 @@ def format_search_response_for_agent(arguments: dict[str, Any], result: dict[str
         meta_bits.append(f"include={','.join(include_globs)}")
     if exclude_globs:
         meta_bits.append(f"exclude={','.join(exclude_globs)}")
+    if arguments.get("languages"):
+        meta_bits.append(f"languages={','.join(arguments['languages'])}")
     if result.get("auto_file_ext_counts"):
         detected = ", ".join(
             f"{ext}:{count}"
@@ -663,7 +574,45 @@ def format_grep_response_for_agent(arguments: dict[str, Any], result: dict[str,
     return "\n\n".join(["\n".join(header), *lines, "\n".join(footer)])
 
 
-def call_search(arguments: dict[str, Any]) -> dict[str, Any]:
+def search_stream(server_url: str, payload: dict[str, Any], progress_token: str | int | None = None) -> dict[str, Any]:
+    """Run a search through /search_stream and return its final result frame.
+    Preview and progress frames are forwarded as MCP progress notifications
+    when the client asked for them."""
+    result: dict[str, Any] = {}
+    sequence = 0
+    lines = _connection_pool.stream_lines(
+        "POST",
+        f"{server_url}/search_stream",
+        json.dumps(payload).encode("utf-8"),
+        timeout=DEFAULT_SEARCH_TIMEOUT,
+    )
+    for line in lines:
+        frame = json.loads(line.decode("utf-8"))
+        frame_type = frame.pop("type", "")
+        message = None
+        if frame_type == "results":
+            result = frame
+            if not frame.get("final"):
+                message = f"Preview: {len(frame.get('results', []))} {frame.get('stage', 'bm25')} candidate(s) while embeddings are prepared"
+        elif frame_type == "progress":
+            message = f"{frame.get('phase') or 'Indexing'} {frame.get('current', 0)}/{frame.get('total', 0)}"
+        elif frame_type == "cancelled":
+            return {"results": [], "cancelled": True, "message": frame.get("message") or "Search cancelled."}
+        elif frame_type == "error":
+            return {"results": [], "error": frame.get("message") or "Search failed."}
+        if message and progress_token is not None:
+            sequence += 1
+            write_message({
+                "jsonrpc": "2.0",
+                "method": "notifications/progress",
+                "params": {"progressToken": progress_token, "progress": sequence, "message": message},
+            })
+    return result
+
+
+def call_search(
+    arguments: dict[str, Any], progress_token: str | int | None = None, operation_id: str | None = None
+) -> dict[str, Any]:
     directory = resolve_directory(arguments.get("directory"))
     query = str(arguments.get("query", "")).strip()
     requested_file_ext = str(arguments.get("file_ext", "auto")).strip() or "auto"
@@ -682,65 +631,62 @@ def call_search(arguments: dict[str, Any]) -> dict[str, Any]:
     force_diff_refresh = bool(arguments.get("force_diff_refresh", False))
     include_globs = normalize_glob_patterns(arguments.get("include_globs"))
     exclude_globs = normalize_glob_patterns(arguments.get("exclude_globs"))
+    raw_languages = arguments.get("languages")
+    languages = [str(item).strip() for item in raw_languages if str(item).strip()] if isinstance(raw_languages, list) else []
     server_url = str(arguments.get("server_url", DEFAULT_SERVER_URL)).rstrip("/")
 
     if not query:
         return {"content": [{"type": "text", "text": "query is required."}], "isError": True}
     if not Path(directory).is_dir():
         return {"content": [{"type": "text", "text": f"Workspace directory does not exist: {directory}"}], "isError": True}
-    try:
-        file_ext, auto_file_ext_counts = resolve_file_ext(directory, requested_file_ext, scope)
-    except ValueError as exc:
-        return {"content": [{"type": "text", "text": str(exc)}], "isError": True}
-
-    include_files = None
-    if search_target != "functions" and scope == "changed":
-        include_files = None
-    elif scope == "changed":
-        include_files = changed_files(directory, file_ext)
-    elif scope == "source":
-        include_files = source_files(directory, file_ext) or None
-    if include_globs or exclude_globs:
-        glob_files = glob_filtered_files(directory, file_ext, include_globs, exclude_globs)
-        if include_files is None:
-            include_files = glob_files
-        else:
-            scoped = {str(Path(path).resolve()) for path in include_files}
-            include_files = [path for path in glob_files if str(Path(path).resolve()) in scoped]
+    if requested_file_ext.lower() != "auto" and requested_file_ext.lower() not in SUPPORTED_FILE_EXTENSIONS:
+        return {"content": [{"type": "text", "text": f"Unsupported file_ext: {requested_file_ext}"}], "isError": True}
 
     payload = {
         "directory": directory,
         "query": query,
-        "file_ext": file_ext,
+        # The server resolves file_ext="auto", scope and globs against its cached file inventory.
+        "file_ext": requested_file_ext.lower(),
         "top_k": max(1, min(top_k, 50)),
-        "include_files": include_files,
         "include_globs": include_globs,
         "exclude_globs": exclude_globs,
+        "languages": languages,
         "search_mode": search_mode if search_mode in {"semantic", "bm25", "hybrid", "keyword"} else DEFAULT_SEARCH_MODE,
         "search_target": search_target,
         "diff_base_ref": diff_base_ref,
         "diff_head_ref": diff_head_ref,
         "force_diff_refresh": force_diff_refresh,
         "scope": scope,
+        "operation_id": operation_id,
         "capture_agent_event": True,
         "agent_source": "mcp",
         **agent_metadata(),
     }
     try:
-        result = post_json(f"{server_url}/search_functions_simple", payload, timeout=DEFAULT_SEARCH_TIMEOUT)
+        result = search_stream(server_url, payload, progress_token)
+    except urllib.error.HTTPError as exc:
+        try:
+            detail = json.loads(exc.read().decode("utf-8")).get("detail") or str(exc)
+        except Exception:
+            detail = str(exc)
+        return {"content": [{"type": "text", "text": f"Search failed: {detail}"}], "isError": True}
     except urllib.error.URLError as exc:
         return {
             "content": [{"type": "text", "text": f"Failed to reach OwlSpotlight server at {server_url}: {exc}"}],
             "isError": True,
         }
 
+    if result.get("error"):
+        return {"content": [{"type": "text", "text": str(result["error"])}], "isError": True}
+    if result.get("cancelled"):
+        return {"content": [{"type": "text", "text": str(result.get("message") or "Search cancelled.")}], "isError": True}
+
     results = result.get("results", [])
     event_id = result.get("agent_event_id")
     if isinstance(event_id, int):
         _last_search_event_id_by_directory[str(Path(directory).resolve())] = event_id
+    file_ext = result.get("file_ext") or requested_file_ext.lower()
     result["file_ext"] = file_ext
-    if auto_file_ext_counts:
-        result["auto_file_ext_counts"] = auto_file_ext_counts
     response_arguments = {
         **arguments,
         "directory": directory,
@@ -751,6 +697,7 @@ def call_search(arguments: dict[str, Any]) -> dict[str, Any]:
         "diff_head_ref": diff_head_ref,
         "include_globs": include_globs,
         "exclude_globs": exclude_globs,
+        "languages": languages,
     }
     text = format_search_response_for_agent(response_arguments, result)
     return {
@@ -770,8 +717,10 @@ def call_search(arguments: dict[str, Any]) -> dict[str, Any]:
 
 def call_cancel_embedding(arguments: dict[str, Any]) -> dict[str, Any]:
     server_url = str(arguments.get("server_url", DEFAULT_SERVER_URL)).rstrip("/")
+    operation_id = str(arguments.get("operation_id", "") or "").strip()
+    payload = {"operation_id": operation_id} if operation_id else {}
     try:
-        result = post_json(f"{server_url}/cancel_embedding", {}, timeout=10.0)
+        result = post_json(f"{server_url}/cancel_embedding", payload, timeout=10.0)
     except urllib.error.URLError as exc:
         return {
             "content": [{"type": "text", "text": f"Failed to reach OwlSpotlight server at {server_url}: {exc}"}],
@@ -915,9 +864,11 @@ def call_grep_repo(arguments: dict[str, Any]) -> dict[str, Any]:
     }
 
 
-def call_tool(name: str, arguments: dict[str, Any]) -> dict[str, Any]:
+def call_tool(
+    name: str, arguments: dict[str, Any], progress_token: str | int | None = None, operation_id: str | None = None
+) -> dict[str, Any]:
     if name == "owlspotlight.search_code":
-        return call_search(arguments)
+        return call_search(arguments, progress_token, operation_id)
     if name == "owlspotlight.cancel_embedding":
         return call_cancel_embedding(arguments)
     if name == "owlspotlight.get_human_feedback":
@@ -929,19 +880,97 @@ def call_tool(name: str, arguments: dict[str, Any]) -> dict[str, Any]:
     raise ValueError(f"Unknown tool: {name}")
 
 
-def run_tool_call(request_id: str | int, name: str, arguments: dict[str, Any]) -> None:
-    try:
-        write_message(response(request_id, call_tool(name, arguments)))
-    except ValueError as exc:
-        write_message(error_response(request_id, -32602, str(exc)))
-    except Exception as exc:
-        write_message(error_response(request_id, -32603, f"Internal error: {exc}"))
+def tool_timeout(name: str) -> float:
+    return DEFAULT_SEARCH_TIMEOUT if name == "owlspotlight.search_code" else DEFAULT_TOOL_TIMEOUT
+
+
+class ToolCallDispatcher:
+    """Runs tools/call requests on the event loop with bounded concurrency.
+
+    Blocking tool bodies run on a fixed worker pool rather than a new thread
+    per call. Each call gets its own server operation id, so a call that
+    exceeds its timeout, or that the client cancels, gets no result and stops
+    only its own indexing/embedding work on the model server. Such a call
+    keeps its concurrency slot until its worker thread actually returns, so
+    abandoned calls cannot pile up beyond the limit.
+    """
+
+    def __init__(self, max_concurrency: int = MAX_CONCURRENT_TOOL_CALLS):
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="owl-mcp-tool")
+        self._tasks: dict[str | int, asyncio.Task] = {}
+
+    def submit(
+        self, request_id: str | int, name: str, arguments: dict[str, Any], progress_token: str | int | None = None
+    ) -> None:
+        task = asyncio.get_running_loop().create_task(self._run(request_id, name, arguments, progress_token))
+        self._tasks[request_id] = task
+        task.add_done_callback(lambda _task: self._tasks.pop(request_id, None))
+
+    def cancel(self, request_id: str | int | None) -> bool:
+        task = self._tasks.get(request_id) if request_id is not None else None
+        if task is None:
+            return False
+        task.cancel()
+        return True
+
+    async def _run(
+        self, request_id: str | int, name: str, arguments: dict[str, Any], progress_token: str | int | None
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        started = False
+        operation_id = uuid.uuid4().hex[:12]
+        cancel_arguments = {"operation_id": operation_id}
+        if "server_url" in arguments:
+            cancel_arguments["server_url"] = arguments["server_url"]
+        try:
+            await self._semaphore.acquire()
+            started = True
+            try:
+                future = loop.run_in_executor(self._executor, call_tool, name, arguments, progress_token, operation_id)
+            except BaseException:
+                self._semaphore.release()
+                raise
+            future.add_done_callback(self._release_slot)
+            # shield: a timeout or cancel abandons the wait, not the worker thread,
+            # whose slot is released by _release_slot when it returns.
+            result = await asyncio.wait_for(asyncio.shield(future), timeout=tool_timeout(name))
+            write_message(response(request_id, result))
+        except asyncio.TimeoutError:
+            await asyncio.to_thread(call_cancel_embedding, cancel_arguments)
+            write_message(error_response(request_id, -32603, f"Tool call timed out after {tool_timeout(name):g}s: {name}"))
+        except asyncio.CancelledError:
+            # Cancelled requests must not receive a response.
+            if started:
+                await asyncio.to_thread(call_cancel_embedding, cancel_arguments)
+        except ValueError as exc:
+            write_message(error_response(request_id, -32602, str(exc)))
+        except Exception as exc:
+            write_message(error_response(request_id, -32603, f"Internal error: {exc}"))
+
+    def _release_slot(self, future: asyncio.Future) -> None:
+        if not future.cancelled():
+            # Retrieve the result of abandoned calls so their errors are not logged as unhandled.
+            future.exception()
+        self._semaphore.release()
+
+    async def drain(self) -> None:
+        if self._tasks:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._executor.shutdown(wait=False)
+
+
+_dispatcher: ToolCallDispatcher | None = None
 
 
 def handle_request(message: dict[str, Any]) -> dict[str, Any] | None:
     method = message.get("method")
     if method == "notifications/cancelled":
-        call_cancel_embedding({})
+        params = message.get("params") or {}
+        # Only the cancelled call's own operation is stopped; unknown or
+        # already finished requests leave other clients' work alone.
+        if _dispatcher is not None:
+            _dispatcher.cancel(params.get("requestId"))
         return None
     request_id = message.get("id")
     if request_id is None:
@@ -970,23 +999,40 @@ def handle_request(message: dict[str, Any]) -> dict[str, Any] | None:
         params = message.get("params", {})
         name = params.get("name")
         arguments = params.get("arguments") or {}
-        threading.Thread(target=run_tool_call, args=(request_id, name, arguments)).start()
+        meta = params.get("_meta") or {}
+        _dispatcher.submit(request_id, name, arguments, meta.get("progressToken"))
         return None
     return error_response(request_id, -32601, f"Method not found: {method}")
 
 
-def main() -> None:
-    for line in sys.stdin:
-        line = line.strip()
-        if not line:
-            continue
+async def serve() -> None:
+    global _dispatcher
+    _dispatcher = ToolCallDispatcher()
+    loop = asyncio.get_running_loop()
+    # stdin is read on its own thread so the loop keeps serving tool results.
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="owl-mcp-stdin") as reader:
         try:
-            message = json.loads(line)
-            result = handle_request(message)
-            if result is not None:
-                write_message(result)
-        except Exception as exc:
-            write_message(error_response(None, -32603, f"Internal error: {exc}"))
+            while True:
+                line = await loop.run_in_executor(reader, sys.stdin.readline)
+                if not line:
+                    break
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    message = json.loads(line)
+                    result = handle_request(message)
+                    if result is not None:
+                        write_message(result)
+                except Exception as exc:
+                    write_message(error_response(None, -32603, f"Internal error: {exc}"))
+            await _dispatcher.drain()
+        finally:
+            _connection_pool.close()
+
+
+def main() -> None:
+    asyncio.run(serve())
 
 
 if __name__ == "__main__":
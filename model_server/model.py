@@ -8,6 +8,7 @@ import warnings
 import logging
 import builtins as _builtins
 import progress
+from embedding_gate import BULK, INTERACTIVE, EmbeddingGate
 
 # 詳細なサーバーログは既定でオフ。OWLSPOTLIGHT_DEBUG=1 で再度有効化できる。
 OWL_DEBUG = os.environ.get("OWLSPOTLIGHT_DEBUG", "").strip().lower() in ("1", "true", "yes", "on")
@@ -31,6 +32,9 @@ progress_env = os.environ.get("OWL_PROGRESS", "1").lower()
 # グローバル変数でモデルとデバイスを管理
 model = None
 model_device = None
+# モデルはバッチ単位で貸し出す。インデックス構築などの一括処理はバッチの合間に
+# 待っているクエリへ順番を譲るため、検索がインデックス作成の後ろで待たされない。
+embedding_gate = EmbeddingGate()
 
 def get_device():
     """利用可能な最適なデバイスを取得"""
@@ -127,17 +131,21 @@ def encode_code(
     max_retries: int = 3,
     show_progress: bool = True,
     input_type: str = "document",
+    priority: str | None = None,
 ) -> np.ndarray:
     """コードをエンコードし、メモリエラー時は自動的にバッチサイズを調整。
 
     バッチごとに進捗を progress モジュールへ報告するため、内部のtqdmバーは無効化し、
-    代わりに拡張機能側で実際の割合を表示できるようにする。"""
+    代わりに拡張機能側で実際の割合を表示できるようにする。
+    priority は embedding_gate の優先度で、省略時はクエリなら "interactive"、それ以外は "bulk"。"""
     global model_device
 
     current_model = get_model()
     total = len(codes)
     batch_size = max(1, int(batch_size or 2))
     input_type = input_type if input_type in {"document", "query", "generic"} else "document"
+    if priority not in (INTERACTIVE, BULK):
+        priority = INTERACTIVE if input_type == "query" else BULK
 
     # 進捗を報告するか（環境変数で抑制可能）
     report = show_progress and progress_env not in ("0", "false") and total > 0
@@ -155,7 +163,8 @@ def encode_code(
             for start_idx in range(0, total, batch_size):
                 progress.raise_if_cancelled()
                 batch = codes[start_idx:start_idx + batch_size]
-                emb = _encode_inputs(current_model, batch, batch_size, input_type)
+                with embedding_gate.slot(priority):
+                    emb = _encode_inputs(current_model, batch, batch_size, input_type)
                 progress.raise_if_cancelled()
                 chunks.append(emb)
                 done = min(start_idx + batch_size, total)
@@ -197,6 +206,10 @@ def encode_code(
     
     raise RuntimeError("Failed to encode after all retries")
 
+def embedding_queue_stats() -> dict:
+    """埋め込みモデルの待ち時間（優先度別の queueing delay）。"""
+    return embedding_gate.stats()
+
 def get_model_embedding_dim() -> int:
     """モデルの埋め込み次元数を取得"""
     current_model = get_model()
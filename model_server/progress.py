@@ -1,100 +1,276 @@
-"""インデックス作成の進捗を共有するための軽量なステート。
+"""インデックス作成の進捗とキャンセルを操作（operation）単位で管理するステート。
 
 サーバー（FastAPI）とモデル側（埋め込み生成）の両方から更新され、
-拡張機能が /index_progress 経由でポーリングして UI に反映する。
+拡張機能が /events（SSE）または /index_progress 経由で UI に反映する。
+
+エンドポイントは `with progress.operation(kind, op_id):` で操作を登録する。
+操作は contextvars で現在のタスクに結び付き、asyncio.to_thread にも引き継がれるので、
+build_index や encode_code の中の start / update / raise_if_cancelled は
+呼び出し元の操作だけを更新・判定する。操作ごとにキャンセル用の Event を持つため、
+あるリクエストのキャンセルや新しい操作の開始が別のリクエストに影響しない。
+操作の外からの呼び出しは従来どおり既定の操作（"default"）に対して働く。
+
+更新のたびに version が進み、フェーズ・開始/終了・キャンセルの変化では
+phase_version も進む。プッシュ側はこの2つの番号をロックなしで読んで、
+件数だけの高頻度な更新はまとめて間引き、フェーズ変化はすぐに送る。
 """
+import contextlib
+import contextvars
 import threading
 import time
+import uuid
+from collections import OrderedDict
+from typing import Iterator, Optional
+
+# 終了した操作も /index_progress?op= で結果を確認できるよう、この件数までは残す
+MAX_FINISHED_OPERATIONS = 32
 
 _lock = threading.Lock()
-_cancel_event = threading.Event()
+_version = 0
+_phase_version = 0
 
 
 class OperationCancelled(Exception):
     """Raised when the current indexing/embedding operation is cancelled."""
 
 
-_state = {
-    "active": False,
-    "phase": "",
-    "current": 0,
-    "total": 0,
-    "started_at": 0.0,
-    "updated_at": 0.0,
-    "cancel_requested": False,
-}
+class Operation:
+    """1 つの操作の進捗とキャンセルトークン。状態の読み書きは _lock の下で行う。"""
+
+    def __init__(self, op_id: str, kind: str):
+        self.id = op_id
+        self.kind = kind
+        self.cancel_event = threading.Event()
+        self.running = True
+        # 同じ id で合流した呼び出しの数。0 になったら終了
+        self.holders = 0
+        self.state = {
+            "active": False,
+            "phase": "",
+            "current": 0,
+            "total": 0,
+            "started_at": 0.0,
+            "updated_at": time.time(),
+            "cancel_requested": False,
+        }
+
+    def is_cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def raise_if_cancelled(self) -> None:
+        if self.cancel_event.is_set():
+            raise OperationCancelled(f"Operation {self.id} cancelled")
+
+
+_default = Operation("default", "default")
+_default.running = False
+_operations: "OrderedDict[str, Operation]" = OrderedDict()
+_current: contextvars.ContextVar[Optional[Operation]] = contextvars.ContextVar("progress_operation", default=None)
+
+
+def _bump(phase_changed: bool) -> None:
+    # _lock を保持した状態で呼ぶ
+    global _version, _phase_version
+    _version += 1
+    if phase_changed:
+        _phase_version = _version
+
+
+def _op() -> Operation:
+    return _current.get() or _default
+
+
+def new_operation_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+def begin(kind: str, op_id: Optional[str] = None) -> Operation:
+    """操作を登録して返す。同じ id の操作が実行中ならそれに合流し、id を省略した
+    ときは現在の操作（入れ子の呼び出し元）に合流する。
+    必ず end() と対にする（通常は operation() を使う）。"""
+    with _lock:
+        op = _operations.get(op_id) if op_id else _current.get()
+        if op is None or not op.running:
+            op = Operation(op_id or new_operation_id(), kind)
+            _operations.pop(op.id, None)
+            _operations[op.id] = op
+            _bump(True)
+        op.holders += 1
+        return op
+
+
+def end(op: Operation) -> None:
+    with _lock:
+        op.holders -= 1
+        if op.holders > 0 or not op.running:
+            return
+        op.running = False
+        op.state["active"] = False
+        op.state["updated_at"] = time.time()
+        _bump(True)
+        finished = [key for key, item in _operations.items() if not item.running]
+        for key in finished[:-MAX_FINISHED_OPERATIONS]:
+            del _operations[key]
+
+
+@contextlib.contextmanager
+def operation(kind: str, op_id: Optional[str] = None) -> Iterator[Operation]:
+    """操作を登録し、このブロック（と asyncio.to_thread 先）の現在の操作にする。"""
+    op = begin(kind, op_id)
+    token = _current.set(op)
+    try:
+        yield op
+    finally:
+        _current.reset(token)
+        end(op)
+
+
+def get(op_id: str) -> Optional[Operation]:
+    with _lock:
+        return _operations.get(op_id)
 
 
 def start(phase: str, total: int) -> None:
+    op = _op()
     with _lock:
-        _state["active"] = True
-        _state["phase"] = phase
-        _state["current"] = 0
-        _state["total"] = max(0, int(total))
-        _state["started_at"] = time.time()
-        _state["updated_at"] = _state["started_at"]
-        _state["cancel_requested"] = _cancel_event.is_set()
+        state = op.state
+        state["active"] = True
+        state["phase"] = phase
+        state["current"] = 0
+        state["total"] = max(0, int(total))
+        state["started_at"] = time.time()
+        state["updated_at"] = state["started_at"]
+        if op is _default and not op.running:
+            # 操作外の処理は開始のたびに新しいトークンで始める
+            op.cancel_event.clear()
+            op.running = True
+        state["cancel_requested"] = op.cancel_event.is_set()
+        _bump(True)
 
 
 def update(current: int, total: int = None, phase: str = None) -> None:
+    op = _op()
     with _lock:
-        _state["active"] = True
-        if not _state["started_at"]:
-            _state["started_at"] = time.time()
-        _state["current"] = max(0, int(current))
+        state = op.state
+        state["active"] = True
+        if not state["started_at"]:
+            state["started_at"] = time.time()
+        state["current"] = max(0, int(current))
+        phase_changed = phase is not None and phase != state["phase"]
         if total is not None:
-            _state["total"] = max(0, int(total))
+            state["total"] = max(0, int(total))
         if phase is not None:
-            _state["phase"] = phase
-        _state["updated_at"] = time.time()
-        _state["cancel_requested"] = _cancel_event.is_set()
+            state["phase"] = phase
+        state["updated_at"] = time.time()
+        state["cancel_requested"] = op.cancel_event.is_set()
+        _bump(phase_changed)
 
 
 def finish() -> None:
+    op = _op()
     with _lock:
-        _state["active"] = False
-        _state["current"] = _state["total"]
-        _state["updated_at"] = time.time()
-        _state["cancel_requested"] = _cancel_event.is_set()
+        state = op.state
+        state["active"] = False
+        state["current"] = state["total"]
+        state["updated_at"] = time.time()
+        state["cancel_requested"] = op.cancel_event.is_set()
+        if op is _default:
+            op.running = False
+        _bump(True)
+
 
+def _cancel(op: Operation) -> None:
+    # _lock を保持した状態で呼ぶ
+    op.cancel_event.set()
+    state = op.state
+    state["cancel_requested"] = True
+    state["updated_at"] = time.time()
+    if state.get("active") and not str(state.get("phase", "")).startswith("Cancelling"):
+        state["phase"] = f"Cancelling {state.get('phase') or 'operation'}"
+    _bump(True)
 
-def request_cancel() -> None:
-    _cancel_event.set()
+
+def request_cancel(op_id: Optional[str] = None) -> list[str]:
+    """op_id の操作をキャンセルする。省略時は実行中のすべての操作。
+    キャンセルした操作の id を返す。"""
     with _lock:
-        _state["cancel_requested"] = True
-        _state["updated_at"] = time.time()
-        if _state.get("active") and not str(_state.get("phase", "")).startswith("Cancelling"):
-            _state["phase"] = f"Cancelling {_state.get('phase') or 'operation'}"
+        if op_id:
+            targets = [op for op in (_operations.get(op_id),) if op is not None and op.running]
+        else:
+            targets = [op for op in _operations.values() if op.running]
+            if _default.running:
+                targets.append(_default)
+        for op in targets:
+            _cancel(op)
+        return [op.id for op in targets]
 
 
 def clear_cancel() -> None:
-    _cancel_event.clear()
+    op = _op()
+    op.cancel_event.clear()
     with _lock:
-        _state["cancel_requested"] = False
+        if op.state["cancel_requested"]:
+            _bump(True)
+        op.state["cancel_requested"] = False
 
 
 def is_cancelled() -> bool:
-    return _cancel_event.is_set()
+    return _op().is_cancelled()
 
 
 def raise_if_cancelled() -> None:
-    if _cancel_event.is_set():
-        raise OperationCancelled("Operation cancelled")
+    _op().raise_if_cancelled()
 
 
-def snapshot() -> dict:
-    with _lock:
-        snap = dict(_state)
+def current_operation_id() -> Optional[str]:
+    op = _current.get()
+    return op.id if op is not None else None
+
+
+def versions() -> tuple[int, int]:
+    """(version, phase_version)。int の読み出しだけなのでロックは取らない。"""
+    return _version, _phase_version
+
+
+def _snapshot(op: Operation) -> dict:
+    # _lock を保持した状態で呼ぶ
+    snap = dict(op.state)
+    snap["op_id"] = op.id
+    snap["kind"] = op.kind
+    snap["running"] = op.running
     started = snap.get("started_at") or 0.0
     elapsed = max(0.0, snap["updated_at"] - started) if started else 0.0
     snap["elapsed"] = elapsed
     # 残り時間の推定（現在の処理速度から外挿）
     eta = None
+    rate = None
     current = snap.get("current") or 0
     total = snap.get("total") or 0
-    if snap.get("active") and elapsed > 0 and current > 0 and total > current:
+    if snap.get("active") and elapsed > 0 and current > 0:
         rate = current / elapsed  # items per second
-        if rate > 0:
+        if total > current:
             eta = (total - current) / rate
+    snap["rate"] = rate
     snap["eta"] = eta
     return snap
+
+
+def snapshot(op_id: Optional[str] = None) -> Optional[dict]:
+    """op_id の操作の進捗。存在しなければ None。
+
+    省略時は従来の単一ステート互換の形で、最も新しく更新された実行中の操作
+    （なければ最後に更新された操作）を返し、"operations" に実行中の操作の一覧を付ける。"""
+    with _lock:
+        if op_id:
+            op = _operations.get(op_id)
+            if op is None:
+                return None
+            snap = _snapshot(op)
+        else:
+            candidates = [_default, *_operations.values()]
+            running = [op for op in candidates if op.running]
+            primary = max(running or candidates, key=lambda op: op.state["updated_at"])
+            snap = _snapshot(primary)
+            snap["operations"] = [_snapshot(op) for op in running]
+        snap["version"] = _version
+    return snap
@@ -1,13 +1,14 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import asyncio
 from sentence_transformers import SentenceTransformer
 import torch
+import threading
 from threading import Lock
 import os
 import time
-from typing import List, Dict, Optional
-from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Dict, Optional, Union
 from tqdm import tqdm
 import faiss
 import numpy as np
@@ -17,10 +18,10 @@ import sys
 from pathlib import Path
 import json
 import hashlib
-import math
 import re
 import fnmatch
-from collections import Counter
+import bisect
+from collections import OrderedDict
 from pydantic_settings import BaseSettings
 from dotenv import load_dotenv
 import shutil
@@ -37,13 +38,42 @@ OWL_TRAINING_EXAMPLES_FILE = os.environ.get(
     "OWL_TRAINING_EXAMPLES_FILE",
     os.path.join(OWL_TRAINING_LOG_DIR, "agent_training_examples.jsonl"),
 )
+# 設定するとエージェント検索イベントを検索結果ごと JSON Lines に追記する（空なら無効）
+OWL_AGENT_EVENT_LOG = os.environ.get("OWL_AGENT_EVENT_LOG", "")
 
-from extractors import extract_functions
 from indexer import CodeIndexer
+from bm25_index import BM25Index, term_positions, tokenize_for_bm25
+from grep_index import TrigramIndex
+from grep_engine import compile_prefilter, iter_grep_matches
+from symbol_table import SYMBOL_KINDS, SymbolTable
+from hierarchy_index import LEVELS as HIERARCHY_LEVELS, HierarchyIndex
+from embedding_reuse import assemble_embeddings, plan_embedding_reuse
+from file_inventory import (
+    SCOPES as FILE_SCOPES,
+    UNIFIED_FILE_EXT,
+    FileInventory,
+    InventoryCache,
+    index_extensions,
+    language_for_path,
+    normalize_languages,
+)
+from graph_store import GraphStore, strip_legacy_file_graphs
+from extract_pool import iter_extracted
+from diff_fingerprint import diff_state_fingerprint
+from agent_event_store import AgentEventStore
+from job_scheduler import (
+    PRIORITY_BUILD,
+    PRIORITY_BULK,
+    PRIORITY_INTERACTIVE,
+    TERMINAL_STATUSES,
+    Job,
+    JobQueueFull,
+    JobScheduler,
+)
 import progress
 
 # モデル管理を model.py から import
-from model import get_model, get_current_device, cleanup_memory, encode_code, DEFAULT_MODEL, get_device
+from model import get_model, get_current_device, cleanup_memory, encode_code, embedding_queue_stats, DEFAULT_MODEL, get_device
 
 import builtins as _builtins
 
@@ -88,6 +118,9 @@ app = FastAPI()
 # === 設定: バッチサイズなど ===
 class OwlSettings(BaseSettings):
     batch_size: int | str = DEFAULT_BATCH_SIZE
+    job_workers: int = 3  # ジョブスケジューラのワーカースレッド数
+    max_queued_jobs: int = 64  # これを超える待ちジョブは 503 で断る
+    resident_indexes: int = 2  # メモリに残す (ディレクトリ, 拡張子) ごとのインデックス数（統合 "all" と拡張子別を併存させる）
     
     class Config:
         env_prefix = "OWL_"  # 環境変数はOWL_BATCH_SIZEで設定可能
@@ -98,6 +131,8 @@ settings.batch_size = normalize_batch_size(settings.batch_size)
 # リクエスト用の Pydantic モデル
 class EmbedRequest(BaseModel):
     texts: list[str]
+    operation_id: Optional[str] = None
+    wait: bool = True  # False のときはジョブを登録して {"job": ...} をすぐ返す
 
 class IndexStatus(BaseModel):
     directory: str
@@ -108,6 +143,10 @@ class IndexStatus(BaseModel):
 class BuildIndexRequest(BaseModel):
     directory: str
     file_ext: str = ".py"
+    # 進捗 (/index_progress?op=) とキャンセル (/cancel_embedding) の対象を指定する id。省略時はサーバーが採番する
+    operation_id: Optional[str] = None
+    # False のときはジョブを登録して {"job": ...} をすぐ返す。結果は /jobs/{job_id} で取得する
+    wait: bool = True
 
 class SearchFunctionsSimpleRequest(BaseModel):
     directory: str
@@ -117,6 +156,8 @@ class SearchFunctionsSimpleRequest(BaseModel):
     include_files: Optional[List[str]] = None
     include_globs: Optional[List[str]] = None
     exclude_globs: Optional[List[str]] = None
+    # 統合インデックス (file_ext="all") 内で言語を絞り込む（"python" や ".ts" など）
+    languages: Optional[List[str]] = None
     search_mode: str = "semantic"
     semantic_weight: float = 0.75
     capture_agent_event: bool = False
@@ -129,6 +170,18 @@ class SearchFunctionsSimpleRequest(BaseModel):
     diff_base_ref: Optional[str] = None
     diff_head_ref: Optional[str] = None
     force_diff_refresh: bool = False
+    # "file" / "class": 近いファイル・クラスを先に選び、そのメンバーだけを順位付けする
+    hierarchical: Optional[str] = None
+    hierarchy_candidates: int = 0  # 0 のときは max(8, top_k)
+    operation_id: Optional[str] = None
+
+class SearchBatchRequest(SearchFunctionsSimpleRequest):
+    query: str = ""
+    # 文字列、または {"query": ..., "scope": ..., "include_globs": [...]} のように共通フィールドを上書きする dict
+    queries: List[Union[str, Dict[str, Any]]] = []
+    # 全クエリの結果を reciprocal rank fusion で重複なくまとめた "merged" を返す
+    fuse: bool = False
+    fused_top_k: int = 0  # 0 のときは top_k
 
 class PrepareDiffSearchRequest(BaseModel):
     directory: str
@@ -142,6 +195,12 @@ class PrepareDiffSearchRequest(BaseModel):
     diff_base_ref: Optional[str] = None
     diff_head_ref: Optional[str] = None
     force: bool = False
+    operation_id: Optional[str] = None
+    wait: bool = True
+
+class CancelRequest(BaseModel):
+    # 省略時は実行中のすべての操作をキャンセルする
+    operation_id: Optional[str] = None
 
 class AgentSearchFeedbackRequest(BaseModel):
     event_id: int
@@ -175,6 +234,23 @@ class FunctionRangeRequest(BaseModel):
     file: str
     func_name: str
 
+# シンボル表検索用のリクエストモデル
+class SymbolsRequest(BaseModel):
+    directory: str
+    file_ext: str = ".py"
+    query: str = ""
+    mode: str = "prefix"  # "prefix" | "fuzzy" | "exact"
+    kinds: Optional[List[str]] = None  # SYMBOL_KINDS の部分集合
+    file: Optional[str] = None  # 指定時はそのファイルのアウトラインのみ
+    limit: int = 200
+
+# 呼び出しグラフ・import 依存取得用のリクエストモデル
+class CallGraphRequest(BaseModel):
+    directory: str
+    file_ext: str = ".py"
+    file: Optional[str] = None  # 指定時はそのファイルの call_graph / import_dependency
+    name: Optional[str] = None  # 指定時はその関数の呼び出し元・呼び出し先
+
 # クラス統計表示用のリクエストモデル
 class ClassStatsRequest(BaseModel):
     directory: str
@@ -188,13 +264,22 @@ class ClassStatsRequest(BaseModel):
 # サーバー全体で1つのインデックスを保持
 index_lock = Lock()
 diff_search_lock = Lock()
+# 重い処理はジョブとして実行する。資源 "index"（常駐インデックス）/"diff"（差分 hunk インデックス）/
+# "embed"（/embed の一括埋め込み）ごとに 1 件ずつ、優先度の高い順（検索 > 構築 > 一括埋め込み）に動かす
+job_scheduler = JobScheduler(workers=settings.job_workers, max_queued=settings.max_queued_jobs)
 agent_event_lock = Lock()
-agent_search_events: list[dict] = []
 agent_search_feedback: list[dict] = []
 agent_search_usage: list[dict] = []
 MAX_AGENT_SEARCH_EVENTS = 100
 MAX_AGENT_SEARCH_FEEDBACK = 100
 MAX_AGENT_SEARCH_USAGE = 100
+# コード付きの検索結果をメモリに残す直近イベント数。それより古いイベントは結果の参照（位置・スコア・コードのハッシュ）だけを持つ
+AGENT_FULL_RESULT_EVENTS = 20
+agent_event_store = AgentEventStore(
+    max_events=MAX_AGENT_SEARCH_EVENTS,
+    full_result_events=AGENT_FULL_RESULT_EVENTS,
+    log_path=OWL_AGENT_EVENT_LOG,
+)
 
 
 def result_identity(result: dict) -> str:
@@ -222,7 +307,7 @@ def training_result_payload(result: dict) -> dict:
         "bm25_score": result.get("bm25_score"),
         "hybrid_score": result.get("hybrid_score"),
         "distance": result.get("distance"),
-        "code_sha256": hashlib.sha256(code.encode("utf-8")).hexdigest() if code else None,
+        "code_sha256": hashlib.sha256(code.encode("utf-8")).hexdigest() if code else result.get("code_sha256"),
         "code": code,
     }
 
@@ -403,27 +488,10 @@ def append_training_examples_for_usage(event: dict, usage: dict) -> int:
 
 
 def find_agent_search_event(event_id: int) -> Optional[dict]:
-    for event in agent_search_events:
-        if event.get("id") == event_id:
-            return event
-    return None
+    return agent_event_store.get(event_id)
 
 def append_agent_search_event(event: dict) -> dict:
-    with agent_event_lock:
-        next_id = (agent_search_events[-1]["id"] + 1) if agent_search_events else 1
-        stored = {"id": next_id, "created_at": time.time(), **event}
-        agent_search_events.append(stored)
-        parent_id = stored.get("parent_event_id")
-        if isinstance(parent_id, int):
-            for parent in agent_search_events:
-                if parent.get("id") == parent_id:
-                    children = parent.setdefault("child_event_ids", [])
-                    if stored["id"] not in children:
-                        children.append(stored["id"])
-                    break
-        if len(agent_search_events) > MAX_AGENT_SEARCH_EVENTS:
-            del agent_search_events[:-MAX_AGENT_SEARCH_EVENTS]
-        return stored
+    return agent_event_store.append(event)
 
 def append_agent_search_feedback(feedback: dict) -> dict:
     with agent_event_lock:
@@ -441,24 +509,17 @@ def append_agent_search_usage(usage: dict) -> dict:
         agent_search_usage.append(stored)
         if len(agent_search_usage) > MAX_AGENT_SEARCH_USAGE:
             del agent_search_usage[:-MAX_AGENT_SEARCH_USAGE]
-        for event in agent_search_events:
-            if event.get("id") == stored.get("event_id"):
-                reports = event.setdefault("usage_reports", [])
-                reports.append(stored)
-                event["referenced_ranks"] = sorted({
-                    int(rank)
-                    for report in reports
-                    for rank in report.get("referenced_ranks", [])
-                    if isinstance(rank, int) or str(rank).isdigit()
-                })
-                event["referenced_locations"] = sorted({
-                    str(location)
-                    for report in reports
-                    for location in report.get("referenced_locations", [])
-                    if location
-                })
-                break
-        return stored
+    agent_event_store.add_usage(stored)
+    return stored
+
+def repo_index_root(directory: str) -> str:
+    """Per-repository cache directory inside model_server/.owl_index. The
+    directory name plus a hash of its absolute path keeps entries unique."""
+    dir_hash = hashlib.md5(os.path.abspath(directory).encode()).hexdigest()[:16]
+    safe_dir = os.path.basename(os.path.abspath(directory))
+    model_server_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(model_server_dir, OWL_INDEX_DIR, f"{safe_dir}_{dir_hash}")
+
 
 # インデックス情報を保持するクラス
 class GlobalIndexerState:
@@ -473,6 +534,9 @@ class GlobalIndexerState:
         self.index_dir = None  # ディレクトリごとに動的に設定
         self.model_name: Optional[str] = None  # 追加: インデックス構築に使用したモデル名
         self.model_config: dict = {}  # 追加: モデル構成情報
+        self.symbols: Optional[SymbolTable] = None  # クラス/メソッド/関数のシンボル表
+        self.hierarchy: Optional[HierarchyIndex] = None  # ファイル/クラス単位の平均埋め込み
+        self.graphs: Optional[GraphStore] = None  # ファイルごとの call_graph / import_dependency
 
     def get_current_model_config(self) -> dict:
         # Add new config keys here as needed for extensibility
@@ -483,14 +547,8 @@ class GlobalIndexerState:
         }
 
     def set_index_dir(self, directory: str, file_ext: str = ".py"):
-        # Hash the directory name to make it unique
-        import hashlib
-        dir_hash = hashlib.md5(os.path.abspath(directory).encode()).hexdigest()[:16]
-        safe_dir = os.path.basename(os.path.abspath(directory))
         ext_dir = file_ext.lstrip(".")
-        # Create index inside model_server (avoid duplication by using directory name + hash)
-        model_server_dir = os.path.dirname(os.path.abspath(__file__))
-        self.index_dir = os.path.join(model_server_dir, OWL_INDEX_DIR, f"{safe_dir}_{dir_hash}", ext_dir)
+        self.index_dir = os.path.join(repo_index_root(directory), ext_dir)
         # Directory creation is only done on save (not on startup)
 
     def is_up_to_date(self, directory: Optional[str] = None) -> bool:
@@ -529,18 +587,10 @@ class GlobalIndexerState:
             return False
         # Detect newly added files that match the target extension and are not ignored
         try:
-            for root, dirs, files in os.walk(scan_dir):
-                # Respect .gitignore for directories
-                dirs[:] = [d for d in dirs if not is_ignored(os.path.join(root, d), spec, scan_dir)]
-                for fname in files:
-                    if not fname.endswith(self.file_ext):
-                        continue
-                    fpath = os.path.join(root, fname)
-                    if is_ignored(fpath, spec, scan_dir):
-                        continue
-                    if fpath not in self.file_info:
-                        print(f"[is_up_to_date] New file detected: {fpath}")
-                        return False
+            for fpath in iter_index_source_files(scan_dir, self.file_ext, spec):
+                if fpath not in self.file_info:
+                    print(f"[is_up_to_date] New file detected: {fpath}")
+                    return False
         except Exception as e:
             # Be conservative: if scanning fails, treat as outdated to force rebuild
             print(f"[is_up_to_date] Error while scanning for new files: {e}")
@@ -558,6 +608,9 @@ class GlobalIndexerState:
         self.last_indexed = 0.0
         self.model_name = None
         self.model_config = {}
+        self.symbols = None
+        self.hierarchy = None
+        self.graphs = None
         if clear_disk and self.index_dir and os.path.exists(self.index_dir):
             shutil.rmtree(self.index_dir, ignore_errors=True)
 
@@ -607,6 +660,12 @@ class GlobalIndexerState:
         # faiss
         if self.faiss_index is not None:
             _atomic_faiss_save(self.faiss_index, os.path.join(self.index_dir, "faiss.index"))
+        # Symbol table
+        if self.symbols is not None:
+            self.symbols.save(os.path.join(self.index_dir, "symbols.npz"))
+        # Per-file call graphs
+        if self.graphs is not None:
+            self.graphs.save(os.path.join(self.index_dir, "graphs.json"))
         # Other meta
         meta = {
             "file_info": self.file_info,
@@ -634,12 +693,16 @@ class GlobalIndexerState:
             self.file_ext = ".py"
             self.model_name = None
             self.model_config = {}
+            self.symbols = None
+            self.graphs = None
             return
         print(f"[load] Loading disk cache: {self.index_dir}")
         loaded_items = []
         try:
             with open(os.path.join(self.index_dir, "functions.json"), "r", encoding="utf-8") as f:
                 functions = json.load(f)
+            # 旧形式: ファイル全体の call_graph が各関数に複製されていたので取り除く
+            strip_legacy_file_graphs(functions)
             self.indexer = CodeIndexer()
             self.indexer.add_functions_without_embedding(functions)  # Add function list only, no embedding calculation
             loaded_items.append(f"functions({len(functions)})")
@@ -658,6 +721,18 @@ class GlobalIndexerState:
         except Exception as e:
             print(f"[load] Failed to load faiss.index: {e}")
             self.faiss_index = None
+        # 階層ベクトルは埋め込みから安価に再計算できるので保存せず、必要時に構築する
+        self.hierarchy = None
+        self.symbols = SymbolTable.load(os.path.join(self.index_dir, "symbols.npz"))
+        if self.symbols is None and self.indexer is not None:
+            self.symbols = SymbolTable.from_functions(self.indexer.functions)
+        if self.symbols is not None:
+            loaded_items.append(f"symbols({len(self.symbols)})")
+        self.graphs = GraphStore.load(os.path.join(self.index_dir, "graphs.json"))
+        if self.graphs is None and self.indexer is not None:
+            self.graphs = GraphStore.from_functions(self.indexer.functions)
+        if self.graphs is not None:
+            loaded_items.append(f"graphs({len(self.graphs)} files)")
         try:
             with open(os.path.join(self.index_dir, "meta.json"), "r", encoding="utf-8") as f:
                 meta = json.load(f)
@@ -682,6 +757,52 @@ class GlobalIndexerState:
             print("[load] Failed to load any cache files")
 
 global_index_state = GlobalIndexerState()
+# 使用中でない常駐インデックス（新しい順に末尾）。auto 検索の統合インデックス "all" と
+# サイドバーの拡張子別インデックスを交互に使っても、互いをディスクから読み直さずに済むようにする
+inactive_index_states: "OrderedDict[tuple[str, str], GlobalIndexerState]" = OrderedDict()
+inactive_index_lock = Lock()
+
+
+def activate_index_state(directory: str, file_ext: str) -> GlobalIndexerState:
+    """(directory, file_ext) の常駐インデックスを global_index_state にする。index_lock を保持して呼ぶ。
+    使用中だった状態は settings.resident_indexes 件まで控えに残し、それより古いものはメモリから外す。"""
+    global global_index_state
+    key = (os.path.abspath(directory), file_ext)
+    current = global_index_state
+    if (current.directory, current.file_ext) == key:
+        return current
+    with inactive_index_lock:
+        if current.indexer is not None and current.directory:
+            inactive_index_states[(current.directory, current.file_ext)] = current
+            inactive_index_states.move_to_end((current.directory, current.file_ext))
+        state = inactive_index_states.pop(key, None)
+        while len(inactive_index_states) > max(0, settings.resident_indexes - 1):
+            inactive_index_states.popitem(last=False)
+        global_index_state = state if state is not None else GlobalIndexerState()
+    return global_index_state
+
+
+def resident_index_state(directory: str, file_ext: str) -> Optional[GlobalIndexerState]:
+    """使用中か控えにある (directory, file_ext) の常駐インデックス。なければ None。"""
+    key = (os.path.abspath(directory), file_ext)
+    current = global_index_state
+    if current.indexer is not None and (current.directory, current.file_ext) == key:
+        return current
+    with inactive_index_lock:
+        return inactive_index_states.get(key)
+
+
+def resident_hierarchy() -> Optional[HierarchyIndex]:
+    """File/class vectors for the resident index, pooled on first use after a
+    disk load."""
+    state = global_index_state
+    if state.indexer is None or state.embeddings is None or len(state.indexer.functions) != state.embeddings.shape[0]:
+        return None
+    if state.hierarchy is None:
+        hierarchy = HierarchyIndex()
+        hierarchy.update(state.indexer.functions, state.embeddings)
+        state.hierarchy = hierarchy
+    return state.hierarchy
 # サーバー起動時は自動ロードを行わない（メモリキャッシュ優先、必要時のみディスクアクセス）
 
 
@@ -699,6 +820,18 @@ class DiffSearchState:
         self.last_prepared: float = 0.0
         self.index_embedding_ms: float = 0.0
         self.hunk_build_ms: float = 0.0
+        # Commit grouping of the units, computed once per prepared diff so each
+        # query can max-pool file scores into commit scores with segment
+        # reductions. `commit_perm` orders unit indices so each commit's units
+        # are contiguous; `commit_starts` are the segment offsets into it.
+        self.commit_keys: list[str] = []
+        self.unit_commit: np.ndarray = np.zeros(0, dtype=np.int64)
+        self.commit_perm: np.ndarray = np.zeros(0, dtype=np.int64)
+        self.commit_starts: np.ndarray = np.zeros(0, dtype=np.int64)
+        self.commit_units: list[list[int]] = []
+        self.unit_file_entries: list[dict] = []
+        # BM25 over one commit message per commit, built once per prepared diff.
+        self.commit_bm25: Optional[BM25Index] = None
 
     def clear_embeddings(self):
         self.embedding_signature = ""
@@ -714,10 +847,113 @@ class DiffSearchState:
         self.hunk_build_ms = hunk_build_ms
         self.last_prepared = time.time()
         self.clear_embeddings()
+        self.commit_bm25 = None
+        self._index_commits()
+
+    def _index_commits(self):
+        key_to_commit: dict[str, int] = {}
+        self.commit_keys = []
+        self.commit_units = []
+        unit_commit = []
+        self.unit_file_entries = []
+        for idx, unit in enumerate(self.units):
+            key = unit.get("commit_hash") or unit.get("commit_subject") or f"__file__{unit.get('file_path')}"
+            commit_index = key_to_commit.get(key)
+            if commit_index is None:
+                commit_index = len(self.commit_keys)
+                key_to_commit[key] = commit_index
+                self.commit_keys.append(key)
+                self.commit_units.append([])
+            self.commit_units[commit_index].append(idx)
+            unit_commit.append(commit_index)
+            self.unit_file_entries.append({
+                "path": unit.get("path"),
+                "file_path": unit.get("file_path"),
+                "lineno": unit.get("lineno"),
+                "additions": unit.get("additions") or 0,
+                "deletions": unit.get("deletions") or 0,
+                "hunk_count": unit.get("file_hunk_count") or 1,
+            })
+        self.unit_commit = np.asarray(unit_commit, dtype=np.int64)
+        self.commit_perm = np.argsort(self.unit_commit, kind="stable")
+        sizes = np.asarray([len(members) for members in self.commit_units], dtype=np.int64)
+        self.commit_starts = np.concatenate(([0], np.cumsum(sizes)[:-1])).astype(np.int64) if len(sizes) else sizes
 
 
 diff_search_state = DiffSearchState()
 
+
+class CommitMessageStore:
+    """Tokenized commit messages of one repository keyed by commit hash and
+    persisted next to its index, so the commit-message BM25 index of any ref
+    range reuses every message seen before instead of re-tokenizing it."""
+
+    FILE_NAME = "commit_messages.json"
+
+    def __init__(self, path: str):
+        self.path = path
+        self.commits: dict[str, dict] = {}
+        self.dirty = False
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self.commits = json.load(f).get("commits", {})
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"[commit_messages] Failed to load {path}: {e}")
+
+    def terms_for(self, commit_hash: str, message: str) -> tuple[dict[str, list[int]], int]:
+        entry = self.commits.get(commit_hash) if commit_hash else None
+        if entry is None:
+            tokens = tokenize_for_bm25(message)
+            entry = {"length": len(tokens), "terms": term_positions(tokens)}
+            if commit_hash:
+                self.commits[commit_hash] = entry
+                self.dirty = True
+        return entry["terms"], entry["length"]
+
+    def save(self):
+        if not self.dirty:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"version": 1, "commits": self.commits}, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+            self.dirty = False
+        except Exception as e:
+            print(f"[commit_messages] Failed to save {self.path}: {e}")
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+
+commit_message_stores: dict[str, CommitMessageStore] = {}
+commit_message_store_lock = Lock()
+
+
+def commit_message_index(directory: str, state: DiffSearchState) -> BM25Index:
+    """BM25 index over the prepared diff's commit messages (one document per
+    commit, in `state.commit_keys` order), built once per prepared diff."""
+    if state.commit_bm25 is not None:
+        return state.commit_bm25
+    root = repo_index_root(directory)
+    with commit_message_store_lock:
+        store = commit_message_stores.get(root)
+        if store is None:
+            store = CommitMessageStore(os.path.join(root, CommitMessageStore.FILE_NAME))
+            commit_message_stores[root] = store
+        documents = []
+        lengths = []
+        for members in state.commit_units:
+            unit = state.units[members[0]]
+            terms, length = store.terms_for(unit.get("commit_hash") or "", unit.get("commit_message") or "")
+            documents.append(terms)
+            lengths.append(length)
+        store.save()
+    state.commit_bm25 = BM25Index.from_term_positions(documents, lengths)
+    return state.commit_bm25
+
 def load_gitignore_spec(root_dir: str) -> Optional[PathSpec]:
     """
     指定ディレクトリ直下の .gitignore と .owlignore を読み込み、Git の
@@ -744,6 +980,27 @@ def is_ignored(path: str, spec: Optional[PathSpec], root_dir: str) -> bool:
     rel_path = os.path.relpath(path, root_dir)
     return spec.match_file(rel_path)
 
+# 統合インデックスは全言語を対象にするので、.gitignore に書かれていない依存物・生成物も除外する
+UNIFIED_INDEX_SKIP_DIRS = {".git", ".owl_index", ".venv", "__pycache__", "node_modules", "dist", "build", "out"}
+
+
+def iter_index_source_files(directory: str, file_ext: str, spec: Optional[PathSpec]):
+    """インデックス対象のファイルを os.walk 順に返す。file_ext が "all" なら対応拡張子すべて。"""
+    extensions = index_extensions(file_ext)
+    unified = file_ext == UNIFIED_FILE_EXT
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = [
+            d for d in dirs
+            if not (unified and d in UNIFIED_INDEX_SKIP_DIRS) and not is_ignored(os.path.join(root, d), spec, directory)
+        ]
+        for fname in files:
+            if not fname.endswith(extensions):
+                continue
+            fpath = os.path.join(root, fname)
+            if is_ignored(fpath, spec, directory):
+                continue
+            yield fpath
+
 def repo_visible_files(root_dir: str, spec: Optional[PathSpec]) -> list[str]:
     root = Path(root_dir).resolve()
     files: list[str] = []
@@ -784,6 +1041,48 @@ def repo_visible_files(root_dir: str, spec: Optional[PathSpec]) -> list[str]:
     return files
 
 
+def working_tree_changed_files(root_dir: str) -> list[str]:
+    """Files added/modified against HEAD plus untracked files, skipping ignored ones."""
+    root = Path(root_dir).resolve()
+    spec = load_gitignore_spec(str(root))
+    files: list[str] = []
+    seen: set[str] = set()
+    for args in (
+        ["git", "diff", "--name-only", "--diff-filter=ACMR", "HEAD"],
+        ["git", "ls-files", "--others", "--exclude-standard"],
+    ):
+        try:
+            output = subprocess.check_output(args, cwd=str(root), text=True, stderr=subprocess.DEVNULL)
+        except Exception:
+            continue
+        for line in output.splitlines():
+            rel_path = line.strip()
+            if not rel_path:
+                continue
+            path = (root / rel_path).resolve()
+            try:
+                path.relative_to(root)
+            except ValueError:
+                continue
+            file_path = str(path)
+            if file_path in seen or not path.is_file() or is_ignored(file_path, spec, str(root)):
+                continue
+            seen.add(file_path)
+            files.append(file_path)
+    return files
+
+
+# リポジトリごとのファイル一覧と拡張子ヒストグラム（git のメタ情報が変わるか TTL 切れで再取得）
+repo_inventories = InventoryCache(
+    lambda root: repo_visible_files(root, load_gitignore_spec(root)),
+    working_tree_changed_files,
+)
+
+
+def repo_inventory(directory: str, need_changed: bool = False) -> FileInventory:
+    return repo_inventories.get(str(Path(directory).resolve()), need_changed)
+
+
 def normalize_search_target(value: Optional[str]) -> str:
     target = (value or "functions").strip().lower()
     if target in {"changed_functions", "changed_function", "changed_funcs", "changed_func"}:
@@ -1081,7 +1380,7 @@ def collect_diff_hunks(
     new_line = 0
 
     def path_allowed(rel_path: Optional[str]) -> bool:
-        if not rel_path or not rel_path.endswith(file_ext):
+        if not rel_path or not rel_path.endswith(index_extensions(file_ext)):
             return False
         file_path = str((root / rel_path).resolve())
         if include_file_set and file_path not in include_file_set:
@@ -1214,7 +1513,67 @@ def collect_diff_hunks(
         flush_hunk()
     return hunks, len(files_seen), base_ref, head_ref
 
-def grep_repo_files(
+
+grep_indexes: dict[str, TrigramIndex] = {}
+grep_indexes_lock = Lock()
+
+
+def grep_index_for(directory: str) -> TrigramIndex:
+    root = str(Path(directory).resolve())
+    with grep_indexes_lock:
+        index = grep_indexes.get(root)
+        if index is None:
+            index = TrigramIndex(os.path.join(repo_index_root(root), "grep_trigrams.npz"))
+            grep_indexes[root] = index
+        return index
+
+
+def refresh_grep_index(directory: str, files: Optional[list[str]] = None, persist: bool = False) -> TrigramIndex:
+    """Bring the repository's trigram index up to date with the visible files;
+    only new or modified files (by size/mtime) are re-read."""
+    index = grep_index_for(directory)
+    if files is None:
+        files = repo_visible_files(str(Path(directory).resolve()), load_gitignore_spec(directory))
+    index.refresh(files)
+    if persist:
+        index.save()
+    return index
+
+
+def grep_candidate_paths(directory: str, files: list[str], pattern: str, regex: bool, case_sensitive: bool) -> Optional[set[str]]:
+    """Files that can contain a match according to the trigram index, or None
+    when the pattern has no usable literal (or the index failed) and every
+    file has to be scanned."""
+    try:
+        return refresh_grep_index(directory, files).candidate_paths(pattern, regex, case_sensitive)
+    except Exception as e:
+        print(f"[grep_index] Falling back to a full scan: {e}")
+        return None
+
+
+def grep_scan_files(
+    directory: str,
+    pattern: str,
+    regex: bool,
+    case_sensitive: bool,
+    include_globs: Optional[List[str]] = None,
+    exclude_globs: Optional[List[str]] = None,
+) -> list[str]:
+    """Visible files, in repository order, that a grep has to scan: narrowed by
+    the trigram index and filtered by the include/exclude globs."""
+    spec = load_gitignore_spec(directory)
+    root = str(Path(directory).resolve())
+    files = repo_visible_files(root, spec)
+    candidates = grep_candidate_paths(root, files, pattern, regex, case_sensitive)
+    return [
+        file_path
+        for file_path in files
+        if (candidates is None or file_path in candidates)
+        and path_allowed_by_globs(file_path, root, include_globs, exclude_globs)
+    ]
+
+
+def iter_grep_repo_matches(
     directory: str,
     pattern: str,
     regex: bool,
@@ -1222,43 +1581,38 @@ def grep_repo_files(
     max_matches: int,
     include_globs: Optional[List[str]] = None,
     exclude_globs: Optional[List[str]] = None,
-) -> list[dict]:
+    cancel_event: Optional[threading.Event] = None,
+):
+    """Yield grep matches in repository order. Raises re.error for an invalid
+    pattern before any file is read."""
     if not pattern:
-        return []
+        return iter(())
     flags = 0 if case_sensitive else re.IGNORECASE
     compiled = re.compile(pattern if regex else re.escape(pattern), flags)
-    spec = load_gitignore_spec(directory)
-    root = Path(directory).resolve()
-    matches: list[dict] = []
-    for file_path in repo_visible_files(str(root), spec):
-        if not path_allowed_by_globs(file_path, str(root), include_globs, exclude_globs):
-            continue
-        try:
-            raw = Path(file_path).read_bytes()
-        except Exception:
-            continue
-        if b"\0" in raw[:4096]:
-            continue
-        try:
-            text = raw.decode("utf-8")
-        except UnicodeDecodeError:
-            try:
-                text = raw.decode("utf-8", errors="replace")
-            except Exception:
-                continue
-        for line_number, line in enumerate(text.splitlines(), start=1):
-            if not compiled.search(line):
-                continue
-            rel_path = os.path.relpath(file_path, root)
-            matches.append({
-                "file": file_path,
-                "path": rel_path,
-                "line": line_number,
-                "text": line[:500],
-            })
-            if len(matches) >= max_matches:
-                return matches
-    return matches
+    root = str(Path(directory).resolve())
+    files = grep_scan_files(root, pattern, regex, case_sensitive, include_globs, exclude_globs)
+    prefilter = compile_prefilter(pattern, regex, case_sensitive)
+    return iter_grep_matches(root, files, compiled, prefilter, max_matches, cancel_event=cancel_event)
+
+
+def grep_repo_files(
+    directory: str,
+    pattern: str,
+    regex: bool,
+    case_sensitive: bool,
+    max_matches: int,
+    include_globs: Optional[List[str]] = None,
+    exclude_globs: Optional[List[str]] = None,
+) -> list[dict]:
+    return list(iter_grep_repo_matches(
+        directory,
+        pattern,
+        regex,
+        case_sensitive,
+        max_matches,
+        include_globs,
+        exclude_globs,
+    ))
 
 # ファイルのハッシュ計算関数
 def file_hash(path):
@@ -1272,13 +1626,6 @@ def file_hash(path):
     return h.hexdigest()
 
 
-_TOKEN_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+")
-
-
-def tokenize_for_bm25(text: str) -> list[str]:
-    return [token.lower() for token in _TOKEN_PATTERN.findall(text)]
-
-
 def normalize_scores(scores: dict[int, float]) -> dict[int, float]:
     if not scores:
         return {}
@@ -1290,69 +1637,75 @@ def normalize_scores(scores: dict[int, float]) -> dict[int, float]:
     return {index: (score - min_score) / (max_score - min_score) for index, score in scores.items()}
 
 
-def _bm25_scores(documents: list[list[str]], query: str) -> dict[int, float]:
-    """Okapi BM25 of the query against pre-tokenized documents, keyed by index."""
-    query_tokens = tokenize_for_bm25(query)
-    if not query_tokens or not documents:
-        return {}
-    doc_freq: Counter[str] = Counter()
-    term_freqs: list[Counter[str]] = []
-    doc_lengths: list[int] = []
-    for tokens in documents:
-        tf = Counter(tokens)
-        term_freqs.append(tf)
-        doc_lengths.append(len(tokens))
-        doc_freq.update(tf.keys())
-
-    avg_doc_length = sum(doc_lengths) / len(doc_lengths) if doc_lengths else 0.0
-    if avg_doc_length <= 0:
-        return {}
+def function_bm25_terms(func: dict) -> dict[str, list[int]]:
+    if func.get("result_type") == "diff_hunk" and func.get("search_text") is not None:
+        return term_positions(tokenize_for_bm25(str(func.get("search_text") or "")))
+    name = func.get("name", "")
+    function_name = func.get("function_name", "")
+    file_path = func.get("file_path") or func.get("file", "")
+    source_code = func.get("raw_code") or func.get("code", "")
+    parts = [
+        name,
+        function_name if function_name != name else "",
+        func.get("class_name", ""),
+        func.get("symbol_kind", ""),
+        file_path,
+        os.path.basename(str(file_path)) if file_path else "",
+        source_code,
+        json.dumps(func.get("python_static", {}), ensure_ascii=False),
+    ]
+    return term_positions(tokenize_for_bm25("\n".join(str(part) for part in parts if part)))
+
+
+class FunctionBM25Documents:
+    """Tokenized BM25 documents of one function list, built once and reused
+    while that list stays resident (the warm index returns the same list)."""
+
+    def __init__(self, functions: list[dict]):
+        self.functions = functions
+        self.terms = [function_bm25_terms(func) for func in functions]
+        self.lengths = [sum(len(positions) for positions in terms.values()) for terms in self.terms]
+        self.row_by_id = {id(func): row for row, func in enumerate(functions)}
+        self._index: Optional[BM25Index] = None
+
+    def index_for(self, functions: list[dict]) -> BM25Index:
+        """Non-positional index over `functions`: the cached one for the whole
+        list, else one assembled from the cached documents of the subset."""
+        if functions is self.functions:
+            if self._index is None:
+                self._index = BM25Index.from_term_positions(self.terms, self.lengths, store_positions=False)
+            return self._index
+        terms, lengths = [], []
+        for func in functions:
+            row = self.row_by_id.get(id(func))
+            if row is None:
+                func_terms = function_bm25_terms(func)
+                terms.append(func_terms)
+                lengths.append(sum(len(positions) for positions in func_terms.values()))
+            else:
+                terms.append(self.terms[row])
+                lengths.append(self.lengths[row])
+        return BM25Index.from_term_positions(terms, lengths, store_positions=False)
 
-    k1 = 1.5
-    b = 0.75
-    scores: dict[int, float] = {}
-    total_docs = len(documents)
-    for index, tf in enumerate(term_freqs):
-        doc_length = doc_lengths[index]
-        score = 0.0
-        for token in query_tokens:
-            freq = tf.get(token, 0)
-            if freq <= 0:
-                continue
-            df = doc_freq.get(token, 0)
-            idf = math.log(1 + ((total_docs - df + 0.5) / (df + 0.5)))
-            denom = freq + k1 * (1 - b + b * (doc_length / avg_doc_length))
-            score += idf * ((freq * (k1 + 1)) / denom)
-        if score > 0:
-            scores[index] = score
-    return scores
 
+function_bm25_cache: Optional[FunctionBM25Documents] = None
 
-def bm25_search_scores(functions: list[dict], query: str) -> dict[int, float]:
+
+def bm25_search_scores(functions: list[dict], query: str, corpus: Optional[list[dict]] = None) -> dict[int, float]:
+    """Okapi BM25 of the plain query terms against `functions`, keyed by index.
+    `corpus` is the full function list `functions` was scoped from; its
+    tokenized documents are cached across queries. Function search does not
+    apply the phrase/prefix operators of the commit-message index."""
+    global function_bm25_cache
     query_tokens = tokenize_for_bm25(query)
-    if not query_tokens:
+    if not query_tokens or not functions:
         return {}
-    documents = []
-    for func in functions:
-        if func.get("result_type") == "diff_hunk" and func.get("search_text") is not None:
-            documents.append(tokenize_for_bm25(str(func.get("search_text") or "")))
-            continue
-        name = func.get("name", "")
-        function_name = func.get("function_name", "")
-        file_path = func.get("file_path") or func.get("file", "")
-        source_code = func.get("raw_code") or func.get("code", "")
-        parts = [
-            name,
-            function_name if function_name != name else "",
-            func.get("class_name", ""),
-            func.get("symbol_kind", ""),
-            file_path,
-            os.path.basename(str(file_path)) if file_path else "",
-            source_code,
-            json.dumps(func.get("python_static", {}), ensure_ascii=False),
-        ]
-        documents.append(tokenize_for_bm25("\n".join(str(part) for part in parts if part)))
-    return _bm25_scores(documents, query)
+    corpus = functions if corpus is None else corpus
+    cached = function_bm25_cache
+    if cached is None or cached.functions is not corpus:
+        cached = FunctionBM25Documents(corpus)
+        function_bm25_cache = cached
+    return cached.index_for(functions).term_scores(query_tokens)
 
 
 def searchable_function_text(func: dict) -> str:
@@ -1469,6 +1822,147 @@ def diff_result_for_target(hunk: dict, search_target: str) -> dict:
     return item
 
 
+class ChangedLineIndex:
+    """Changed line ranges of one file, merged into sorted disjoint intervals so
+    an overlap test is a single bisect instead of a scan over every hunk."""
+
+    __slots__ = ("starts", "ends")
+
+    def __init__(self, ranges: list[tuple[int, int]]):
+        merged: list[list[int]] = []
+        for start, end in sorted((int(a), int(b)) for a, b in ranges):
+            if end < start:
+                start, end = end, start
+            if merged and start <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        self.starts = [start for start, _end in merged]
+        self.ends = [end for _start, end in merged]
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def overlaps(self, start: int, end: int) -> bool:
+        # Intervals are disjoint, so ends are sorted as well: the first interval
+        # ending at/after `start` is the only candidate for an overlap.
+        pos = bisect.bisect_left(self.ends, start)
+        return pos < len(self.starts) and self.starts[pos] <= end
+
+
+def build_changed_line_index(hunks: list[dict]) -> dict[str, ChangedLineIndex]:
+    """Per absolute file path, the lines (in head/working-tree coordinates)
+    changed by the collected hunks."""
+    ranges: dict[str, list[tuple[int, int]]] = {}
+    for hunk in hunks:
+        path = os.path.abspath(str(hunk.get("file_path") or hunk.get("file") or ""))
+        if not path:
+            continue
+        bucket = ranges.setdefault(path, [])
+        added = hunk.get("added_ranges") or []
+        if added:
+            for pair in added:
+                bucket.append((int(pair[0]), int(pair[1])))
+        else:
+            # Deletion-only hunk: anchor on the surrounding line so the enclosing
+            # function is still treated as changed.
+            anchor = int(hunk.get("lineno") or 1)
+            bucket.append((anchor, anchor))
+    return {path: ChangedLineIndex(bucket) for path, bucket in ranges.items()}
+
+
+class DiffHunkCache:
+    """Signature-keyed cache of collected diff hunks shared by the
+    `changed_functions` and `diff_hunks` targets. Each entry keeps the hunks,
+    the per-file `ChangedLineIndex` and (lazily) the per-file diff units."""
+
+    def __init__(self, max_entries: int = 8):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, signature: str, fingerprint: Optional[str] = None) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(signature)
+            if entry is None:
+                return None
+            if fingerprint is not None and entry["fingerprint"] != fingerprint:
+                del self._entries[signature]
+                return None
+            self._entries.move_to_end(signature)
+            return entry
+
+    def put(self, signature: str, entry: dict) -> None:
+        with self._lock:
+            self._entries[signature] = entry
+            self._entries.move_to_end(signature)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+diff_hunk_cache = DiffHunkCache()
+
+
+def cached_diff_hunks(
+    directory: str,
+    file_ext: str,
+    include_files: Optional[List[str]],
+    include_globs: Optional[List[str]],
+    exclude_globs: Optional[List[str]],
+    diff_base_ref: Optional[str],
+    diff_head_ref: Optional[str],
+    force: bool = False,
+) -> tuple[dict, bool]:
+    """Return (entry, cache_hit) for the selected diff. Entries are reused while
+    the refs and working tree are unchanged (see `diff_state_fingerprint`)."""
+    signature, base_ref, head_ref = diff_signature(
+        directory,
+        file_ext,
+        include_files,
+        include_globs,
+        exclude_globs,
+        diff_base_ref,
+        diff_head_ref,
+    )
+    fingerprint = diff_state_fingerprint(directory, base_ref, head_ref)
+    entry = None if force else diff_hunk_cache.get(signature, fingerprint)
+    if entry is not None:
+        return entry, True
+    start = time.perf_counter()
+    hunks, file_count, base_ref, head_ref = collect_diff_hunks(
+        directory,
+        file_ext,
+        include_files,
+        include_globs,
+        exclude_globs,
+        diff_base_ref,
+        diff_head_ref,
+    )
+    entry = {
+        "signature": signature,
+        "fingerprint": fingerprint,
+        "hunks": hunks,
+        "file_count": file_count,
+        "base_ref": base_ref,
+        "head_ref": head_ref,
+        "line_index": build_changed_line_index(hunks),
+        "units": None,
+        "build_ms": (time.perf_counter() - start) * 1000,
+    }
+    diff_hunk_cache.put(signature, entry)
+    return entry, False
+
+
+def diff_units_for_entry(entry: dict) -> list[dict]:
+    if entry["units"] is None:
+        entry["units"] = build_file_diff_units(entry["hunks"])
+    return entry["units"]
+
+
 def changed_line_ranges_by_file(
     directory: str,
     file_ext: str,
@@ -1477,11 +1971,13 @@ def changed_line_ranges_by_file(
     exclude_globs: Optional[List[str]],
     diff_base_ref: Optional[str],
     diff_head_ref: Optional[str],
-) -> dict[str, list[tuple[int, int]]]:
-    """Return, per absolute file path, the line ranges (in head/working-tree
-    coordinates) that were changed by the selected diff. Reuses the unified-diff
-    hunk collector so the ranges honor the chosen base/head refs."""
-    hunks, _count, _base, _head = collect_diff_hunks(
+    force: bool = False,
+) -> dict[str, ChangedLineIndex]:
+    """Return, per absolute file path, the lines (in head/working-tree
+    coordinates) that were changed by the selected diff. Shares the diff hunk
+    cache with the unified-diff view so the ranges honor the chosen base/head
+    refs without re-running git on every search."""
+    entry, _cache_hit = cached_diff_hunks(
         directory,
         file_ext,
         include_files,
@@ -1489,38 +1985,21 @@ def changed_line_ranges_by_file(
         exclude_globs,
         diff_base_ref,
         diff_head_ref,
+        force,
     )
-    ranges: dict[str, list[tuple[int, int]]] = {}
-    for hunk in hunks:
-        path = os.path.abspath(str(hunk.get("file_path") or hunk.get("file") or ""))
-        if not path:
-            continue
-        bucket = ranges.setdefault(path, [])
-        added = hunk.get("added_ranges") or []
-        if added:
-            for pair in added:
-                bucket.append((int(pair[0]), int(pair[1])))
-        else:
-            # Deletion-only hunk: anchor on the surrounding line so the enclosing
-            # function is still treated as changed.
-            anchor = int(hunk.get("lineno") or 1)
-            bucket.append((anchor, anchor))
-    return ranges
+    return entry["line_index"]
 
 
-def function_intersects_changes(func: dict, changed_ranges: dict[str, list[tuple[int, int]]]) -> bool:
+def function_intersects_changes(func: dict, changed_ranges: dict[str, ChangedLineIndex]) -> bool:
     path = os.path.abspath(str(func.get("file") or func.get("file_path") or ""))
-    ranges = changed_ranges.get(path)
-    if not ranges:
+    line_index = changed_ranges.get(path)
+    if not line_index:
         return False
     start = int(func.get("lineno") or func.get("line_number") or 1)
     end = int(func.get("end_lineno") or start)
     if end < start:
         end = start
-    for range_start, range_end in ranges:
-        if start <= range_end and range_start <= end:
-            return True
-    return False
+    return line_index.overlaps(start, end)
 
 
 def prepare_diff_search_index(
@@ -1549,8 +2028,7 @@ def prepare_diff_search_index(
         and diff_search_state.last_prepared > 0
     )
     if not hunk_cache_hit:
-        start = time.perf_counter()
-        hunks, file_count, base_ref, head_ref = collect_diff_hunks(
+        entry, hunk_cache_hit = cached_diff_hunks(
             directory,
             file_ext,
             include_files,
@@ -1558,17 +2036,20 @@ def prepare_diff_search_index(
             exclude_globs,
             diff_base_ref,
             diff_head_ref,
+            force,
         )
-        units = build_file_diff_units(hunks)
+        base_ref, head_ref = entry["base_ref"], entry["head_ref"]
         diff_search_state.replace_hunks(
             signature,
-            hunks,
-            units,
-            file_count,
-            (time.perf_counter() - start) * 1000,
+            entry["hunks"],
+            diff_units_for_entry(entry),
+            entry["file_count"],
+            entry["build_ms"],
         )
 
     normalized_mode = search_mode if search_mode in {"semantic", "bm25", "hybrid", "keyword"} else "hybrid"
+    if normalized_mode in {"bm25", "hybrid"}:
+        commit_message_index(directory, diff_search_state)
     needs_embeddings = normalized_mode in {"semantic", "hybrid"}
     embedding_cache_hit = not needs_embeddings
     index_embedding_ms = 0.0
@@ -1614,6 +2095,32 @@ def prepare_diff_search_index(
     }
 
 
+def commit_max_pool(unit_scores: np.ndarray, state: DiffSearchState) -> tuple[np.ndarray, np.ndarray]:
+    """Max-pool per-unit scores into per-commit scores with one segment
+    reduction. Returns (commit_scores, representative unit per commit); ties go
+    to the later unit of the commit."""
+    if not len(state.commit_starts):
+        return np.zeros(0, dtype=np.float64), np.zeros(0, dtype=np.int64)
+    ordered = unit_scores[state.commit_perm]
+    commit_scores = np.maximum.reduceat(ordered, state.commit_starts)
+    segment = state.unit_commit[state.commit_perm]
+    positions = np.where(ordered >= commit_scores[segment], np.arange(len(ordered)), -1)
+    rep_positions = np.maximum.reduceat(positions, state.commit_starts)
+    return commit_scores, state.commit_perm[rep_positions]
+
+
+def top_k_indices(scores: np.ndarray, k: int, tie_break: Optional[np.ndarray] = None) -> np.ndarray:
+    """Positions of the k highest scores, best first, via argpartition. Equal
+    scores are ordered by `tie_break` (ascending), defaulting to position."""
+    count = len(scores)
+    k = max(0, min(int(k), count))
+    if k == 0:
+        return np.zeros(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k] if k < count else np.arange(count)
+    secondary = tie_break[top] if tie_break is not None else top
+    return top[np.lexsort((secondary, -scores[top]))]
+
+
 def search_diff_hunks(req: SearchFunctionsSimpleRequest) -> dict:
     # This path now only serves the unified-diff ("diff_hunks") view.
     search_target = "diff_hunks"
@@ -1658,46 +2165,25 @@ def search_diff_hunks(req: SearchFunctionsSimpleRequest) -> dict:
     # ---- The scored element is one file per commit (each unit is a file's whole
     # diff, embedded together). Units are grouped back by their commit; a commit's
     # score is the MAX over its files, and the best-matching file represents it.
-    # Each commit still yields a single result. ----
-    commit_order: list[str] = []
-    commit_to_units: dict[str, list[int]] = {}
-    unit_commit_key: list[str] = []
-    for idx, unit in enumerate(units):
-        key = unit.get("commit_hash") or unit.get("commit_subject") or f"__file__{unit.get('file_path')}"
-        bucket = commit_to_units.get(key)
-        if bucket is None:
-            bucket = []
-            commit_to_units[key] = bucket
-            commit_order.append(key)
-        bucket.append(idx)
-        unit_commit_key.append(key)
+    # Each commit still yields a single result. The grouping is precomputed by
+    # DiffSearchState when the diff is prepared. ----
+    state = diff_search_state
+    commit_count = len(state.commit_keys)
 
-    def build_commit_result(rank: int, key: str, hybrid_score, semantic_score: float,
+    def build_commit_result(rank: int, commit_index: int, hybrid_score, semantic_score: float,
                             bm25_score: float, rep_index: int, extra: Optional[dict] = None,
-                            score_by_index: Optional[dict] = None) -> dict:
+                            unit_scores: Optional[np.ndarray] = None) -> dict:
         # Represent the commit with its best-matching file so the existing diff UI
         # (snippet, click-to-open) keeps working, then layer commit-level scores
         # and one entry per file the commit touched on top.
         item = diff_result_for_target(units[rep_index], search_target)
-        unit_indices = commit_to_units[key]
-        scores = score_by_index or {}
-        rep_rel = str(units[rep_index].get("path") or units[rep_index].get("file_path") or "")
+        unit_indices = state.commit_units[commit_index]
         files_grouped = []
-        total_hunks = 0
         for i in unit_indices:
-            source = units[i]
-            rel = str(source.get("path") or source.get("file_path") or "")
-            file_hunks = source.get("file_hunk_count") or 1
-            total_hunks += file_hunks
             files_grouped.append({
-                "path": source.get("path"),
-                "file_path": source.get("file_path"),
-                "lineno": source.get("lineno"),
-                "additions": source.get("additions") or 0,
-                "deletions": source.get("deletions") or 0,
-                "hunk_count": file_hunks,
-                "score": scores.get(i, 0.0),
-                "is_representative": rel == rep_rel,
+                **state.unit_file_entries[i],
+                "score": float(unit_scores[i]) if unit_scores is not None else 0.0,
+                "is_representative": i == rep_index,
             })
         # Most relevant file first (its file-level semantic score).
         files_grouped.sort(key=lambda f: f["score"], reverse=True)
@@ -1710,7 +2196,7 @@ def search_diff_hunks(req: SearchFunctionsSimpleRequest) -> dict:
             "hybrid_score": hybrid_score,
             "search_mode": search_mode,
             "commit_file_count": len(unit_indices),
-            "commit_hunk_count": total_hunks,
+            "commit_hunk_count": sum(entry["hunk_count"] for entry in files_grouped),
             "commit_files": [units[i].get("path") for i in unit_indices],
             "commit_hunks": files_grouped,
         })
@@ -1720,15 +2206,15 @@ def search_diff_hunks(req: SearchFunctionsSimpleRequest) -> dict:
 
     if search_mode == "keyword":
         matches = keyword_search_matches(units, req.query)
-        commit_match: dict[str, tuple[int, list[str]]] = {}
+        commit_match: dict[int, tuple[int, list[str]]] = {}
         for unit_index in sorted(matches):
-            key = unit_commit_key[unit_index]
-            if key not in commit_match:
-                commit_match[key] = (unit_index, matches[unit_index])
+            commit_index = int(state.unit_commit[unit_index])
+            if commit_index not in commit_match:
+                commit_match[commit_index] = (unit_index, matches[unit_index])
         found = []
-        for rank, key in enumerate(list(commit_match)[:req.top_k], start=1):
-            rep_index, kws = commit_match[key]
-            found.append(build_commit_result(rank, key, None, 0.0, 0.0, rep_index, extra={
+        for rank, commit_index in enumerate(list(commit_match)[:req.top_k], start=1):
+            rep_index, kws = commit_match[commit_index]
+            found.append(build_commit_result(rank, commit_index, None, 0.0, 0.0, rep_index, extra={
                 "distance": None,
                 "hybrid_score": None,
                 "keyword_match": True,
@@ -1737,7 +2223,7 @@ def search_diff_hunks(req: SearchFunctionsSimpleRequest) -> dict:
         return {
             "results": found,
             "num_functions": len(units),
-            "num_commits": len(commit_order),
+            "num_commits": commit_count,
             "num_files": prepared["num_files"],
             "search_mode": search_mode,
             "search_target": search_target,
@@ -1746,88 +2232,68 @@ def search_diff_hunks(req: SearchFunctionsSimpleRequest) -> dict:
         }
 
     # Semantic score per file unit (the faiss index is built over file diffs).
-    semantic_scores: dict[int, float] = {}
-    semantic_distances: dict[int, float] = {}
+    unit_scores = np.zeros(len(units), dtype=np.float64)
+    unit_distances = np.full(len(units), np.nan, dtype=np.float64)
     if search_mode in {"semantic", "hybrid"}:
         progress.raise_if_cancelled()
         query_emb = encode_code([req.query], batch_size=1, show_progress=False, input_type="query")
         # Score every file unit so each commit's score can be taken as the max.
-        semantic_k = len(units)
-        D, I = diff_search_state.faiss_index.search(query_emb, semantic_k)
-        valid_distances = [
-            float(distance)
-            for distance, idx in zip(D[0], I[0])
-            if 0 <= idx < len(units) and np.isfinite(distance)
-        ]
-        min_distance = min(valid_distances) if valid_distances else 0.0
-        max_distance = max(valid_distances) if valid_distances else 0.0
-        for distance, idx in zip(D[0], I[0]):
-            if 0 <= idx < len(units):
-                distance_value = float(distance)
-                if max_distance > min_distance and np.isfinite(distance_value):
-                    score = max(0.0, min(1.0, 1.0 - ((distance_value - min_distance) / (max_distance - min_distance))))
-                else:
-                    score = 1.0
-                semantic_scores[int(idx)] = score
-                semantic_distances[int(idx)] = distance_value
+        D, I = diff_search_state.faiss_index.search(query_emb, len(units))
+        valid = (I[0] >= 0) & (I[0] < len(units))
+        indices = I[0][valid]
+        distances = D[0][valid].astype(np.float64)
+        unit_distances[indices] = distances
+        finite = distances[np.isfinite(distances)]
+        min_distance = float(finite.min()) if finite.size else 0.0
+        max_distance = float(finite.max()) if finite.size else 0.0
+        if max_distance > min_distance:
+            scores = np.clip(1.0 - ((distances - min_distance) / (max_distance - min_distance)), 0.0, 1.0)
+            scores[~np.isfinite(distances)] = 1.0
+        else:
+            scores = np.ones_like(distances)
+        unit_scores[indices] = scores
 
     # A commit's semantic score is the max over its files (its best-matching file),
     # and that file represents the commit in the results.
-    commit_semantic: dict[str, float] = {}
-    commit_rep: dict[str, int] = {}
-    for key in commit_order:
-        best_index = commit_to_units[key][0]
-        best_score = semantic_scores.get(best_index, 0.0)
-        for i in commit_to_units[key]:
-            score = semantic_scores.get(i, 0.0)
-            if score >= best_score:
-                best_score = score
-                best_index = i
-        commit_semantic[key] = best_score
-        commit_rep[key] = best_index
+    commit_semantic, commit_rep = commit_max_pool(unit_scores, state)
 
     # BM25 runs against the commit message (one document per commit).
+    commit_bm25 = np.zeros(commit_count, dtype=np.float64)
+    bm25_hits = np.zeros(commit_count, dtype=bool)
     if search_mode in {"bm25", "hybrid"}:
-        commit_messages = [units[commit_to_units[key][0]].get("commit_message") or "" for key in commit_order]
-        raw_bm25 = _bm25_scores([tokenize_for_bm25(message) for message in commit_messages], req.query)
-        commit_bm25 = {commit_order[ci]: score for ci, score in raw_bm25.items()}
+        raw_bm25 = commit_message_index(req.directory, state).scores(req.query)
+        for commit_index, score in normalize_scores(raw_bm25).items():
+            commit_bm25[commit_index] = score
+            bm25_hits[commit_index] = True
+
+    if search_mode == "semantic":
+        hybrid = commit_semantic
+    elif search_mode == "bm25":
+        hybrid = commit_bm25
     else:
-        commit_bm25 = {}
-    normalized_bm25 = normalize_scores(commit_bm25)
+        hybrid = (semantic_weight * commit_semantic) + ((1.0 - semantic_weight) * commit_bm25)
 
-    candidate_keys: set[str] = set()
-    if search_mode in {"semantic", "hybrid"}:
-        candidate_keys |= set(commit_order)
-    if search_mode in {"bm25", "hybrid"}:
-        candidate_keys |= set(normalized_bm25)
-    if not candidate_keys:
-        candidate_keys = set(commit_order)
-
-    ranked = []
-    for key in candidate_keys:
-        semantic_score = commit_semantic.get(key, 0.0)
-        bm25_score = normalized_bm25.get(key, 0.0)
-        if search_mode == "semantic":
-            hybrid_score = semantic_score
-        elif search_mode == "bm25":
-            hybrid_score = bm25_score
-        else:
-            hybrid_score = (semantic_weight * semantic_score) + ((1.0 - semantic_weight) * bm25_score)
-        ranked.append((hybrid_score, semantic_score, bm25_score, key))
-    ranked.sort(key=lambda item: item[0], reverse=True)
+    if search_mode == "bm25" and bm25_hits.any():
+        candidates = np.flatnonzero(bm25_hits)
+    else:
+        candidates = np.arange(commit_count)
+    top = top_k_indices(hybrid[candidates], req.top_k, tie_break=candidates)
 
     found = []
-    for rank, (hybrid_score, semantic_score, bm25_score, key) in enumerate(ranked[:req.top_k], start=1):
-        rep_index = commit_rep.get(key, commit_to_units[key][0])
+    for rank, position in enumerate(top, start=1):
+        commit_index = int(candidates[position])
+        rep_index = int(commit_rep[commit_index])
+        distance = unit_distances[rep_index]
         found.append(build_commit_result(
-            rank, key, hybrid_score, semantic_score, bm25_score, rep_index,
-            extra={"distance": semantic_distances.get(rep_index)},
-            score_by_index=semantic_scores,
+            rank, commit_index, float(hybrid[commit_index]), float(commit_semantic[commit_index]),
+            float(commit_bm25[commit_index]), rep_index,
+            extra={"distance": float(distance) if np.isfinite(distance) else None},
+            unit_scores=unit_scores,
         ))
     return {
         "results": found,
         "num_functions": len(units),
-        "num_commits": len(commit_order),
+        "num_commits": commit_count,
         "num_files": prepared["num_files"],
         "search_mode": search_mode,
         "search_target": search_target,
@@ -1868,16 +2334,11 @@ def record_diff_agent_event(req: SearchFunctionsSimpleRequest, response: dict, m
         event["message"] = message
     return append_agent_search_event(event)
 
-# ディレクトリ内の全ファイルから関数抽出・インデックス作成（一時的なインデックス、状態保存なし）
-def build_index(directory: str, file_ext: str = ".py", max_workers: int = 8, update_state: bool = False):
-    import hashlib
-    def func_id(func):
-        # ファイルパス・関数名・lineno・end_linenoを組み合わせて一意なIDを生成
-        key = f"{func.get('file','')}|{func.get('name','')}|{func.get('lineno','')}|{func.get('end_lineno','')}"
-        return hashlib.sha256(key.encode()).hexdigest()
-
-    progress.raise_if_cancelled()
+def load_current_index(directory: str, file_ext: str) -> bool:
+    """(directory, file_ext) のインデックスを常駐させ、メモリかディスクのキャッシュが最新なら True を返す。
+    index_lock を保持して呼ぶ。False のときは build_index で再抽出・再埋め込みが必要。"""
     directory = os.path.abspath(directory)
+    activate_index_state(directory, file_ext)
     current_model_config = global_index_state.get_current_model_config()
 
     # 1. まずメモリキャッシュが有効かつ up_to_date なら即リターン（メモリのみ）
@@ -1892,10 +2353,7 @@ def build_index(directory: str, file_ext: str = ".py", max_workers: int = 8, upd
             global_index_state.clear_cache(clear_disk=True)
         else:
             print(f"[build_index] Memory cache is up to date, returning without recalculation (funcs={len(global_index_state.indexer.functions)}, files={len(global_index_state.file_info)})")
-            return (
-                global_index_state.indexer.functions, 
-                len(global_index_state.file_info), 
-                global_index_state.indexer)
+            return True
     
     # 2. メモリキャッシュが無効な場合、ディスクからロード
     global_index_state.load(directory, file_ext)
@@ -1914,11 +2372,21 @@ def build_index(directory: str, file_ext: str = ".py", max_workers: int = 8, upd
         (global_index_state.model_name is None or global_index_state.model_name == model_name)
     ):
         print(f"[build_index] Disk cache is up to date, returning without recalculation (funcs={len(global_index_state.indexer.functions)}, files={len(global_index_state.file_info)})")
+        return True
+    return False
+
+
+# ディレクトリ内の全ファイルから関数抽出・インデックス作成（一時的なインデックス、状態保存なし）
+def build_index(directory: str, file_ext: str = ".py", max_workers: Optional[int] = None, update_state: bool = False):
+    progress.raise_if_cancelled()
+    directory = os.path.abspath(directory)
+    if load_current_index(directory, file_ext):
         return (
-            global_index_state.indexer.functions, 
-            len(global_index_state.file_info), 
+            global_index_state.indexer.functions,
+            len(global_index_state.file_info),
             global_index_state.indexer)
-    
+    current_model_config = global_index_state.get_current_model_config()
+
     # 5. ここに到達する場合のみ再構築が必要
     print("[build_index] Cache is invalid or outdated, rebuilding index")
     
@@ -1942,17 +2410,9 @@ def build_index(directory: str, file_ext: str = ".py", max_workers: int = 8, upd
                 prev_funcs_by_file.setdefault(func.get("file"), []).append(func)
     spec = load_gitignore_spec(directory)
     file_paths = []
-    for root, dirs, files in os.walk(directory):
+    for fpath in iter_index_source_files(directory, file_ext, spec):
         progress.raise_if_cancelled()
-        dirs[:] = [d for d in dirs if not is_ignored(os.path.join(root, d), spec, directory)]
-        for fname in files:
-            progress.raise_if_cancelled()
-            if not fname.endswith(file_ext):
-                continue
-            fpath = os.path.join(root, fname)
-            if is_ignored(fpath, spec, directory):
-                continue
-            file_paths.append(fpath)
+        file_paths.append(fpath)
 
     # ハッシュ値のみで判定
     new_info = {f: {"hash": file_hash(f)} for f in file_paths}
@@ -1971,111 +2431,89 @@ def build_index(directory: str, file_ext: str = ".py", max_workers: int = 8, upd
     
     print(f"[build_index] File changes detected: added/modified={len(added_or_modified)}, deleted={len(deleted)}, unchanged={len(unchanged)}")
 
-    # 追加・変更ファイルのみ再抽出
-    def process_file(fpath):
-        progress.raise_if_cancelled()
-        try:
-            funcs = extract_functions(fpath)
-            for func in funcs:
-                func["file"] = fpath
-            return funcs
-        except Exception as e:
-            print(f"\u26a0\ufe0f {fpath}: {e}")
-            return []
-
     # --- 差分埋め込みの順序厳密化 ---
     # 1. まず全関数リストをファイルごとに構築
     results = []
-    results_func_ids = []
     file_to_funcs = {}
     for f in unchanged:
         funcs = prev_funcs_by_file.get(f, [])
         file_to_funcs[f] = funcs
-        for func in funcs:
-            results.append(func)
-            results_func_ids.append(func_id(func))
+        results.extend(funcs)
     added_modified_funcs = []
+    # 追加・変更ファイルのみ再抽出（件数が多いときはプロセスプールで並列抽出）
     if added_or_modified:
         scan_total = len(added_or_modified)
         progress.start("Scanning files", scan_total)
         scanned = 0
-        if scan_total < 16:
-            for fpath in tqdm(added_or_modified, desc="Indexing (serial, diff)", disable=not OWL_DEBUG, file=sys.stdout):
+        extracted = iter_extracted(added_or_modified, max_workers)
+        try:
+            for fpath, funcs in tqdm(extracted, total=scan_total, desc="Indexing (diff)", disable=not OWL_DEBUG, file=sys.stdout):
                 progress.raise_if_cancelled()
-                funcs = process_file(fpath)
                 added_modified_funcs.extend(funcs)
                 file_to_funcs[fpath] = funcs
-                for func in funcs:
-                    results.append(func)
-                    results_func_ids.append(func_id(func))
+                results.extend(funcs)
                 scanned += 1
                 progress.update(scanned, scan_total)
-        else:
-            with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                for res, fpath in zip(
-                    tqdm(executor.map(process_file, added_or_modified), total=scan_total, desc="Indexing (parallel, diff)", disable=not OWL_DEBUG, file=sys.stdout),
-                    added_or_modified
-                ):
-                    progress.raise_if_cancelled()
-                    added_modified_funcs.extend(res)
-                    file_to_funcs[fpath] = res
-                    for func in res:
-                        results.append(func)
-                        results_func_ids.append(func_id(func))
-                    scanned += 1
-                    progress.update(scanned, scan_total)
+        finally:
+            extracted.close()
 
     # --- 埋め込み再利用ロジックの厳密化 ---
     if update_state:
+        # 埋め込みはコード本文だけで決まるので、内容一致で前回の行を再利用する
+        # （行番号がずれただけの関数は再計算しない）
         prev_funcs = prev_indexer.functions if prev_indexer else []
-        prev_func_ids = [func_id(f) for f in prev_funcs]
-        prev_func_id2idx = {fid: i for i, fid in enumerate(prev_func_ids)}
-        # results_func_ids: 新しい順序
-        keep_indices = [prev_func_id2idx[fid] for fid in results_func_ids if fid in prev_func_id2idx]
-        # 新規関数（前回に存在しないもの）
-        new_func_indices = [i for i, fid in enumerate(results_func_ids) if fid not in prev_func_id2idx]
-        # 埋め込み配列を順序通りに構築
-        if prev_indexer and global_index_state.embeddings is not None and global_index_state.faiss_index is not None and keep_indices:
-            prev_embeddings = global_index_state.embeddings
-            kept_embeddings = prev_embeddings[keep_indices] if keep_indices else np.zeros((0, prev_embeddings.shape[1]), dtype=prev_embeddings.dtype)
-            # 新規分のみ埋め込み
-            if new_func_indices:
-                progress.raise_if_cancelled()
-                new_codes = [results[i]["code"] for i in new_func_indices]
-                print(f"Generating embeddings for {len(new_codes)} new/modified functions...")
-                new_embeddings = encode_code(new_codes, settings.batch_size, show_progress=True)
-                # 埋め込みを順序通りに合成
-                embeddings = np.zeros((len(results), new_embeddings.shape[1]), dtype=new_embeddings.dtype)
-                # 既存分
-                for idx, keep_idx in enumerate(keep_indices):
-                    embeddings[idx] = prev_embeddings[keep_idx]
-                # 新規分
-                for arr_idx, res_idx in enumerate(new_func_indices):
-                    embeddings[res_idx] = new_embeddings[arr_idx]
-            else:
-                embeddings = kept_embeddings
-            if embeddings is not None and embeddings.shape[0] > 0:
-                faiss_index = faiss.IndexFlatL2(embeddings.shape[1])
-                faiss_index.add(embeddings)
+        prev_embeddings = global_index_state.embeddings if prev_indexer else None
+        if prev_embeddings is None or prev_embeddings.shape[0] != len(prev_funcs):
+            prev_funcs, prev_embeddings = [], None
+        prev_rows, new_rows, new_codes = plan_embedding_reuse(
+            [f["code"] for f in prev_funcs],
+            [func["code"] for func in results],
+        )
+        new_embeddings = None
+        if new_codes:
+            progress.raise_if_cancelled()
+            if prev_embeddings is None:
+                print(f"Generating embeddings for {len(new_codes)} functions (full rebuild)...")
             else:
-                faiss_index = None
-                embeddings = None
-            global_index_state.embeddings = embeddings
-            global_index_state.faiss_index = faiss_index
+                print(f"Generating embeddings for {len(new_codes)} new/modified functions "
+                      f"(reused {int((prev_rows >= 0).sum())})...")
+            new_embeddings = encode_code(new_codes, settings.batch_size, show_progress=True)
+        embeddings = assemble_embeddings(prev_embeddings, prev_rows, new_embeddings, new_rows)
+        if embeddings is not None:
+            faiss_index = faiss.IndexFlatL2(embeddings.shape[1])
+            faiss_index.add(embeddings)
         else:
-            # 全関数分再計算
-            codes = [func["code"] for func in results]
-            if codes:
-                progress.raise_if_cancelled()
-                print(f"Generating embeddings for {len(codes)} functions (full rebuild)...")
-                embeddings = encode_code(codes, settings.batch_size, show_progress=True)
-                faiss_index = faiss.IndexFlatL2(embeddings.shape[1])
-                faiss_index.add(embeddings)
-                global_index_state.embeddings = embeddings
-                global_index_state.faiss_index = faiss_index
+            faiss_index = None
+        global_index_state.embeddings = embeddings
+        global_index_state.faiss_index = faiss_index
+        # ファイル/クラス単位のベクトルは変更ファイル分だけ再集約する
+        if global_index_state.embeddings is not None:
+            hierarchy = global_index_state.hierarchy if prev_indexer else None
+            if hierarchy is None:
+                hierarchy = HierarchyIndex()
+                hierarchy.update(results, global_index_state.embeddings)
             else:
-                global_index_state.embeddings = None
-                global_index_state.faiss_index = None
+                hierarchy.update(results, global_index_state.embeddings, added_or_modified, deleted)
+            global_index_state.hierarchy = hierarchy
+        else:
+            global_index_state.hierarchy = None
+        # シンボル表は変更ファイル分だけ差し替える
+        if prev_indexer and global_index_state.symbols is not None:
+            global_index_state.symbols.update_files(
+                {f: file_to_funcs.get(f, []) for f in added_or_modified},
+                deleted,
+            )
+        else:
+            global_index_state.symbols = SymbolTable()
+            global_index_state.symbols.update_files(file_to_funcs)
+        if prev_indexer and global_index_state.graphs is not None:
+            global_index_state.graphs.update_files(
+                {f: file_to_funcs.get(f, []) for f in added_or_modified},
+                deleted,
+            )
+        else:
+            global_index_state.graphs = GraphStore()
+            global_index_state.graphs.update_files(file_to_funcs)
         # インデックス・メタ情報更新
         indexer = CodeIndexer()
         indexer.add_functions_without_embedding(results)  # 埋め込み計算なしで関数リストのみ追加
@@ -2094,51 +2532,111 @@ def build_index(directory: str, file_ext: str = ".py", max_workers: int = 8, upd
 @app.post("/embed")
 async def embed(req: EmbedRequest):
     print("/embed called")
-    progress.clear_cancel()
+    job = submit_job(
+        "embed",
+        lambda: {"embeddings": encode_with_memory_management(req.texts, settings.batch_size).tolist()},
+        "embed",
+        PRIORITY_BULK,
+        operation_id=req.operation_id,
+    )
+    if not req.wait:
+        return {"job": job.summary()}
     try:
-        embeddings = encode_with_memory_management(req.texts, settings.batch_size)
-        return {"embeddings": embeddings.tolist()}
+        return {**await job.wait_async(), "operation_id": job.operation_id, "job_id": job.id}
     except progress.OperationCancelled:
-        return {"embeddings": [], "cancelled": True, "message": "Embedding cancelled."}
-    finally:
-        progress.finish()
+        return {"embeddings": [], "cancelled": True, "message": "Embedding cancelled.", "operation_id": job.operation_id}
 
 @app.post("/cancel_embedding")
-async def cancel_embedding():
-    progress.request_cancel()
-    return {"message": "Cancellation requested for the current indexing/embedding operation.", "cancel_requested": True}
+async def cancel_embedding(req: Optional[CancelRequest] = None):
+    operation_id = req.operation_id if req is not None else None
+    # 待ち行列のジョブは外し、実行中の処理は操作のキャンセルトークンで止める
+    job_scheduler.cancel_operation(operation_id)
+    cancelled = progress.request_cancel(operation_id)
+    if operation_id:
+        message = f"Cancellation requested for operation {operation_id}." if cancelled else f"No running operation {operation_id}."
+    else:
+        message = "Cancellation requested for the current indexing/embedding operation."
+    return {"message": message, "cancel_requested": bool(cancelled) or not operation_id, "cancelled_operations": cancelled}
 
 @app.post("/cancel_indexing")
-async def cancel_indexing():
-    return await cancel_embedding()
+async def cancel_indexing(req: Optional[CancelRequest] = None):
+    return await cancel_embedding(req)
+
+def submit_job(
+    kind: str,
+    fn,
+    resource: str,
+    priority: int,
+    key: Optional[tuple] = None,
+    operation_id: Optional[str] = None,
+) -> Job:
+    try:
+        return job_scheduler.submit(kind, fn, resource, priority, key, operation_id)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=f"Job queue is full: {e}") from e
+
+def schedule_grep_index_refresh(directory: str):
+    """Keep the grep trigram index in step with the function index without
+    delaying the build response."""
+    def run():
+        try:
+            refresh_grep_index(directory, persist=True)
+        except Exception as e:
+            print(f"[grep_index] Background refresh failed: {e}")
+    threading.Thread(target=run, daemon=True).start()
 
 @app.post("/build_index")
 async def build_index_api(req: BuildIndexRequest):
     print(f"/build_index called for directory: {req.directory}")
-    with index_lock:
-        progress.clear_cancel()
-        try:
-            results, file_count, _ = await asyncio.to_thread(build_index, req.directory, req.file_ext, update_state=True)
-        except progress.OperationCancelled:
-            return {"num_functions": 0, "num_files": 0, "cancelled": True, "message": "Indexing cancelled."}
-        finally:
-            progress.finish()
-    return {"num_functions": len(results), "num_files": file_count}
+
+    def run() -> dict:
+        with index_lock:
+            results, file_count, _ = build_index(req.directory, req.file_ext, update_state=True)
+        schedule_grep_index_refresh(req.directory)
+        return {"num_functions": len(results), "num_files": file_count}
+
+    # 同じディレクトリ・拡張子の構築が待ち/実行中なら、そのジョブの結果を共有する
+    job = submit_job(
+        "build_index",
+        run,
+        "index",
+        PRIORITY_BUILD,
+        key=("build_index", os.path.abspath(req.directory), req.file_ext),
+        operation_id=req.operation_id,
+    )
+    if not req.wait:
+        return {"job": job.summary()}
+    try:
+        return {**await job.wait_async(), "operation_id": job.operation_id, "job_id": job.id}
+    except progress.OperationCancelled:
+        return {"num_functions": 0, "num_files": 0, "cancelled": True, "message": "Indexing cancelled.", "operation_id": job.operation_id}
 
 @app.post("/force_rebuild_index")
 async def force_rebuild_index_api(req: BuildIndexRequest):
     """キャッシュをクリアして強制的にインデックスを再構築"""
     print(f"/force_rebuild_index called for directory: {req.directory}")
-    with index_lock:
-        progress.clear_cancel()
-        global_index_state.clear_cache()
-        try:
-            results, file_count, _ = await asyncio.to_thread(build_index, req.directory, req.file_ext, update_state=True)
-        except progress.OperationCancelled:
-            return {"num_functions": 0, "num_files": 0, "cancelled": True, "message": "Index rebuild cancelled."}
-        finally:
-            progress.finish()
-    return {"num_functions": len(results), "num_files": file_count, "message": "Index forcefully rebuilt"}
+
+    def run() -> dict:
+        with index_lock:
+            activate_index_state(req.directory, req.file_ext).clear_cache()
+            results, file_count, _ = build_index(req.directory, req.file_ext, update_state=True)
+        schedule_grep_index_refresh(req.directory)
+        return {"num_functions": len(results), "num_files": file_count, "message": "Index forcefully rebuilt"}
+
+    job = submit_job(
+        "force_rebuild_index",
+        run,
+        "index",
+        PRIORITY_BUILD,
+        key=("force_rebuild_index", os.path.abspath(req.directory), req.file_ext),
+        operation_id=req.operation_id,
+    )
+    if not req.wait:
+        return {"job": job.summary()}
+    try:
+        return {**await job.wait_async(), "operation_id": job.operation_id, "job_id": job.id}
+    except progress.OperationCancelled:
+        return {"num_functions": 0, "num_files": 0, "cancelled": True, "message": "Index rebuild cancelled.", "operation_id": job.operation_id}
 
 @app.get("/index_status")
 async def index_status():
@@ -2155,20 +2653,22 @@ async def index_status():
     )
 
 @app.get("/index_progress")
-async def index_progress():
-    """インデックス作成の進捗（実際の割合）を返す。"""
-    return progress.snapshot()
+async def index_progress(op: Optional[str] = None):
+    """インデックス作成の進捗（実際の割合）を返す。op を指定するとその操作だけの進捗。"""
+    snap = progress.snapshot(op)
+    if snap is None:
+        raise HTTPException(status_code=404, detail=f"Unknown operation: {op}")
+    return snap
 
 @app.post("/prepare_diff_search")
 async def prepare_diff_search_api(req: PrepareDiffSearchRequest):
     # Preparing the hunk index only matters for the unified-diff view.
     search_target = "diff_hunks"
     search_mode = req.search_mode if req.search_mode in {"semantic", "bm25", "hybrid", "keyword"} else "hybrid"
-    with diff_search_lock:
-        progress.clear_cancel()
-        try:
-            prepared = await asyncio.to_thread(
-                prepare_diff_search_index,
+
+    def run() -> dict:
+        with diff_search_lock:
+            prepared = prepare_diff_search_index(
                 req.directory,
                 req.file_ext,
                 req.include_files,
@@ -2179,264 +2679,340 @@ async def prepare_diff_search_api(req: PrepareDiffSearchRequest):
                 req.diff_head_ref,
                 req.force,
             )
-        except progress.OperationCancelled:
-            return {"cancelled": True, "message": "Diff preparation cancelled.", "results": []}
-        finally:
-            progress.finish()
-    return {
-        **prepared,
-        "search_target": search_target,
-        "message": f"Prepared {prepared.get('num_diff_hunks', 0)} changed hunk(s) from {prepared.get('num_files', 0)} file(s).",
-    }
+        return {
+            **prepared,
+            "search_target": search_target,
+            "message": f"Prepared {prepared.get('num_diff_hunks', 0)} changed hunk(s) from {prepared.get('num_files', 0)} file(s).",
+        }
+
+    key = (
+        "prepare_diff_search",
+        os.path.abspath(req.directory),
+        req.file_ext,
+        tuple(req.include_files or ()),
+        tuple(req.include_globs or ()),
+        tuple(req.exclude_globs or ()),
+        search_mode,
+        req.diff_base_ref or "",
+        req.diff_head_ref or "",
+        req.force,
+    )
+    job = submit_job("prepare_diff_search", run, "diff", PRIORITY_BUILD, key=key, operation_id=req.operation_id)
+    if not req.wait:
+        return {"job": job.summary()}
+    try:
+        return {**await job.wait_async(), "operation_id": job.operation_id, "job_id": job.id}
+    except progress.OperationCancelled:
+        return {"cancelled": True, "message": "Diff preparation cancelled.", "results": [], "operation_id": job.operation_id}
 
 @app.post("/search")
 async def search_api(query: str, top_k: int = 5):
     print(f"/search called with query: {query}")
-    with index_lock:
-        if not global_index_state.indexer:
-            return {"results": [], "error": "No index built."}
-        results = global_index_state.indexer.search(query, top_k=top_k)
-    return {"results": results}
+
+    def run() -> dict:
+        with index_lock:
+            if not global_index_state.indexer:
+                return {"results": [], "error": "No index built."}
+            return {"results": global_index_state.indexer.search(query, top_k=top_k)}
+
+    # index_lock は構築ジョブが長く保持するので、イベントループ上では取らずジョブの中で取る
+    job = submit_job("search", run, "index", PRIORITY_INTERACTIVE)
+    try:
+        return await job.wait_async()
+    except progress.OperationCancelled:
+        return {"results": [], "cancelled": True, "message": "Search cancelled."}
+
+def resolve_search_scope(req: SearchFunctionsSimpleRequest) -> dict:
+    """file_ext="auto"（統合インデックス）と scope="source"/"changed" をキャッシュ済みのファイル一覧で解決する。
+    req を解決後の値で書き換え、応答に添えるメタ情報を返す。"""
+    scope = (req.scope or "").strip().lower()
+    auto_ext = (req.file_ext or "").strip().lower() in {"", "auto"}
+    # diff 系の changed スコープは base/head ref からサーバー側で解決されるのでファイル一覧は不要
+    scoped = req.include_files is None and (
+        scope == "source"
+        or (scope == "changed" and normalize_search_target(req.search_target) == "functions")
+    )
+    if not auto_ext and not scoped:
+        return {}
+    inventory = repo_inventory(req.directory, need_changed=scope == "changed")
+    meta = {}
+    if auto_ext:
+        # auto は全言語をまとめた統合インデックスを 1 回のベクトル検索で引く
+        detected, counts = inventory.auto_file_ext(scope if scope in FILE_SCOPES else "all")
+        if detected is None:
+            raise ValueError(f"No supported source files found in {req.directory}")
+        req.file_ext = UNIFIED_FILE_EXT
+        meta = {"file_ext": UNIFIED_FILE_EXT, "auto_file_ext_counts": counts}
+    if scoped:
+        files = inventory.scope_files(scope, req.file_ext)
+        # source スコープに該当ファイルがなければリポジトリ全体を対象にする
+        req.include_files = files if files or scope == "changed" else None
+    return meta
+
 
 @app.post("/search_functions_simple")
 async def search_functions_simple_api(req: SearchFunctionsSimpleRequest):
+    try:
+        scope_meta = await asyncio.to_thread(resolve_search_scope, req)
+    except ValueError as e:
+        return {"results": [], "error": str(e), "message": str(e)}
+    response = await run_search_functions_simple(req)
+    if scope_meta:
+        response.update(scope_meta)
+    return response
+
+
+async def run_search_functions_simple(req: SearchFunctionsSimpleRequest, query_emb: Optional[np.ndarray] = None) -> dict:
     search_target = normalize_search_target(req.search_target)
     if search_target == "diff_hunks":
-        with diff_search_lock:
-            progress.clear_cancel()
-            try:
-                response = await asyncio.to_thread(search_diff_hunks, req)
-            except progress.OperationCancelled:
-                return {"results": [], "cancelled": True, "message": "Diff search cancelled."}
-            finally:
-                progress.finish()
+
+        def run_diff() -> dict:
+            with diff_search_lock:
+                return search_diff_hunks(req)
+
+        job = submit_job("search", run_diff, "diff", PRIORITY_INTERACTIVE, operation_id=req.operation_id)
+        try:
+            response = await job.wait_async()
+        except progress.OperationCancelled:
+            return {"results": [], "cancelled": True, "message": "Diff search cancelled.", "operation_id": job.operation_id}
+        response["operation_id"] = job.operation_id
         agent_event = record_diff_agent_event(req, response, response.get("message"))
         response["agent_event_id"] = agent_event["id"] if agent_event else None
         return response
 
-    search_mode = req.search_mode if req.search_mode in {"semantic", "bm25", "hybrid", "keyword"} else "hybrid"
-    semantic_weight = max(0.0, min(1.0, req.semantic_weight))
     # キーワード/BM25 は埋め込み(FAISS インデックス)が不要。意味検索/ハイブリッドのみ埋め込みを構築する。
-    needs_embeddings = search_mode in {"semantic", "hybrid"}
-    with index_lock:
-        effective_include_files = list(req.include_files) if req.include_files is not None else None
-        effective_scope = req.scope or ("scoped" if effective_include_files is not None else "all")
-        progress.clear_cancel()
-        # 意味検索/ハイブリッド: 埋め込みを構築 (update_state=True)
-        # キーワード/BM25: 関数リストのみ取得し埋め込み計算をスキップ (update_state=False)
+    needs_embeddings = search_request_mode(req) in {"semantic", "hybrid"}
+    if needs_embeddings and query_emb is None:
+        # インデックス構築ジョブを待つ間にクエリを埋め込んでおく。embedding_gate により
+        # 構築中の一括埋め込みのバッチの合間に割り込むので、構築の完了を待たない。
         try:
-            results, file_count, indexer = await asyncio.to_thread(
-                build_index, req.directory, req.file_ext, 8, needs_embeddings
+            query_emb = await asyncio.to_thread(
+                encode_code, [req.query], batch_size=1, show_progress=False, input_type="query"
             )
         except progress.OperationCancelled:
-            return {"results": [], "cancelled": True, "message": "Search indexing cancelled."}
-        finally:
-            progress.finish()
-        def record_agent_event(found: list[dict], search_mode_value: str, semantic_weight_value: float, message: Optional[str] = None):
-            if not req.capture_agent_event:
-                return None
-            event = {
-                "source": req.agent_source or "agent",
-                "agent_client": req.agent_client,
-                "agent_model": req.agent_model,
-                "directory": os.path.abspath(req.directory),
-                "query": req.query,
-                "original_query": req.original_query or req.query,
-                "file_ext": req.file_ext,
-                "top_k": req.top_k,
-                "scope": effective_scope,
-                "include_globs": normalize_glob_patterns(req.include_globs),
-                "exclude_globs": normalize_glob_patterns(req.exclude_globs),
-                "search_mode": search_mode_value,
-                "semantic_weight": semantic_weight_value,
-                "embedding_model": model_name,
-                "embedding_api": global_index_state.get_current_model_config().get("embedding_api"),
-                "include_files_count": len(effective_include_files or []),
-                "result_count": len(found),
-                "results": found,
-            }
-            if message:
-                event["message"] = message
-            return append_agent_search_event(event)
+            return {"results": [], "cancelled": True, "message": "Search embedding cancelled."}
 
-        # build_index後のキャッシュ状態をprint
+    def run() -> dict:
+        with index_lock:
+            # 意味検索/ハイブリッド: 埋め込みを構築 (update_state=True)
+            # キーワード/BM25: 関数リストのみ取得し埋め込み計算をスキップ (update_state=False)
+            results, file_count, _indexer = build_index(req.directory, req.file_ext, None, needs_embeddings)
+            return rank_indexed_search(req, results, file_count, query_emb=query_emb)
+
+    # 検索は対話的な処理なので、待ち行列の構築ジョブより先に動かす
+    job = submit_job("search", run, "index", PRIORITY_INTERACTIVE, operation_id=req.operation_id)
+    try:
+        response = await job.wait_async()
+    except progress.OperationCancelled:
+        return {"results": [], "cancelled": True, "message": "Search indexing cancelled.", "operation_id": job.operation_id}
+    response["operation_id"] = job.operation_id
+    return response
+
+
+def search_request_mode(req: SearchFunctionsSimpleRequest) -> str:
+    return req.search_mode if req.search_mode in {"semantic", "bm25", "hybrid", "keyword"} else "hybrid"
+
+
+def rank_indexed_search(
+    req: SearchFunctionsSimpleRequest,
+    results: list[dict],
+    file_count: int,
+    query_emb: Optional[np.ndarray] = None,
+    semantic_hits: Optional[tuple[np.ndarray, np.ndarray]] = None,
+) -> dict:
+    """build_index 済みの関数リストに対して 1 クエリ分の検索を行う。
+    query_emb（1 行の埋め込み）と semantic_hits（全体インデックスでの (D, I)）を渡すと、
+    /search_batch でまとめて計算した結果を再利用する。"""
+    search_target = normalize_search_target(req.search_target)
+    search_mode = search_request_mode(req)
+    semantic_weight = max(0.0, min(1.0, req.semantic_weight))
+    needs_embeddings = search_mode in {"semantic", "hybrid"}
+    effective_include_files = list(req.include_files) if req.include_files is not None else None
+    effective_scope = req.scope or ("scoped" if effective_include_files is not None else "all")
+    def record_agent_event(found: list[dict], search_mode_value: str, semantic_weight_value: float, message: Optional[str] = None):
+        if not req.capture_agent_event:
+            return None
+        event = {
+            "source": req.agent_source or "agent",
+            "agent_client": req.agent_client,
+            "agent_model": req.agent_model,
+            "directory": os.path.abspath(req.directory),
+            "query": req.query,
+            "original_query": req.original_query or req.query,
+            "file_ext": req.file_ext,
+            "top_k": req.top_k,
+            "scope": effective_scope,
+            "include_globs": normalize_glob_patterns(req.include_globs),
+            "exclude_globs": normalize_glob_patterns(req.exclude_globs),
+            "search_mode": search_mode_value,
+            "semantic_weight": semantic_weight_value,
+            "embedding_model": model_name,
+            "embedding_api": global_index_state.get_current_model_config().get("embedding_api"),
+            "include_files_count": len(effective_include_files or []),
+            "result_count": len(found),
+            "results": found,
+        }
+        if message:
+            event["message"] = message
+        return append_agent_search_event(event)
+
+    # build_index後のキャッシュ状態をprint（is_up_to_date は全ファイルをハッシュするのでデバッグ時のみ）
+    if OWL_DEBUG:
         print("indexer_exists:", global_index_state.indexer is not None)
         print("up_to_date:", global_index_state.is_up_to_date())
         print("embeddings_cached:", global_index_state.embeddings is not None)
         print("file_ext:", global_index_state.file_ext)
-        embeddings = global_index_state.embeddings
-        faiss_index = global_index_state.faiss_index
-        # 意味検索/ハイブリッドのみ埋め込み必須。キーワード/BM25 は関数リストだけで検索する。
-        if not results or (needs_embeddings and (embeddings is None or faiss_index is None)):
-            agent_event = record_agent_event([], search_mode, semantic_weight, "No functions found.")
-            return {"results": [], "message": "No functions found.", "agent_event_id": agent_event["id"] if agent_event else None}
-        if req.include_globs or req.exclude_globs:
-            glob_scoped_files = []
-            for func in results:
-                file_path = func.get("file") or func.get("file_path", "")
-                if path_allowed_by_globs(file_path, req.directory, req.include_globs, req.exclude_globs):
-                    glob_scoped_files.append(os.path.abspath(file_path))
-            if effective_include_files is not None:
-                existing_scope = {os.path.abspath(path) for path in effective_include_files}
-                effective_include_files = [path for path in glob_scoped_files if path in existing_scope]
-            else:
-                effective_include_files = glob_scoped_files
-            effective_scope = req.scope or "glob"
-        search_results = results
-        search_embeddings = embeddings
-        index_to_result_index = list(range(len(results)))
+    embeddings = global_index_state.embeddings
+    faiss_index = global_index_state.faiss_index
+    # 意味検索/ハイブリッドのみ埋め込み必須。キーワード/BM25 は関数リストだけで検索する。
+    if not results or (needs_embeddings and (embeddings is None or faiss_index is None)):
+        agent_event = record_agent_event([], search_mode, semantic_weight, "No functions found.")
+        return {"results": [], "message": "No functions found.", "agent_event_id": agent_event["id"] if agent_event else None}
+    if req.include_globs or req.exclude_globs:
+        # グロブ判定はパス解決を伴うので関数ごとではなくファイルごとに一度だけ行う
+        glob_scoped_files = []
+        checked_files: set[str] = set()
+        for func in results:
+            file_path = func.get("file") or func.get("file_path", "")
+            if file_path in checked_files:
+                continue
+            checked_files.add(file_path)
+            if path_allowed_by_globs(file_path, req.directory, req.include_globs, req.exclude_globs):
+                glob_scoped_files.append(os.path.abspath(file_path))
         if effective_include_files is not None:
-            include_files = {os.path.abspath(path) for path in effective_include_files}
-            scoped_indices = [
-                index
-                for index, func in enumerate(results)
-                if os.path.abspath(func.get("file", func.get("file_path", ""))) in include_files
-            ]
-            if not scoped_indices:
-                agent_event = record_agent_event([], search_mode, semantic_weight, "No functions found in the selected file/glob scope.")
-                return {
-                    "results": [],
-                    "message": "No functions found in the selected file/glob scope.",
-                    "num_functions": len(results),
-                    "num_files": file_count,
-                    "scoped_files": len(include_files),
-                    "agent_event_id": agent_event["id"] if agent_event else None,
-                }
-            search_results = [results[index] for index in scoped_indices]
-            index_to_result_index = scoped_indices
-            # 埋め込みを使うモードのときのみ、スコープ済み FAISS インデックスを構築
-            if needs_embeddings and embeddings is not None and faiss_index is not None:
-                search_embeddings = embeddings[scoped_indices]
-                scoped_faiss_index = faiss.IndexFlatL2(search_embeddings.shape[1])
-                scoped_faiss_index.add(search_embeddings)
-                faiss_index = scoped_faiss_index
-
-        # "Changed functions" view: keep only functions whose line range overlaps
-        # the diff between the selected base/head refs.
-        if search_target == "changed_functions":
-            changed_ranges = changed_line_ranges_by_file(
-                req.directory,
-                req.file_ext,
-                effective_include_files,
-                req.include_globs,
-                req.exclude_globs,
-                req.diff_base_ref,
-                req.diff_head_ref,
-            )
-            kept_positions = [
-                pos
-                for pos, func in enumerate(search_results)
-                if function_intersects_changes(func, changed_ranges)
-            ]
-            if not kept_positions:
-                agent_event = record_agent_event([], search_mode, semantic_weight, "No changed functions found for the selected diff.")
-                return {
-                    "results": [],
-                    "message": "No changed functions found for the selected diff.",
-                    "num_functions": len(results),
-                    "num_files": file_count,
-                    "search_mode": search_mode,
-                    "search_target": "changed_functions",
-                    "agent_event_id": agent_event["id"] if agent_event else None,
-                }
-            search_results = [search_results[pos] for pos in kept_positions]
-            index_to_result_index = [index_to_result_index[pos] for pos in kept_positions]
-            if needs_embeddings and embeddings is not None:
-                search_embeddings = embeddings[index_to_result_index]
-                scoped_faiss_index = faiss.IndexFlatL2(search_embeddings.shape[1])
-                scoped_faiss_index.add(search_embeddings)
-                faiss_index = scoped_faiss_index
-
-        if search_mode == "keyword":
-            scoped_keyword_matches = keyword_search_matches(search_results, req.query)
-            found = []
-            for rank, scoped_index in enumerate(sorted(scoped_keyword_matches)[:req.top_k], start=1):
-                result_index = index_to_result_index[scoped_index]
-                item = dict(results[result_index])
-                item["rank"] = rank
-                item["distance"] = None
-                item["semantic_similarity"] = 0.0
-                item["bm25_score"] = 0.0
-                item["hybrid_score"] = None
-                item["search_mode"] = search_mode
-                item["keyword_match"] = True
-                item["matched_keywords"] = scoped_keyword_matches[scoped_index]
-                found.append(item)
-            agent_event = record_agent_event(found, search_mode, semantic_weight)
+            existing_scope = {os.path.abspath(path) for path in effective_include_files}
+            effective_include_files = [path for path in glob_scoped_files if path in existing_scope]
+        else:
+            effective_include_files = glob_scoped_files
+        effective_scope = req.scope or "glob"
+    languages = normalize_languages(req.languages)
+    if languages:
+        language_files = {
+            os.path.abspath(file_path)
+            for file_path in {func.get("file") or func.get("file_path", "") for func in results}
+            if language_for_path(file_path) in languages
+        }
+        if effective_include_files is not None:
+            effective_include_files = [path for path in effective_include_files if os.path.abspath(path) in language_files]
+        else:
+            effective_include_files = sorted(language_files)
+        effective_scope = req.scope or "language"
+    search_results = results
+    search_embeddings = embeddings
+    index_to_result_index = list(range(len(results)))
+    if effective_include_files is not None:
+        include_files = {os.path.abspath(path) for path in effective_include_files}
+        scoped_indices = [
+            index
+            for index, func in enumerate(results)
+            if os.path.abspath(func.get("file", func.get("file_path", ""))) in include_files
+        ]
+        if not scoped_indices:
+            agent_event = record_agent_event([], search_mode, semantic_weight, "No functions found in the selected file/glob scope.")
             return {
-                "results": found,
+                "results": [],
+                "message": "No functions found in the selected file/glob scope.",
                 "num_functions": len(results),
                 "num_files": file_count,
-                "scoped_files": len(effective_include_files or []),
-                "search_mode": search_mode,
-                "semantic_weight": semantic_weight,
+                "scoped_files": len(include_files),
                 "agent_event_id": agent_event["id"] if agent_event else None,
             }
-
-        semantic_scores: dict[int, float] = {}
-        semantic_distances: dict[int, float] = {}
-        if search_mode in {"semantic", "hybrid"}:
+        search_results = [results[index] for index in scoped_indices]
+        index_to_result_index = scoped_indices
+        # 埋め込みを使うモードのときのみ、スコープ済み FAISS インデックスを構築
+        if needs_embeddings and embeddings is not None and faiss_index is not None:
+            search_embeddings = embeddings[scoped_indices]
+            scoped_faiss_index = faiss.IndexFlatL2(search_embeddings.shape[1])
+            scoped_faiss_index.add(search_embeddings)
+            faiss_index = scoped_faiss_index
+
+    hierarchy_level = req.hierarchical if req.hierarchical in HIERARCHY_LEVELS else None
+    hierarchy_hits: list[dict] = []
+    if hierarchy_level and needs_embeddings and embeddings is not None:
+        hierarchy = resident_hierarchy()
+        if hierarchy is not None:
             try:
                 progress.raise_if_cancelled()
-                query_emb = encode_code([req.query], batch_size=1, show_progress=False, input_type="query")  # クエリは1つなので進捗報告は不要
+                if query_emb is None:
+                    query_emb = encode_code([req.query], batch_size=1, show_progress=False, input_type="query")
             except progress.OperationCancelled:
                 return {"results": [], "cancelled": True, "message": "Search embedding cancelled."}
-            semantic_k = len(search_results) if search_mode == "hybrid" else min(req.top_k, len(search_results))
-            D, I = faiss_index.search(query_emb, semantic_k)
-            valid_distances = [
-                float(distance)
-                for distance, idx in zip(D[0], I[0])
-                if 0 <= idx < len(search_results) and np.isfinite(distance)
-            ]
-            min_distance = min(valid_distances) if valid_distances else 0.0
-            max_distance = max(valid_distances) if valid_distances else 0.0
-            for distance, idx in zip(D[0], I[0]):
-                if 0 <= idx < len(search_results):
-                    distance_value = float(distance)
-                    if max_distance > min_distance and np.isfinite(distance_value):
-                        score = max(0.0, min(1.0, 1.0 - ((distance_value - min_distance) / (max_distance - min_distance))))
-                    else:
-                        score = 1.0
-                    result_index = index_to_result_index[idx]
-                    semantic_scores[result_index] = score
-                    semantic_distances[result_index] = distance_value
-
-        scoped_bm25_scores = bm25_search_scores(search_results, req.query) if search_mode in {"bm25", "hybrid"} else {}
-        bm25_scores = {
-            index_to_result_index[index]: score
-            for index, score in scoped_bm25_scores.items()
-            if 0 <= index < len(index_to_result_index)
-        }
-        normalized_bm25 = normalize_scores(bm25_scores)
-
-        candidate_indices = set(semantic_scores) | set(normalized_bm25)
-        if not candidate_indices and search_mode in {"bm25", "hybrid"}:
-            candidate_indices = set(index_to_result_index)
-
-        ranked = []
-        for result_index in candidate_indices:
-            semantic_score = semantic_scores.get(result_index, 0.0)
-            bm25_score = normalized_bm25.get(result_index, 0.0)
-            if search_mode == "semantic":
-                hybrid_score = semantic_score
-            elif search_mode == "bm25":
-                hybrid_score = bm25_score
-            else:
-                hybrid_score = (semantic_weight * semantic_score) + ((1.0 - semantic_weight) * bm25_score)
-            ranked.append((hybrid_score, semantic_score, bm25_score, result_index))
+            candidate_count = req.hierarchy_candidates if req.hierarchy_candidates > 0 else max(8, req.top_k)
+            in_scope = set(index_to_result_index)
+            # スコープ外のファイル/クラスを候補にしないよう、多めに取ってから絞る
+            nearest = [
+                (key, distance)
+                for key, distance in hierarchy.nearest(query_emb[0], hierarchy_level, candidate_count * 4)
+                if any(int(row) in in_scope for row in hierarchy.member_rows([key], hierarchy_level))
+            ][:candidate_count]
+            member_rows = [int(row) for row in hierarchy.member_rows([key for key, _ in nearest], hierarchy_level) if int(row) in in_scope]
+            if member_rows:
+                search_results = [results[index] for index in member_rows]
+                index_to_result_index = member_rows
+                search_embeddings = embeddings[member_rows]
+                scoped_faiss_index = faiss.IndexFlatL2(search_embeddings.shape[1])
+                scoped_faiss_index.add(search_embeddings)
+                faiss_index = scoped_faiss_index
+                hierarchy_hits = [
+                    {
+                        "file": key if hierarchy_level == "file" else key[0],
+                        "class_name": key[1] if hierarchy_level == "class" else None,
+                        "distance": distance,
+                    }
+                    for key, distance in nearest
+                ]
+
+    # "Changed functions" view: keep only functions whose line range overlaps
+    # the diff between the selected base/head refs.
+    if search_target == "changed_functions":
+        changed_ranges = changed_line_ranges_by_file(
+            req.directory,
+            req.file_ext,
+            effective_include_files,
+            req.include_globs,
+            req.exclude_globs,
+            req.diff_base_ref,
+            req.diff_head_ref,
+            req.force_diff_refresh,
+        )
+        kept_positions = [
+            pos
+            for pos, func in enumerate(search_results)
+            if function_intersects_changes(func, changed_ranges)
+        ]
+        if not kept_positions:
+            agent_event = record_agent_event([], search_mode, semantic_weight, "No changed functions found for the selected diff.")
+            return {
+                "results": [],
+                "message": "No changed functions found for the selected diff.",
+                "num_functions": len(results),
+                "num_files": file_count,
+                "search_mode": search_mode,
+                "search_target": "changed_functions",
+                "agent_event_id": agent_event["id"] if agent_event else None,
+            }
+        search_results = [search_results[pos] for pos in kept_positions]
+        index_to_result_index = [index_to_result_index[pos] for pos in kept_positions]
+        if needs_embeddings and embeddings is not None:
+            search_embeddings = embeddings[index_to_result_index]
+            scoped_faiss_index = faiss.IndexFlatL2(search_embeddings.shape[1])
+            scoped_faiss_index.add(search_embeddings)
+            faiss_index = scoped_faiss_index
 
-        ranked.sort(key=lambda item: item[0], reverse=True)
+    if search_mode == "keyword":
+        scoped_keyword_matches = keyword_search_matches(search_results, req.query)
         found = []
-        for rank, (hybrid_score, semantic_score, bm25_score, result_index) in enumerate(ranked[:req.top_k], start=1):
+        for rank, scoped_index in enumerate(sorted(scoped_keyword_matches)[:req.top_k], start=1):
+            result_index = index_to_result_index[scoped_index]
             item = dict(results[result_index])
             item["rank"] = rank
-            item["distance"] = semantic_distances.get(result_index)
-            item["score"] = hybrid_score
-            item["similarity"] = semantic_score if search_mode != "bm25" else bm25_score
-            item["semantic_similarity"] = semantic_score
-            item["bm25_score"] = bm25_score
-            item["hybrid_score"] = hybrid_score
+            item["distance"] = None
+            item["semantic_similarity"] = 0.0
+            item["bm25_score"] = 0.0
+            item["hybrid_score"] = None
             item["search_mode"] = search_mode
+            item["keyword_match"] = True
+            item["matched_keywords"] = scoped_keyword_matches[scoped_index]
             found.append(item)
         agent_event = record_agent_event(found, search_mode, semantic_weight)
         return {
@@ -2449,12 +3025,474 @@ async def search_functions_simple_api(req: SearchFunctionsSimpleRequest):
             "agent_event_id": agent_event["id"] if agent_event else None,
         }
 
+    semantic_scores: dict[int, float] = {}
+    semantic_distances: dict[int, float] = {}
+    if search_mode in {"semantic", "hybrid"}:
+        try:
+            progress.raise_if_cancelled()
+            if query_emb is None:
+                query_emb = encode_code([req.query], batch_size=1, show_progress=False, input_type="query")  # クエリは1つなので進捗報告は不要
+        except progress.OperationCancelled:
+            return {"results": [], "cancelled": True, "message": "Search embedding cancelled."}
+        semantic_k = len(search_results) if search_mode == "hybrid" else min(req.top_k, len(search_results))
+        if (
+            semantic_hits is not None
+            and faiss_index is global_index_state.faiss_index
+            and semantic_hits[1].shape[1] >= semantic_k
+        ):
+            # スコープなしのクエリは /search_batch の行列検索の結果を先頭 semantic_k 件だけ使う
+            D, I = semantic_hits[0][:, :semantic_k], semantic_hits[1][:, :semantic_k]
+        else:
+            D, I = faiss_index.search(query_emb, semantic_k)
+        valid_distances = [
+            float(distance)
+            for distance, idx in zip(D[0], I[0])
+            if 0 <= idx < len(search_results) and np.isfinite(distance)
+        ]
+        min_distance = min(valid_distances) if valid_distances else 0.0
+        max_distance = max(valid_distances) if valid_distances else 0.0
+        for distance, idx in zip(D[0], I[0]):
+            if 0 <= idx < len(search_results):
+                distance_value = float(distance)
+                if max_distance > min_distance and np.isfinite(distance_value):
+                    score = max(0.0, min(1.0, 1.0 - ((distance_value - min_distance) / (max_distance - min_distance))))
+                else:
+                    score = 1.0
+                result_index = index_to_result_index[idx]
+                semantic_scores[result_index] = score
+                semantic_distances[result_index] = distance_value
+
+    scoped_bm25_scores = bm25_search_scores(search_results, req.query, results) if search_mode in {"bm25", "hybrid"} else {}
+    bm25_scores = {
+        index_to_result_index[index]: score
+        for index, score in scoped_bm25_scores.items()
+        if 0 <= index < len(index_to_result_index)
+    }
+    normalized_bm25 = normalize_scores(bm25_scores)
+
+    candidate_indices = set(semantic_scores) | set(normalized_bm25)
+    if not candidate_indices and search_mode in {"bm25", "hybrid"}:
+        candidate_indices = set(index_to_result_index)
+
+    ranked = []
+    for result_index in candidate_indices:
+        semantic_score = semantic_scores.get(result_index, 0.0)
+        bm25_score = normalized_bm25.get(result_index, 0.0)
+        if search_mode == "semantic":
+            hybrid_score = semantic_score
+        elif search_mode == "bm25":
+            hybrid_score = bm25_score
+        else:
+            hybrid_score = (semantic_weight * semantic_score) + ((1.0 - semantic_weight) * bm25_score)
+        ranked.append((hybrid_score, semantic_score, bm25_score, result_index))
+
+    ranked.sort(key=lambda item: item[0], reverse=True)
+    found = []
+    for rank, (hybrid_score, semantic_score, bm25_score, result_index) in enumerate(ranked[:req.top_k], start=1):
+        item = dict(results[result_index])
+        item["rank"] = rank
+        item["distance"] = semantic_distances.get(result_index)
+        item["score"] = hybrid_score
+        item["similarity"] = semantic_score if search_mode != "bm25" else bm25_score
+        item["semantic_similarity"] = semantic_score
+        item["bm25_score"] = bm25_score
+        item["hybrid_score"] = hybrid_score
+        item["search_mode"] = search_mode
+        found.append(item)
+    agent_event = record_agent_event(found, search_mode, semantic_weight)
+    response = {
+        "results": found,
+        "num_functions": len(results),
+        "num_files": file_count,
+        "scoped_files": len(effective_include_files or []),
+        "search_mode": search_mode,
+        "semantic_weight": semantic_weight,
+        "agent_event_id": agent_event["id"] if agent_event else None,
+    }
+    if hierarchy_hits:
+        response["hierarchy_level"] = hierarchy_level
+        response["hierarchy_candidates"] = hierarchy_hits
+    return response
+
+
+MAX_BATCH_QUERIES = 32
+RRF_K = 60
+
+
+def fuse_search_results(result_lists: list[list[dict]], top_k: int) -> list[dict]:
+    """Reciprocal rank fusion of several ranked lists, deduplicated by function."""
+    scores: dict[tuple, float] = {}
+    items: dict[tuple, dict] = {}
+    matched: dict[tuple, list[int]] = {}
+    for query_index, found in enumerate(result_lists):
+        for rank, item in enumerate(found, start=1):
+            key = (
+                item.get("file") or item.get("file_path"),
+                item.get("name"),
+                item.get("lineno"),
+                item.get("end_lineno"),
+            )
+            scores[key] = scores.get(key, 0.0) + 1.0 / (RRF_K + rank)
+            items.setdefault(key, item)
+            matched.setdefault(key, []).append(query_index)
+    ordered = sorted(scores, key=lambda key: scores[key], reverse=True)[:max(0, top_k)]
+    merged = []
+    for rank, key in enumerate(ordered, start=1):
+        item = dict(items[key])
+        item["fused_rank"] = rank
+        item["fused_score"] = scores[key]
+        item["matched_queries"] = matched[key]
+        merged.append(item)
+    return merged
+
+
+def batch_search_items(req: SearchBatchRequest) -> list[Union[SearchFunctionsSimpleRequest, dict]]:
+    """共通フィールドにクエリごとの上書きを重ねた検索リクエスト（不正なものはエラー dict）。"""
+    base = req.model_dump(exclude={"queries", "fuse", "fused_top_k"})
+    items: list[Union[SearchFunctionsSimpleRequest, dict]] = []
+    for entry in req.queries[:MAX_BATCH_QUERIES]:
+        fields = {"query": entry} if isinstance(entry, str) else dict(entry)
+        try:
+            item = SearchFunctionsSimpleRequest(**{**base, **fields})
+        except Exception as e:
+            items.append({"query": fields.get("query"), "results": [], "error": str(e)})
+            continue
+        if not item.query.strip():
+            items.append({"query": item.query, "results": [], "error": "query is required."})
+            continue
+        items.append(item)
+    return items
+
+
+async def search_batch_group(items: list[SearchFunctionsSimpleRequest]) -> list[dict]:
+    """同じ directory / file_ext のクエリ群を、1 回の build_index・1 回のクエリ埋め込み・
+    1 回の行列検索で処理する。"""
+    modes = [search_request_mode(item) for item in items]
+    needs_embeddings = any(mode in {"semantic", "hybrid"} for mode in modes)
+    semantic_positions = [pos for pos, mode in enumerate(modes) if mode in {"semantic", "hybrid"}]
+    query_embs = None
+    if semantic_positions:
+        # 構築ジョブを待つ間に、全クエリを 1 回でまとめて埋め込んでおく（優先度は interactive）
+        try:
+            query_embs = await asyncio.to_thread(
+                encode_code,
+                [items[pos].query for pos in semantic_positions],
+                batch_size=settings.batch_size,
+                show_progress=False,
+                input_type="query",
+            )
+        except progress.OperationCancelled:
+            return [{"results": [], "cancelled": True, "message": "Search embedding cancelled."} for _ in items]
+
+    def run() -> list[dict]:
+        with index_lock:
+            results, file_count, _indexer = build_index(items[0].directory, items[0].file_ext, None, needs_embeddings)
+            faiss_index = global_index_state.faiss_index
+            hits = None
+            if results and query_embs is not None and faiss_index is not None:
+                # スコープなしのクエリ用に全体インデックスを 1 回の行列検索で引いておく
+                k = max(
+                    len(results) if modes[pos] == "hybrid" else min(max(1, items[pos].top_k), len(results))
+                    for pos in semantic_positions
+                )
+                hits = faiss_index.search(query_embs, k)
+            row_by_position = {pos: row for row, pos in enumerate(semantic_positions)}
+            responses = []
+            for pos, item in enumerate(items):
+                row = row_by_position.get(pos)
+                if row is None or query_embs is None:
+                    responses.append(rank_indexed_search(item, results, file_count))
+                    continue
+                responses.append(
+                    rank_indexed_search(
+                        item,
+                        results,
+                        file_count,
+                        query_emb=query_embs[row:row + 1],
+                        semantic_hits=(hits[0][row:row + 1], hits[1][row:row + 1]) if hits is not None else None,
+                    )
+                )
+            return responses
+
+    # 呼び出し元 (/search_batch) の操作に合流する
+    job = submit_job("search_batch", run, "index", PRIORITY_INTERACTIVE)
+    try:
+        return await job.wait_async()
+    except progress.OperationCancelled:
+        return [{"results": [], "cancelled": True, "message": "Search indexing cancelled."} for _ in items]
+
+
+@app.post("/search_batch")
+async def search_batch_api(req: SearchBatchRequest):
+    """複数クエリをまとめて検索する。インデックスの鮮度確認・スコープ解決・クエリ埋め込み・
+    近傍探索を (directory, file_ext) ごとに 1 回で済ませる。"""
+    items = batch_search_items(req)
+    with progress.operation("search_batch", req.operation_id) as op:
+        body = await run_search_batch(req, items)
+    body["operation_id"] = op.id
+    return body
+
+
+async def run_search_batch(req: SearchBatchRequest, items: list) -> dict:
+    def resolve_scopes() -> list[dict]:
+        metas = []
+        for item in items:
+            if isinstance(item, dict):
+                metas.append({})
+                continue
+            try:
+                metas.append(resolve_search_scope(item))
+            except ValueError as e:
+                metas.append({"error": str(e)})
+        return metas
+
+    scope_metas = await asyncio.to_thread(resolve_scopes)
+    responses: list[Optional[dict]] = [None] * len(items)
+    groups: dict[tuple[str, str], list[int]] = {}
+    for pos, item in enumerate(items):
+        if isinstance(item, dict):
+            responses[pos] = item
+        elif scope_metas[pos].get("error"):
+            responses[pos] = {"results": [], "error": scope_metas[pos]["error"], "message": scope_metas[pos]["error"]}
+        elif normalize_search_target(item.search_target) == "diff_hunks":
+            responses[pos] = await run_search_functions_simple(item)
+        else:
+            groups.setdefault((os.path.abspath(item.directory), item.file_ext), []).append(pos)
+    for positions in groups.values():
+        group_responses = await search_batch_group([items[pos] for pos in positions])
+        for pos, response in zip(positions, group_responses):
+            responses[pos] = response
+    for pos, item in enumerate(items):
+        if isinstance(item, SearchFunctionsSimpleRequest):
+            responses[pos]["query"] = item.query
+            if not scope_metas[pos].get("error"):
+                responses[pos].update(scope_metas[pos])
+    body = {"results": responses, "num_queries": len(items)}
+    if len(req.queries) > MAX_BATCH_QUERIES:
+        body["message"] = f"Only the first {MAX_BATCH_QUERIES} queries were searched."
+    if req.fuse:
+        body["merged"] = fuse_search_results(
+            [response.get("results", []) for response in responses],
+            req.fused_top_k if req.fused_top_k > 0 else req.top_k,
+        )
+    return body
+
+
+STREAM_PROGRESS_INTERVAL = 0.5
+
+
+def search_stream_frame(frame_type: str, **fields) -> str:
+    return json.dumps({"type": frame_type, **fields}, ensure_ascii=False, default=str) + "\n"
+
+
+@app.post("/search_stream")
+async def search_stream_api(req: SearchFunctionsSimpleRequest):
+    """NDJSON 版の /search_functions_simple。
+
+    埋め込みがまだ常駐していない意味検索/ハイブリッドでは、まず関数リストだけで BM25 の
+    暫定結果 {"type": "results", "final": false} を返し、埋め込み中は {"type": "progress"}
+    を流し、最後に本来のモードの結果 {"type": "results", "final": true} と {"type": "done"}
+    を返す。キャンセル時は {"type": "cancelled"}。接続が切れると実行中の処理をキャンセルする。"""
+    try:
+        scope_meta = await asyncio.to_thread(resolve_search_scope, req)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    search_mode = search_request_mode(req)
+    resident = resident_index_state(req.directory, req.file_ext)
+    warm = resident is not None and resident.embeddings is not None
+    preview = (
+        search_mode in {"semantic", "hybrid"}
+        and normalize_search_target(req.search_target) != "diff_hunks"
+        and not warm
+    )
+
+    def preview_phase() -> Optional[dict]:
+        # 埋め込みなしで既存の関数リストを BM25 で順位付け（エージェントイベントは最終結果でのみ記録）。
+        # キャッシュが古い/無いときに関数を抽出し直すと最終検索の前に全ファイルを二重に読むので、プレビューは出さない
+        preview_req = req.model_copy(update={"search_mode": "bm25", "capture_agent_event": False, "hierarchical": None})
+        with index_lock:
+            if not load_current_index(req.directory, req.file_ext):
+                return None
+            return rank_indexed_search(preview_req, global_index_state.indexer.functions, len(global_index_state.file_info))
+
+    async def stream():
+        # プレビューと最終検索は同じ操作 id に合流し、進捗とキャンセルを共有する
+        op = progress.begin("search", req.operation_id)
+        req.operation_id = op.id
+        finished = False
+        try:
+            if preview:
+                preview_job = submit_job("search", preview_phase, "index", PRIORITY_INTERACTIVE, operation_id=op.id)
+                try:
+                    response = await preview_job.wait_async()
+                except progress.OperationCancelled:
+                    response = {"results": [], "cancelled": True, "message": "Search indexing cancelled."}
+                if response is not None and response.get("cancelled"):
+                    finished = True
+                    yield search_stream_frame("cancelled", message=response.get("message"))
+                    return
+                if response is not None:
+                    yield search_stream_frame("results", stage="bm25", final=False, **{**response, **scope_meta})
+            final_task = asyncio.ensure_future(run_search_functions_simple(req))
+            last_progress = None
+            while True:
+                done, _pending = await asyncio.wait({final_task}, timeout=STREAM_PROGRESS_INTERVAL)
+                if done:
+                    break
+                snap = progress.snapshot(op.id)
+                key = (snap.get("phase"), snap.get("current"), snap.get("total"), snap.get("cancel_requested"))
+                if snap.get("active") and key != last_progress:
+                    last_progress = key
+                    yield search_stream_frame("progress", **snap)
+            response = final_task.result()
+            finished = True
+            if response.get("cancelled"):
+                yield search_stream_frame("cancelled", message=response.get("message"))
+                return
+            yield search_stream_frame("results", stage=search_mode, final=True, **{**response, **scope_meta})
+            yield search_stream_frame("done", result_count=len(response.get("results", [])))
+        except HTTPException as e:
+            # ヘッダーは送信済みなので、ジョブキューが満杯などのエラーはフレームで返す
+            finished = True
+            yield search_stream_frame("error", message=str(e.detail))
+        finally:
+            if not finished:
+                # クライアントが切断した: この検索の待ちジョブと実行中のインデックス作成・埋め込みだけを止める
+                job_scheduler.cancel_operation(op.id)
+                progress.request_cancel(op.id)
+            progress.end(op)
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+def recent_agent_search_events(since_id: int = 0, limit: int = 20) -> list[dict]:
+    return agent_event_store.recent(since_id, limit)
 
 @app.get("/agent_search_events")
 async def agent_search_events_api(since_id: int = 0, limit: int = 20):
-    with agent_event_lock:
-        events = [event for event in agent_search_events if event["id"] > since_id]
-        return {"events": events[-max(1, min(limit, 100)) :]}
+    return {"events": recent_agent_search_events(since_id, limit)}
+
+@app.get("/agent_search_events/{event_id}")
+async def agent_search_event_api(event_id: int):
+    """1件のイベントを、コードを含む検索結果付きで返す（一覧のイベントは結果の参照だけを持つ）。"""
+    event = agent_event_store.get(event_id)
+    if event is None:
+        raise HTTPException(status_code=404, detail=f"Unknown agent search event: {event_id}")
+    results = await asyncio.to_thread(agent_event_store.full_results, event_id)
+    return {"event": {**event, "results": results if results is not None else event.get("results", [])}}
+
+
+# /events の送信間隔。フェーズ変化・キャンセル・新しいイベントは次の tick で送り、
+# 件数だけの進捗更新は PROGRESS_PUSH_INTERVAL ごとに最新の1件へまとめる。
+EVENTS_TICK = 0.1
+PROGRESS_PUSH_INTERVAL = 0.25
+EVENTS_HEARTBEAT_INTERVAL = 15.0
+
+
+def server_sent_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.get("/events")
+async def events_stream(request: Request, limit: int = 20):
+    """進捗とエージェント検索イベントを Server-Sent Events で送る。
+
+    接続直後に現在の進捗と直近のイベントを送り、その後は変化があったときだけ送る。
+    /index_progress と /agent_search_events のポーリングを置き換える。
+    """
+
+    async def stream():
+        progress_version = -1
+        phase_version = -1
+        sent_progress_at = 0.0
+        events_version = -1
+        last_sent_at = time.monotonic()
+        while not await request.is_disconnected():
+            now = time.monotonic()
+            version, latest_phase_version = progress.versions()
+            if version != progress_version and (
+                latest_phase_version != phase_version or now - sent_progress_at >= PROGRESS_PUSH_INTERVAL
+            ):
+                snap = progress.snapshot()
+                progress_version = snap["version"]
+                phase_version = latest_phase_version
+                sent_progress_at = last_sent_at = now
+                yield server_sent_event("progress", snap)
+            if agent_event_store.version != events_version:
+                events_version = agent_event_store.version
+                last_sent_at = now
+                # 使用報告は既存イベントを書き換えるので、直近の範囲をまとめて送る
+                yield server_sent_event("agent_events", {"events": recent_agent_search_events(0, limit)})
+            if now - last_sent_at >= EVENTS_HEARTBEAT_INTERVAL:
+                last_sent_at = now
+                yield ": keep-alive\n\n"
+            await asyncio.sleep(EVENTS_TICK)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/embedding_stats")
+async def embedding_stats_api():
+    """クエリ（interactive）と一括処理（bulk）が埋め込みモデルを待った時間。
+    インデックス作成中の検索が待たされていないかを確認するための指標。"""
+    return embedding_queue_stats()
+
+
+@app.get("/jobs")
+async def jobs_api():
+    """待ち・実行中・最近終了したジョブの一覧（結果は含めない）。"""
+    return {"jobs": [job.summary() for job in job_scheduler.jobs()]}
+
+
+def get_job_or_404(job_id: str) -> Job:
+    job = job_scheduler.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job
+
+
+@app.get("/jobs/{job_id}")
+async def job_api(job_id: str):
+    """ジョブの状態。完了していれば "result" に結果を含める。"""
+    return get_job_or_404(job_id).summary(include_result=True)
+
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job_api(job_id: str):
+    return {"job_id": job_id, "cancel_requested": job_scheduler.cancel(job_id)}
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events_api(job_id: str, request: Request):
+    """ジョブの状態変化 ("job") と進捗 ("progress") を SSE で送り、終了したら閉じる。
+    最後の "job" フレームに結果を含める。"""
+    job = get_job_or_404(job_id)
+
+    async def stream():
+        status = None
+        last_progress = None
+        while not await request.is_disconnected():
+            if job.status != status:
+                status = job.status
+                yield server_sent_event("job", job.summary(include_result=status in TERMINAL_STATUSES))
+                if status in TERMINAL_STATUSES:
+                    return
+            snap = progress.snapshot(job.operation_id)
+            key = snap and (snap.get("phase"), snap.get("current"), snap.get("total"), snap.get("cancel_requested"))
+            if snap is not None and snap.get("active") and key != last_progress:
+                last_progress = key
+                yield server_sent_event("progress", snap)
+            await asyncio.sleep(PROGRESS_PUSH_INTERVAL)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.post("/agent_search_feedback")
 async def agent_search_feedback_api(req: AgentSearchFeedbackRequest):
@@ -2492,7 +3530,14 @@ async def agent_search_usage_api(req: AgentSearchUsageRequest):
         "note": req.note,
     })
     event = find_agent_search_event(req.event_id)
-    training_examples_written = append_training_examples_for_usage(event, stored) if event else 0
+    training_examples_written = 0
+    if event:
+        # 一覧のイベントは結果の参照だけを持つので、学習例にはコード付きの結果を使う
+        results = agent_event_store.full_results(req.event_id)
+        training_examples_written = append_training_examples_for_usage(
+            {**event, "results": results if results is not None else event.get("results", [])},
+            stored,
+        )
     return {
         "ok": True,
         "usage": stored,
@@ -2522,14 +3567,44 @@ async def agent_training_examples_api(limit: int = 20):
             continue
     return {"path": path, "count": len(lines), "examples": examples}
 
-@app.post("/grep_repo")
-async def grep_repo_api(req: GrepRepoRequest):
+def record_grep_agent_event(req: GrepRepoRequest, directory: str, max_matches: int, matches: list[dict]) -> Optional[dict]:
+    if not req.capture_agent_event:
+        return None
+    return append_agent_search_event({
+        "source": req.agent_source or "agent",
+        "agent_client": req.agent_client,
+        "agent_model": req.agent_model,
+        "parent_event_id": req.parent_event_id,
+        "kind": "grep",
+        "directory": directory,
+        "query": req.pattern,
+        "original_query": req.pattern,
+        "file_ext": "all",
+        "top_k": max_matches,
+        "scope": "glob" if req.include_globs or req.exclude_globs else "repo",
+        "include_globs": normalize_glob_patterns(req.include_globs),
+        "exclude_globs": normalize_glob_patterns(req.exclude_globs),
+        "search_mode": "grep_regex" if req.regex else "grep_literal",
+        "semantic_weight": 0.0,
+        "include_files_count": 0,
+        "result_count": len(matches),
+        "results": matches,
+    })
+
+
+def grep_request_bounds(req: GrepRepoRequest) -> tuple[str, int]:
     directory = os.path.abspath(req.directory)
     if not os.path.isdir(directory):
         raise HTTPException(status_code=400, detail=f"directory does not exist: {directory}")
-    max_matches = max(1, min(req.max_matches, 500))
+    return directory, max(1, min(req.max_matches, 500))
+
+
+@app.post("/grep_repo")
+async def grep_repo_api(req: GrepRepoRequest):
+    directory, max_matches = grep_request_bounds(req)
     try:
-        matches = grep_repo_files(
+        matches = await asyncio.to_thread(
+            grep_repo_files,
             directory,
             req.pattern,
             req.regex,
@@ -2541,28 +3616,7 @@ async def grep_repo_api(req: GrepRepoRequest):
     except re.error as exc:
         raise HTTPException(status_code=400, detail=f"invalid regex: {exc}") from exc
 
-    agent_event = None
-    if req.capture_agent_event:
-        agent_event = append_agent_search_event({
-            "source": req.agent_source or "agent",
-            "agent_client": req.agent_client,
-            "agent_model": req.agent_model,
-            "parent_event_id": req.parent_event_id,
-            "kind": "grep",
-            "directory": directory,
-            "query": req.pattern,
-            "original_query": req.pattern,
-            "file_ext": "all",
-            "top_k": max_matches,
-            "scope": "glob" if req.include_globs or req.exclude_globs else "repo",
-            "include_globs": normalize_glob_patterns(req.include_globs),
-            "exclude_globs": normalize_glob_patterns(req.exclude_globs),
-            "search_mode": "grep_regex" if req.regex else "grep_literal",
-            "semantic_weight": 0.0,
-            "include_files_count": 0,
-            "result_count": len(matches),
-            "results": matches,
-        })
+    agent_event = record_grep_agent_event(req, directory, max_matches, matches)
     return {
         "matches": matches,
         "result_count": len(matches),
@@ -2573,6 +3627,286 @@ async def grep_repo_api(req: GrepRepoRequest):
     }
 
 
+@app.post("/grep_repo_stream")
+async def grep_repo_stream_api(req: GrepRepoRequest):
+    """NDJSON variant of /grep_repo: one {"type": "match"} line per hit as soon
+    as it is found, then a {"type": "done"} summary. Disconnecting cancels the
+    remaining file shards."""
+    directory, max_matches = grep_request_bounds(req)
+    try:
+        re.compile(req.pattern if req.regex else re.escape(req.pattern))
+    except re.error as exc:
+        raise HTTPException(status_code=400, detail=f"invalid regex: {exc}") from exc
+
+    def stream():
+        matches: list[dict] = []
+        cancel_event = threading.Event()
+        found = iter_grep_repo_matches(
+            directory,
+            req.pattern,
+            req.regex,
+            req.case_sensitive,
+            max_matches,
+            req.include_globs,
+            req.exclude_globs,
+            cancel_event,
+        )
+        try:
+            for match in found:
+                matches.append(match)
+                yield json.dumps({"type": "match", **match}, ensure_ascii=False) + "\n"
+        finally:
+            cancel_event.set()
+            close = getattr(found, "close", None)
+            if close:
+                close()
+        agent_event = record_grep_agent_event(req, directory, max_matches, matches)
+        yield json.dumps({
+            "type": "done",
+            "result_count": len(matches),
+            "search_mode": "grep_regex" if req.regex else "grep_literal",
+            "include_globs": normalize_glob_patterns(req.include_globs),
+            "exclude_globs": normalize_glob_patterns(req.exclude_globs),
+            "agent_event_id": agent_event["id"] if agent_event else None,
+        }, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+def symbol_table_for(directory: str, file_ext: str) -> Optional[SymbolTable]:
+    """Resident symbol table when it belongs to `directory`, else the one
+    persisted by the last build of that directory/extension."""
+    directory = os.path.abspath(directory)
+    resident = resident_index_state(directory, file_ext)
+    if resident is not None and resident.symbols is not None:
+        return resident.symbols
+    return SymbolTable.load(os.path.join(repo_index_root(directory), file_ext.lstrip("."), "symbols.npz"))
+
+
+@app.post("/symbols")
+async def symbols_api(req: SymbolsRequest):
+    if req.mode not in {"prefix", "fuzzy", "exact"}:
+        raise HTTPException(status_code=400, detail=f"unknown mode: {req.mode}")
+    unknown_kinds = sorted(set(req.kinds or []) - set(SYMBOL_KINDS))
+    if unknown_kinds:
+        raise HTTPException(status_code=400, detail=f"unknown kinds: {', '.join(unknown_kinds)}")
+    directory = os.path.abspath(req.directory)
+    table = await asyncio.to_thread(symbol_table_for, directory, req.file_ext)
+    if table is None:
+        return {"symbols": [], "total": 0, "indexed": False, "message": "No index for this directory. Run /build_index first."}
+    symbols, total = await asyncio.to_thread(
+        table.query,
+        req.query,
+        req.mode,
+        req.kinds,
+        os.path.abspath(req.file) if req.file else None,
+        max(1, min(req.limit, 5000)),
+    )
+    for symbol in symbols:
+        symbol["path"] = os.path.relpath(symbol["file"], directory)
+    return {"symbols": symbols, "total": total, "indexed": True, "query": req.query, "mode": req.mode}
+
+
+@app.post("/call_graph")
+async def call_graph_api(req: CallGraphRequest):
+    directory = os.path.abspath(req.directory)
+    resident = resident_index_state(directory, req.file_ext)
+    if resident is not None and resident.graphs is not None:
+        graphs = resident.graphs
+    else:
+        graphs = GraphStore.load(os.path.join(repo_index_root(directory), req.file_ext.lstrip("."), "graphs.json"))
+    if graphs is None:
+        return {"indexed": False, "message": "No index for this directory. Run /build_index first."}
+    file_path = os.path.abspath(req.file) if req.file else None
+    response: dict = {"indexed": True}
+    if file_path is not None:
+        response["file"] = file_path
+        response.update(graphs.graph_for(file_path))
+    if req.name:
+        response["name"] = req.name
+        response["callees"] = [
+            {"file": path, "calls": calls}
+            for path, calls in graphs.callees(req.name, file_path)
+        ]
+        response["callers"] = [
+            {"file": path, "caller": caller}
+            for path, caller in graphs.callers(req.name)
+        ]
+    if file_path is None and not req.name:
+        response["files"] = len(graphs)
+    return response
+
+
+class ClassStatsGroups:
+    """(class, file) → row indices over a function list, plus the
+    (name, abspath, lineno) identity of every row. Rebuilt only when the
+    resident function list object changes."""
+    def __init__(self, functions: list[dict]):
+        self.functions = functions
+        self.identities: list[tuple] = []
+        self.row_files: list[str] = []
+        self.class_rows: dict[tuple[str, str], list[int]] = {}
+        self.standalone_rows: list[int] = []
+        for row, func in enumerate(functions):
+            file_path = func.get("file_path", func.get("file", ""))
+            file_abs = os.path.abspath(file_path) if file_path else ""
+            self.row_files.append(file_abs)
+            self.identities.append((func.get("name"), file_abs, func.get("lineno", func.get("line_number", 0))))
+            if func.get("class_name"):
+                self.class_rows.setdefault((func["class_name"], file_path), []).append(row)
+            else:
+                self.standalone_rows.append(row)
+
+
+class_stats_groups_cache: Optional[ClassStatsGroups] = None
+
+
+def class_stats_groups(functions: list[dict]) -> ClassStatsGroups:
+    global class_stats_groups_cache
+    cached = class_stats_groups_cache
+    if cached is None or cached.functions is not functions:
+        cached = ClassStatsGroups(functions)
+        class_stats_groups_cache = cached
+    return cached
+
+
+async def class_stats_functions(request: "ClassStatsRequest") -> list[dict]:
+    """Functions of the resident index for the request's directory. The search
+    that precedes this call has just refreshed it in semantic/hybrid mode;
+    keyword/BM25 searches do not update it, so build_index validates it (and
+    re-extracts in parallel only when it is stale)."""
+    directory = os.path.abspath(request.directory)
+    indexer = global_index_state.indexer
+    if (
+        request.search_mode in {"semantic", "hybrid"}
+        and indexer is not None
+        and global_index_state.directory == directory
+        and global_index_state.file_ext == request.file_ext
+    ):
+        return indexer.functions
+
+    def run() -> list[dict]:
+        with index_lock:
+            functions, _file_count, _indexer = build_index(directory, request.file_ext, None, False)
+            return functions
+
+    # 構築中でもイベントループを止めないよう、index_lock は検索と同じ対話ジョブの中で取る
+    job = submit_job("class_stats", run, "index", PRIORITY_INTERACTIVE)
+    return await job.wait_async()
+
+
+def class_similarities(functions: list[dict], query_emb: np.ndarray) -> dict[tuple[str, str], float]:
+    """Query similarity of every class vector, min-max scaled to 0..1 like
+    function similarities, keyed by (file, class name). Empty when the
+    resident embeddings do not belong to `functions`. Call under index_lock:
+    it reads the resident state and pools its class vectors on first use."""
+    indexer = global_index_state.indexer
+    if indexer is None or indexer.functions is not functions:
+        return {}
+    hierarchy = resident_hierarchy()
+    if hierarchy is None:
+        return {}
+    keys, distances = hierarchy.distances(query_emb[0], "class")
+    if not keys:
+        return {}
+    low, high = float(distances.min()), float(distances.max())
+    if high > low:
+        scores = 1.0 - (distances - low) / (high - low)
+    else:
+        scores = np.ones_like(distances)
+    return {key: float(score) for key, score in zip(keys, scores)}
+
+
+def rank_class_stats(
+    functions: list[dict],
+    search_results: list[dict],
+    include_files: Optional[List[str]] = None,
+    similarities: Optional[dict[tuple[str, str], float]] = None,
+) -> tuple[list[dict], list[dict]]:
+    """Score each (class, file) by the search ranks of its methods and order
+    standalone functions by rank. Returns copies; `functions` is not modified."""
+    groups = class_stats_groups(functions)
+    rank_by_identity: dict[tuple, int] = {}
+    for rank, result in enumerate(search_results, start=1):
+        result_file = result.get("file", "")
+        identity = (
+            result["name"],
+            os.path.abspath(result_file) if result_file else "",
+            result.get("lineno", result.get("line_number", 0)),
+        )
+        rank_by_identity.setdefault(identity, rank)
+    allowed_files = {os.path.abspath(path) for path in include_files} if include_files else None
+
+    def row_allowed(row: int) -> bool:
+        return allowed_files is None or groups.row_files[row] in allowed_files
+
+    def output_function(row: int, search_rank: Optional[int]) -> dict:
+        func = dict(functions[row])
+        func.setdefault("file_path", func.get("file", ""))
+        func["search_rank"] = search_rank
+        return func
+
+    classes = []
+    for (class_name, file_path), rows in groups.class_rows.items():
+        rows = [row for row in rows if row_allowed(row)]
+        if not rows:
+            continue
+        search_result_ranks = []
+        matched_methods = set()
+        methods = []
+        for row in rows:
+            identity = groups.identities[row]
+            method_rank = rank_by_identity.get(identity)
+            if method_rank is not None and identity not in matched_methods:
+                search_result_ranks.append(method_rank)
+                matched_methods.add(identity)
+            methods.append(output_function(row, method_rank))
+
+        method_count = len(rows)
+        if search_result_ranks:
+            weighted_score = sum(1.0 / rank for rank in search_result_ranks)
+            best_rank = min(search_result_ranks)  # 最高順位（最小のランク値）
+        else:
+            weighted_score = 0.0
+            best_rank = None
+        proportion = len(search_result_ranks) / method_count if method_count > 0 else 0
+        # 複合スコア: weighted_score * (1 + proportion_bonus)
+        # proportion_bonusは割合に基づくボーナス（0.0～1.0の範囲で最大100%のボーナス）
+        proportion_bonus = proportion * 1.0  # 100%ヒットなら100%ボーナス
+        composite_score = (weighted_score * (1 + proportion_bonus))/2
+        # クラス内メソッドを検索順位でソート（順位がないものは末尾）
+        methods.sort(key=lambda m: m["search_rank"] if m["search_rank"] is not None else float("inf"))
+        classes.append({
+            "name": class_name,
+            "file_path": file_path,
+            "methods": methods,
+            "method_count": method_count,
+            "weighted_score": weighted_score,
+            "search_hits": len(search_result_ranks),
+            "all_ranks": search_result_ranks,
+            "best_rank": best_rank,
+            "proportion": proportion,
+            "composite_score": composite_score,
+            # クラス全体の平均埋め込みとクエリの類似度（埋め込みがない場合は None）
+            "semantic_similarity": similarities.get((file_path, class_name)) if similarities else None,
+        })
+
+    # standalone 関数は検索順位順、検索結果に出てこないものは元の順序で末尾に並べる
+    standalone = []
+    seen_identities = set()
+    for row in groups.standalone_rows:
+        if not row_allowed(row):
+            continue
+        identity = groups.identities[row]
+        rank = rank_by_identity.get(identity)
+        if rank is not None and identity in seen_identities:
+            rank = None
+        seen_identities.add(identity)
+        standalone.append(output_function(row, rank))
+    standalone.sort(key=lambda f: f["search_rank"] if f["search_rank"] is not None else float("inf"))
+    return classes, standalone
+
+
 @app.post("/get_class_stats")
 async def get_class_stats(request: ClassStatsRequest):
     try:
@@ -2586,168 +3920,51 @@ async def get_class_stats(request: ClassStatsRequest):
             search_mode=request.search_mode,
             semantic_weight=request.semantic_weight,
         )
-        search_response = await search_functions_simple_api(search_request)
-        search_results = search_response["results"]
-        
-        # 全ての関数を抽出
-        all_functions = []
-        directory = request.directory
-        ignore_spec = load_gitignore_spec(directory)
-        
-        if request.include_files:
-            include_files = {os.path.abspath(path) for path in request.include_files}
-            files = [
-                file_path
-                for file_path in include_files
-                if file_path.endswith(request.file_ext)
-                and os.path.exists(file_path)
-                and not is_ignored(file_path, ignore_spec, directory)
-            ]
-        else:
-            files = []
-            for root, dirs, filenames in os.walk(directory):
-                # .gitignoreのパターンでディレクトリをフィルタ
-                dirs[:] = [d for d in dirs if not is_ignored(os.path.join(root, d), ignore_spec, directory)]
-                
-                for filename in filenames:
-                    if filename.endswith(request.file_ext):
-                        file_path = os.path.join(root, filename)
-                        if not is_ignored(file_path, ignore_spec, directory):
-                            files.append(file_path)
-        
-        for file_path in files:
-            try:
-                functions = extract_functions(file_path)
-                for func in functions:
-                    func['file_path'] = file_path
-                    all_functions.append(func)
-            except Exception as e:
-                print(f"Error processing {file_path}: {e}")
-                continue
-        
-        # クラス別にグループ化（ファイルごとに管理）
-        classes = {}
-        standalone_functions = []
-        
-        for func in all_functions:
-            if func.get("class_name"):
-                class_name = func["class_name"]
-                file_path = func.get("file_path", func.get("file", ""))
-                class_key = (class_name, file_path)
-                if class_key not in classes:
-                    classes[class_key] = {
-                        "name": class_name,
-                        "file_path": file_path,
-                        "methods": [],
-                        "method_count": 0
-                    }
-                classes[class_key]["methods"].append(func)
-                classes[class_key]["method_count"] += 1
-            else:
-                standalone_functions.append(func)
-        
-        print(f"Found {len(classes)} classes and {len(standalone_functions)} standalone functions")
-        for class_key, class_info in classes.items():
-            print(f"Class {class_info['name']} in {class_info['file_path']}: {class_info['method_count']} methods")
-        
-        # 検索結果ベースの重み付けスコア計算
-        for class_key, class_info in classes.items():
-            search_result_ranks = []
-            matched_methods = set()
-
-            for method in class_info["methods"]:
-                method_file = method.get("file_path", method.get("file", ""))
-                method_file_abs = os.path.abspath(method_file) if method_file else ""
-                method_lineno = method.get("lineno", method.get("line_number", 0))
-                method_key = (method["name"], method_file_abs, method_lineno)
-
-                method_rank = None
-                for i, result in enumerate(search_results):
-                    result_func_name = result["name"]
-                    result_file = result.get("file", "")
-                    result_lineno = result.get("lineno", result.get("line_number", 0))
-                    result_file_abs = os.path.abspath(result_file) if result_file else ""
-
-                    if (method["name"] == result_func_name and
-                        method_file_abs == result_file_abs and
-                        method_lineno == result_lineno):
-                        method_rank = i + 1
-                        if method_key not in matched_methods:
-                            search_result_ranks.append(method_rank)
-                            matched_methods.add(method_key)
-                            print(f"Matched method {method['name']} in class {class_info['name']} at rank {method_rank}")
-                        break
-
-                method["search_rank"] = method_rank
-
-            if search_result_ranks:
-                sum_inverse_ranks = sum(1.0 / rank for rank in search_result_ranks)
-                weighted_score = sum_inverse_ranks
-                best_rank = min(search_result_ranks)  # 最高順位（最小のランク値）
-            else:
-                weighted_score = 0.0
-                best_rank = None
-            
-            proportion = len(search_result_ranks) / class_info["method_count"] if class_info["method_count"] > 0 else 0
-            
-            # 複合スコア: weighted_score * (1 + proportion_bonus)
-            # proportion_bonusは割合に基づくボーナス（0.0～1.0の範囲で最大100%のボーナス）
-            proportion_bonus = proportion * 1.0  # 100%ヒットなら100%ボーナス
-            composite_score = (weighted_score * (1 + proportion_bonus))/2
-            
-            class_info["weighted_score"] = weighted_score
-            class_info["search_hits"] = len(search_result_ranks)
-            class_info["all_ranks"] = search_result_ranks
-            class_info["best_rank"] = best_rank
-            class_info["proportion"] = proportion
-            class_info["composite_score"] = composite_score
-
-            # クラス内メソッドを検索順位でソート（順位がないものは末尾）
-            class_info["methods"] = sorted(
-                class_info["methods"],
-                key=lambda m: m.get("search_rank") if m.get("search_rank") is not None else float("inf")
+        # file_ext="auto" はここで 1 回だけ統合インデックスに解決し、検索と関数一覧の両方で同じ値を使う
+        try:
+            await asyncio.to_thread(resolve_search_scope, search_request)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e)) from e
+        # クエリは 1 回だけ埋め込み、検索とクラスの類似度の両方で使う
+        query_emb = None
+        if request.search_mode in {"semantic", "hybrid"}:
+            query_emb = await asyncio.to_thread(
+                encode_code, [request.query], batch_size=1, show_progress=False, input_type="query"
             )
+        search_response = await run_search_functions_simple(search_request, query_emb=query_emb)
+        search_results = search_response["results"]
         
-        sorted_classes = sorted(classes.values(), key=lambda x: x["composite_score"], reverse=True)
-        
-        # --- ここから standalone_functions をランキング順にソート ---
-        # 検索結果の (name, file_path, lineno) で一致するものを先頭に並べる
-        def func_key(func):
-            name = func.get("name")
-            file_path = os.path.abspath(func.get("file_path", func.get("file", "")))
-            lineno = func.get("lineno", func.get("line_number", 0))
-            return (name, file_path, lineno)
-        # 検索結果のキー順リスト
-        search_func_keys = [
-            (r["name"], os.path.abspath(r.get("file", "")), r.get("lineno", r.get("line_number", 0)))
-            for r in search_results
-        ]
-        # standalone_functions を検索結果の順に並べる
-        func_key_to_func = {func_key(f): f for f in standalone_functions}
-        sorted_funcs = []
-        used_keys = set()
-        for k in search_func_keys:
-            if k in func_key_to_func and k not in used_keys:
-                sorted_funcs.append(func_key_to_func[k])
-                used_keys.add(k)
-        # 残り（検索結果に出てこないもの）
-        for f in standalone_functions:
-            k = func_key(f)
-            if k not in used_keys:
-                sorted_funcs.append(f)
-        standalone_functions = sorted_funcs
-        # --- ここまで追加 ---
+        all_functions = await class_stats_functions(request.model_copy(update={"file_ext": search_request.file_ext}))
+        similarities = {}
+        if query_emb is not None:
+
+            def run_similarities() -> dict[tuple[str, str], float]:
+                # 常駐状態は index ジョブが差し替えうるので、読み取りとクラスベクトルの集約は index_lock の中で行う
+                with index_lock:
+                    return class_similarities(all_functions, query_emb)
+
+            similarities = await submit_job("class_stats", run_similarities, "index", PRIORITY_INTERACTIVE).wait_async()
+        class_info_list, standalone_functions = rank_class_stats(
+            all_functions,
+            search_results,
+            request.include_files,
+            similarities,
+        )
+        print(f"Found {len(class_info_list)} classes and {len(standalone_functions)} standalone functions")
+        sorted_classes = sorted(class_info_list, key=lambda x: x["composite_score"], reverse=True)
         
         return {
             "classes": sorted_classes,
             "standalone_functions": standalone_functions,
-            "total_classes": len(classes),
+            "total_classes": len(class_info_list),
             "total_standalone_functions": len(standalone_functions),
             "search_query": request.query,
             "search_results_count": len(search_results),
             "scoring_method": "composite_score",
             "scoring_description": "Classes (per file) ranked by composite score: weighted_score × (1 + proportion_bonus). This combines ranking quality (∑(1/rank)) with hit proportion to favor classes with both high-ranking methods and good coverage."
         }
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error getting class stats: {e}")
         raise HTTPException(status_code=500, detail=str(e))
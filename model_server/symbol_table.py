@@ -0,0 +1,237 @@
+"""Columnar symbol table (classes, methods, functions, code blocks).
+
+The table is derived from the extractor output at index time and kept per
+file, so an incremental build only replaces the rows of changed files. For
+queries the rows are materialized into flat columns (name, kind, file id,
+line range, parent row) plus a case-folded sorted name list for prefix lookup
+and the case-folded names in row order that fuzzy queries scan.
+"""
+import bisect
+import os
+
+import numpy as np
+
+SYMBOL_KINDS = ("class", "method", "function", "code_block")
+_KIND_CODES = {kind: code for code, kind in enumerate(SYMBOL_KINDS)}
+
+# (name, kind, lineno, end_lineno, parent position within the file or -1)
+SymbolRow = tuple[str, str, int, int, int]
+
+
+def symbols_from_functions(functions: list[dict]) -> list[SymbolRow]:
+    """Symbol rows of one file. Classes are synthesized from their methods;
+    extractors report the class line range as class_lineno/class_end_lineno."""
+    rows: list[SymbolRow] = []
+    class_rows: dict[tuple[str, int | None], int] = {}
+    for func in functions:
+        class_name = func.get("class_name")
+        if not class_name:
+            continue
+        key = (class_name, func.get("class_lineno"))
+        start = func.get("class_lineno") or func.get("lineno", 0)
+        end = func.get("class_end_lineno") or func.get("end_lineno", start)
+        position = class_rows.get(key)
+        if position is None:
+            class_rows[key] = len(rows)
+            rows.append((class_name, "class", start, end, -1))
+        else:
+            _name, _kind, old_start, old_end, _parent = rows[position]
+            rows[position] = (class_name, "class", min(old_start, start), max(old_end, end), -1)
+    for func in functions:
+        name = func.get("name") or func.get("function_name") or ""
+        class_name = func.get("class_name")
+        kind = func.get("symbol_kind") or ("method" if class_name else "function")
+        if kind not in _KIND_CODES:
+            kind = "method" if class_name else "function"
+        parent = class_rows.get((class_name, func.get("class_lineno")), -1) if class_name else -1
+        lineno = func.get("lineno", 0)
+        rows.append((name, kind, lineno, func.get("end_lineno", lineno), parent))
+    return rows
+
+
+class SymbolTable:
+    def __init__(self):
+        self.file_rows: dict[str, list[SymbolRow]] = {}
+        self._columns: dict | None = None
+
+    @classmethod
+    def from_functions(cls, functions: list[dict]) -> "SymbolTable":
+        by_file: dict[str, list[dict]] = {}
+        for func in functions:
+            by_file.setdefault(func.get("file") or func.get("file_path", ""), []).append(func)
+        table = cls()
+        table.update_files(by_file)
+        return table
+
+    def __len__(self) -> int:
+        return sum(len(rows) for rows in self.file_rows.values())
+
+    def update_files(self, changed: dict[str, list[dict]], removed: list[str] | None = None) -> None:
+        """Replace the rows of `changed` files and drop `removed` ones."""
+        for path in removed or []:
+            self.file_rows.pop(path, None)
+        for path, functions in changed.items():
+            self.file_rows[path] = symbols_from_functions(functions)
+        self._columns = None
+
+    def columns(self) -> dict:
+        if self._columns is not None:
+            return self._columns
+        files = sorted(self.file_rows)
+        names: list[str] = []
+        kinds, file_ids, linenos, end_linenos, parents = [], [], [], [], []
+        file_starts = [0]
+        for file_id, path in enumerate(files):
+            base = len(names)
+            for name, kind, lineno, end_lineno, parent in self.file_rows[path]:
+                names.append(name)
+                kinds.append(_KIND_CODES[kind])
+                file_ids.append(file_id)
+                linenos.append(lineno)
+                end_linenos.append(end_lineno)
+                parents.append(base + parent if parent >= 0 else -1)
+            file_starts.append(len(names))
+        folded = [name.casefold() for name in names]
+        order = sorted(range(len(names)), key=lambda row: (folded[row], row))
+        self._columns = {
+            "files": files,
+            "names": names,
+            "kinds": np.array(kinds, dtype=np.int8),
+            "file_ids": np.array(file_ids, dtype=np.int32),
+            "linenos": np.array(linenos, dtype=np.int32),
+            "end_linenos": np.array(end_linenos, dtype=np.int32),
+            "parents": np.array(parents, dtype=np.int32),
+            "file_starts": np.array(file_starts, dtype=np.int64),
+            "sorted_rows": order,
+            "sorted_folded": [folded[row] for row in order],
+            "folded": folded,
+        }
+        return self._columns
+
+    def _prefix_rows(self, prefix: str) -> list[int]:
+        columns = self.columns()
+        folded = columns["sorted_folded"]
+        start = bisect.bisect_left(folded, prefix)
+        end = bisect.bisect_left(folded, prefix + "\U0010ffff", start)
+        return sorted(columns["sorted_rows"][start:end])
+
+    def _fuzzy_rows(self, query: str) -> list[int]:
+        """Rows whose folded name contains the query characters in order,
+        best first: exact, prefix, substring, then scattered matches."""
+        ranked = []
+        for row, name in enumerate(self.columns()["folded"]):
+            # Linear subsequence check; a lazy-wildcard regex backtracks exponentially
+            chars = iter(name)
+            if not all(char in chars for char in query):
+                continue
+            if name == query:
+                tier = 0
+            elif name.startswith(query):
+                tier = 1
+            elif query in name:
+                tier = 2
+            else:
+                tier = 3
+            ranked.append((tier, len(name), row))
+        ranked.sort()
+        return [row for _tier, _length, row in ranked]
+
+    def query(
+        self,
+        query: str = "",
+        mode: str = "prefix",
+        kinds: list[str] | None = None,
+        file_path: str | None = None,
+        limit: int = 200,
+    ) -> tuple[list[dict], int]:
+        """Matching symbols (at most `limit`) and the total match count."""
+        columns = self.columns()
+        folded_query = query.casefold()
+        if not folded_query:
+            rows = range(len(columns["names"]))
+        elif mode == "fuzzy":
+            rows = self._fuzzy_rows(folded_query)
+        elif mode == "exact":
+            rows = [row for row in self._prefix_rows(folded_query) if columns["names"][row].casefold() == folded_query]
+        else:
+            rows = self._prefix_rows(folded_query)
+        kind_codes = {_KIND_CODES[kind] for kind in kinds or [] if kind in _KIND_CODES}
+        file_id = None
+        if file_path is not None:
+            position = bisect.bisect_left(columns["files"], file_path)
+            if position >= len(columns["files"]) or columns["files"][position] != file_path:
+                return [], 0
+            file_id = position
+        matched = [
+            row
+            for row in rows
+            if (not kind_codes or int(columns["kinds"][row]) in kind_codes)
+            and (file_id is None or int(columns["file_ids"][row]) == file_id)
+        ]
+        return [self.symbol(row) for row in matched[:max(0, limit)]], len(matched)
+
+    def symbol(self, row: int) -> dict:
+        columns = self.columns()
+        parent = int(columns["parents"][row])
+        return {
+            "id": row,
+            "name": columns["names"][row],
+            "kind": SYMBOL_KINDS[int(columns["kinds"][row])],
+            "file": columns["files"][int(columns["file_ids"][row])],
+            "lineno": int(columns["linenos"][row]),
+            "end_lineno": int(columns["end_linenos"][row]),
+            "parent_id": parent if parent >= 0 else None,
+            "parent": columns["names"][parent] if parent >= 0 else None,
+        }
+
+    def save(self, path: str) -> None:
+        columns = self.columns()
+        tmp = path + ".tmp.npz"
+        try:
+            np.savez(
+                tmp,
+                files=np.array(columns["files"], dtype=str),
+                names=np.array(columns["names"], dtype=str),
+                kinds=columns["kinds"],
+                file_ids=columns["file_ids"],
+                linenos=columns["linenos"],
+                end_linenos=columns["end_linenos"],
+                parents=columns["parents"],
+                file_starts=columns["file_starts"],
+            )
+            os.replace(tmp, path)
+        except Exception as e:
+            print(f"[symbol_table] Failed to save {path}: {e}")
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    @classmethod
+    def load(cls, path: str) -> "SymbolTable | None":
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                files = [str(item) for item in data["files"]]
+                names = [str(item) for item in data["names"]]
+                kinds = data["kinds"].tolist()
+                linenos = data["linenos"].tolist()
+                end_linenos = data["end_linenos"].tolist()
+                parents = data["parents"].tolist()
+                file_starts = data["file_starts"].tolist()
+        except Exception as e:
+            print(f"[symbol_table] Failed to load {path}: {e}")
+            return None
+        table = cls()
+        for file_id, file_path in enumerate(files):
+            base, end = file_starts[file_id], file_starts[file_id + 1]
+            table.file_rows[file_path] = [
+                (
+                    names[row],
+                    SYMBOL_KINDS[kinds[row]],
+                    linenos[row],
+                    end_linenos[row],
+                    parents[row] - base if parents[row] >= 0 else -1,
+                )
+                for row in range(base, end)
+            ]
+        return table
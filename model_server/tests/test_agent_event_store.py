@@ -0,0 +1,91 @@
+import json
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from agent_event_store import AgentEventStore, compact_result
+
+
+def search_event(query, codes, **extra):
+    results = [
+        {"rank": rank, "file": f"/repo/{query}.py", "lineno": rank * 10, "function_name": f"f{rank}", "score": 1.0 / rank, "code": code}
+        for rank, code in enumerate(codes, start=1)
+    ]
+    return {"kind": "search", "query": query, "results": results, **extra}
+
+
+class AgentEventStoreTests(unittest.TestCase):
+    def test_events_keep_compact_results_and_recent_full_results(self):
+        store = AgentEventStore(max_events=5, full_result_events=2)
+        first = store.append(search_event("a", ["def a(): pass"]))
+        self.assertNotIn("code", first["results"][0])
+        self.assertEqual(first["results"][0]["function_name"], "f1")
+        self.assertEqual(len(first["results"][0]["code_sha256"]), 64)
+        self.assertEqual(store.full_results(first["id"])[0]["code"], "def a(): pass")
+
+        store.append(search_event("b", ["def b(): pass"]))
+        store.append(search_event("c", ["def c(): pass"]))
+        # 直近 2 件より古いイベントはログが無ければ参照だけを返す
+        self.assertEqual(store.full_results(first["id"]), first["results"])
+
+    def test_ring_evicts_oldest_and_links_parents(self):
+        store = AgentEventStore(max_events=3)
+        parent = store.append(search_event("parent", ["x"]))
+        child = store.append(search_event("child", ["y"], parent_event_id=parent["id"]))
+        self.assertEqual(store.get(parent["id"])["child_event_ids"], [child["id"]])
+        for query in ("d", "e"):
+            store.append(search_event(query, ["z"]))
+        self.assertIsNone(store.get(parent["id"]))
+        self.assertIsNone(store.full_results(parent["id"]))
+        self.assertEqual([event["query"] for event in store.recent()], ["child", "d", "e"])
+        self.assertEqual([event["query"] for event in store.recent(since_id=child["id"], limit=1)], ["e"])
+
+    def test_usage_updates_event_and_version(self):
+        store = AgentEventStore()
+        event = store.append(search_event("q", ["a", "b"]))
+        version = store.version
+        updated = store.add_usage({"id": 1, "event_id": event["id"], "referenced_ranks": [2, 1], "referenced_locations": ["q.py:20"]})
+        self.assertEqual(updated, store.get(event["id"]))
+        self.assertEqual(updated["referenced_ranks"], [1, 2])
+        self.assertEqual(updated["referenced_locations"], ["q.py:20"])
+        self.assertGreater(store.version, version)
+        self.assertIsNone(store.add_usage({"id": 2, "event_id": 999, "referenced_ranks": [1]}))
+
+    def test_returned_events_are_not_changed_by_later_updates(self):
+        store = AgentEventStore()
+        event = store.append(search_event("q", ["a"]))
+        seen = store.recent()[0]
+        first = store.add_usage({"id": 1, "event_id": event["id"], "referenced_ranks": [1]})
+        store.add_usage({"id": 2, "event_id": event["id"], "referenced_ranks": [1]})
+        store.append(search_event("child", ["b"], parent_event_id=event["id"]))
+        self.assertNotIn("usage_reports", seen)
+        self.assertEqual(len(first["usage_reports"]), 1)
+        self.assertNotIn("child_event_ids", first)
+        self.assertEqual(len(store.get(event["id"])["usage_reports"]), 2)
+
+    def test_log_backs_full_results_of_older_events(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            log_path = str(Path(tmp) / "events" / "agent_events.jsonl")
+            store = AgentEventStore(max_events=10, full_result_events=1, log_path=log_path)
+            first = store.append(search_event("a", ["def a(): pass"]))
+            store.append(search_event("b", ["def b(): pass"]))
+            store.add_usage({"id": 1, "event_id": first["id"], "referenced_ranks": [1]})
+            third = store.append(search_event("c", ["def c(): pass"]))
+            self.assertEqual(store.full_results(first["id"])[0]["code"], "def a(): pass")
+            store.append(search_event("d", ["def d(): pass"]))
+            self.assertEqual(store.full_results(third["id"])[0]["code"], "def c(): pass")
+            store.close()
+            with open(log_path, encoding="utf-8") as f:
+                records = [json.loads(line) for line in f]
+            self.assertEqual([next(iter(record)) for record in records], ["event", "event", "usage", "event", "event"])
+
+    def test_compact_result_without_code(self):
+        self.assertEqual(compact_result({"rank": 1, "file": "a.py"}), {"rank": 1, "file": "a.py"})
+        self.assertNotIn("commit_hunks", compact_result({"rank": 1, "commit_hunks": [{"hunk": "+x"}], "text": "+x"}))
+
+
+if __name__ == "__main__":
+    unittest.main()
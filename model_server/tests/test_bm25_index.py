@@ -0,0 +1,74 @@
+import math
+import sys
+import unittest
+from collections import Counter
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from bm25_index import BM25Index, term_positions, tokenize_for_bm25
+
+
+def reference_bm25(documents: list[list[str]], query: str) -> dict[int, float]:
+    query_tokens = tokenize_for_bm25(query)
+    doc_freq: Counter[str] = Counter()
+    term_freqs = [Counter(tokens) for tokens in documents]
+    for tf in term_freqs:
+        doc_freq.update(tf.keys())
+    avg = sum(len(tokens) for tokens in documents) / len(documents)
+    scores = {}
+    for index, tf in enumerate(term_freqs):
+        score = 0.0
+        for token in query_tokens:
+            freq = tf.get(token, 0)
+            if freq <= 0:
+                continue
+            df = doc_freq[token]
+            idf = math.log(1 + ((len(documents) - df + 0.5) / (df + 0.5)))
+            score += idf * ((freq * 2.5) / (freq + 1.5 * (0.25 + 0.75 * (len(documents[index]) / avg))))
+        if score > 0:
+            scores[index] = score
+    return scores
+
+
+class BM25IndexTests(unittest.TestCase):
+    messages = [
+        "Add retry logic to the HTTP client",
+        "Fix logic error in retry backoff",
+        "Refactor logging setup",
+        "Retrying uploads now respects the retry limit",
+    ]
+
+    def setUp(self):
+        self.documents = [tokenize_for_bm25(message) for message in self.messages]
+        self.index = BM25Index.from_tokens(self.documents)
+
+    def test_plain_query_matches_reference_scores(self):
+        for query in ["retry logic", "logging", "retry retry", "missing"]:
+            self.assertEqual(self.index.scores(query), reference_bm25(self.documents, query))
+
+    def test_phrase_requires_consecutive_terms(self):
+        self.assertEqual(set(self.index.scores('"retry logic"')), {0})
+        self.assertEqual(set(self.index.scores("retry logic")), {0, 1, 3})
+
+    def test_prefix_expands_against_vocabulary(self):
+        self.assertEqual(self.index.prefix_terms("retr"), ["retry", "retrying"])
+        self.assertEqual(set(self.index.scores("retr*")), {0, 1, 3})
+        self.assertEqual(set(self.index.scores("log*")), {0, 1, 2})
+
+    def test_term_scores_ignore_query_operators(self):
+        plain = BM25Index.from_tokens(self.documents, store_positions=False)
+        self.assertEqual(plain.term_scores(tokenize_for_bm25('"retry logic"')), reference_bm25(self.documents, "retry logic"))
+        self.assertEqual(plain.term_scores(tokenize_for_bm25("retr*")), {})
+        self.assertEqual(plain.positions, {})
+
+    def test_index_from_persisted_positions(self):
+        rebuilt = BM25Index.from_term_positions(
+            [term_positions(tokens) for tokens in self.documents],
+            [len(tokens) for tokens in self.documents],
+        )
+        self.assertEqual(rebuilt.scores('"retry limit" upload*'), self.index.scores('"retry limit" upload*'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from diff_fingerprint import diff_state_fingerprint
+
+
+class DiffFingerprintTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmpdir.name)
+        self.git("init", "-q")
+        self.commit("a.py", "x = 1\n")
+        self.git("branch", "base")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def git(self, *args: str) -> None:
+        subprocess.run(
+            ["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+            cwd=self.root,
+            check=True,
+            capture_output=True,
+        )
+
+    def commit(self, name: str, source: str) -> None:
+        (self.root / name).write_text(source, encoding="utf-8")
+        self.git("add", name)
+        self.git("commit", "-q", "-m", name)
+
+    def test_base_only_diff_follows_new_head_commits(self):
+        before = diff_state_fingerprint(str(self.root), "base", "")
+        self.assertEqual(diff_state_fingerprint(str(self.root), "base", ""), before)
+        self.commit("b.py", "y = 2\n")
+        self.assertNotEqual(diff_state_fingerprint(str(self.root), "base", ""), before)
+
+    def test_working_tree_diff_follows_edits(self):
+        before = diff_state_fingerprint(str(self.root), "", "")
+        (self.root / "a.py").write_text("x = 10\n", encoding="utf-8")
+        self.assertNotEqual(diff_state_fingerprint(str(self.root), "", ""), before)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import sys
+import threading
+import time
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from embedding_gate import BULK, INTERACTIVE, EmbeddingGate
+
+
+class EmbeddingGateTests(unittest.TestCase):
+    def test_query_runs_between_bulk_batches(self):
+        gate = EmbeddingGate()
+        order = []
+        first_batch = threading.Event()
+        release_first = threading.Event()
+
+        def bulk():
+            for batch in range(3):
+                with gate.slot(BULK):
+                    order.append(f"bulk-{batch}")
+                    if batch == 0:
+                        first_batch.set()
+                        release_first.wait(5)
+
+        def query():
+            with gate.slot(INTERACTIVE):
+                order.append("query")
+
+        bulk_thread = threading.Thread(target=bulk)
+        bulk_thread.start()
+        self.assertTrue(first_batch.wait(5))
+        query_thread = threading.Thread(target=query)
+        query_thread.start()
+        while gate.stats()["interactive_waiting"] == 0:
+            time.sleep(0.001)
+        release_first.set()
+        bulk_thread.join(5)
+        query_thread.join(5)
+
+        self.assertEqual(order, ["bulk-0", "query", "bulk-1", "bulk-2"])
+        stats = gate.stats()
+        self.assertEqual(stats[INTERACTIVE]["count"], 1)
+        self.assertEqual(stats[BULK]["count"], 3)
+        self.assertGreater(stats[INTERACTIVE]["last"], 0)
+        self.assertFalse(stats["busy"])
+
+    def test_idle_gate_reports_empty_stats(self):
+        stats = EmbeddingGate().stats()
+        self.assertIsNone(stats[INTERACTIVE]["mean"])
+        self.assertEqual(stats[BULK]["count"], 0)
+        with EmbeddingGate().slot(INTERACTIVE) as delay:
+            self.assertLess(delay, 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+import sys
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from embedding_reuse import assemble_embeddings, plan_embedding_reuse
+
+
+class EmbeddingReuseTests(unittest.TestCase):
+    def test_moved_functions_reuse_rows_and_duplicates_encode_once(self):
+        prev_codes = ["def a(): pass", "def b(): pass"]
+        codes = ["def b(): pass", "def c(): pass", "def a(): pass", "def c(): pass"]
+        prev_rows, new_rows, new_codes = plan_embedding_reuse(prev_codes, codes)
+        self.assertEqual(prev_rows.tolist(), [1, -1, 0, -1])
+        self.assertEqual(new_rows.tolist(), [-1, 0, -1, 0])
+        self.assertEqual(new_codes, ["def c(): pass"])
+
+        prev_embeddings = np.array([[1, 0], [0, 1]], dtype=np.float32)
+        new_embeddings = np.array([[5, 5]], dtype=np.float32)
+        embeddings = assemble_embeddings(prev_embeddings, prev_rows, new_embeddings, new_rows)
+        self.assertEqual(embeddings.tolist(), [[0, 1], [5, 5], [1, 0], [5, 5]])
+
+    def test_full_rebuild_and_empty(self):
+        prev_rows, new_rows, new_codes = plan_embedding_reuse([], ["x", "y"])
+        self.assertEqual(new_codes, ["x", "y"])
+        embeddings = assemble_embeddings(None, prev_rows, np.eye(2, dtype=np.float32), new_rows)
+        self.assertEqual(embeddings.tolist(), [[1, 0], [0, 1]])
+        prev_rows, new_rows, _ = plan_embedding_reuse(["x"], [])
+        self.assertIsNone(assemble_embeddings(np.eye(1), prev_rows, None, new_rows))
+
+
+if __name__ == "__main__":
+    unittest.main()
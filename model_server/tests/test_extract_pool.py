@@ -0,0 +1,35 @@
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from extract_pool import POOL_MIN_FILES, iter_extracted, shutdown_pool
+
+
+class ExtractPoolTests(unittest.TestCase):
+    def tearDown(self):
+        shutdown_pool()
+
+    def test_process_pool_matches_in_process_extraction(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = []
+            for index in range(POOL_MIN_FILES + 5):
+                path = Path(tmpdir) / f"module_{index}.py"
+                path.write_text(
+                    f"class Worker{index}:\n    def run(self):\n        return helper_{index}()\n\n"
+                    f"def helper_{index}():\n    return {index}\n",
+                    encoding="utf-8",
+                )
+                paths.append(str(path))
+            in_process = list(iter_extracted(paths, max_workers=1))
+            pooled = list(iter_extracted(paths, max_workers=2))
+            self.assertEqual([path for path, _ in pooled], paths)
+            self.assertEqual(pooled, in_process)
+            self.assertTrue(all(func["file"] == path for path, funcs in pooled for func in funcs))
+            self.assertTrue(all(func["language"] == "python" for _path, funcs in pooled for func in funcs))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -7,6 +7,7 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 
 from extractors import extract_functions
+from extractors.intervals import EnclosingIntervals
 
 
 class JsTsExtractorTests(unittest.TestCase):
@@ -38,6 +39,32 @@ class JsTsExtractorTests(unittest.TestCase):
         method = next(function for function in functions if function["name"] == "sendMessage")
         self.assertEqual(method["class_name"], "Mailer")
 
+    def test_jsdoc_attaches_only_to_directly_following_declaration(self):
+        functions = self.extract_from_temp_file(
+            ".ts",
+            """
+            /** Adds numbers — café */
+            export function add(a: number, b: number) {
+              return a + b;
+            }
+
+            function undocumented() {
+              return 1;
+            }
+
+            class Api {
+              /** Loads a user. */
+              @Get("/users")
+              public async loadUser() {
+                return null;
+              }
+            }
+            """,
+        )
+
+        docs = {function["name"]: function.get("docstring") for function in functions}
+        self.assertEqual(docs, {"add": "Adds numbers — café", "undocumented": None, "loadUser": "Loads a user."})
+
     def test_tsx_function_and_class_method(self):
         functions = self.extract_from_temp_file(
             ".tsx",
@@ -149,5 +176,54 @@ class JsTsExtractorTests(unittest.TestCase):
         self.assertIn("read_user", test_func["python_static"]["local_calls"])
 
 
+class ClassOwnershipTests(unittest.TestCase):
+    def extract_from_temp_file(self, suffix: str, source: str):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / f"Sample{suffix}"
+            path.write_text(textwrap.dedent(source).lstrip(), encoding="utf-8")
+            return extract_functions(path)
+
+    def test_innermost_interval(self):
+        intervals = EnclosingIntervals([(0, 100, "outer"), (10, 40, "inner"), (50, 60, "second"), (100, 120, "next")])
+        self.assertEqual(
+            [intervals.innermost(position) for position in [0, 9, 10, 39, 40, 55, 60, 100, 120]],
+            ["outer", "outer", "inner", "inner", "outer", "second", "outer", "next", None],
+        )
+
+    def test_java_nested_classes(self):
+        functions = self.extract_from_temp_file(
+            ".java",
+            """
+            class Outer {
+              void before() {}
+              static class Inner {
+                void innerWork() {}
+              }
+              void after() {}
+            }
+            """,
+        )
+        owners = {function["name"]: function["class_name"] for function in functions}
+        self.assertEqual(owners, {"before": "Outer", "innerWork": "Inner", "after": "Outer"})
+
+    def test_python_fallback_duplicate_class_names(self):
+        functions = self.extract_from_temp_file(
+            ".py",
+            """
+            class Handler:
+                def first(self):
+                    pass
+
+            class Handler:
+                def second(self):
+                    pass
+
+            def broken(:
+            """,
+        )
+        second = next(function for function in functions if function["name"] == "second")
+        self.assertEqual((second["class_name"], second["class_lineno"]), ("Handler", 5))
+
+
 if __name__ == "__main__":
     unittest.main()
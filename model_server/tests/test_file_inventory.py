@@ -0,0 +1,93 @@
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from file_inventory import FileInventory, InventoryCache, index_extensions, language_for_path, normalize_languages
+
+
+class FileInventoryTests(unittest.TestCase):
+    def setUp(self):
+        self.root = "/repo"
+        self.files = [
+            "/repo/src/app.ts",
+            "/repo/src/util.ts",
+            "/repo/scripts/tool.py",
+            "/repo/README.md",
+            "/repo/lib/core.py",
+            "/repo/web/view.tsx",
+        ]
+
+    def test_histogram_and_auto_extension(self):
+        inventory = FileInventory(self.root, self.files, ["/repo/scripts/tool.py"])
+        self.assertNotIn("/repo/README.md", inventory.files)
+        counts = inventory.histogram()
+        self.assertEqual((counts[".ts"], counts[".py"], counts[".tsx"]), (2, 2, 1))
+        # Ties go to the earlier supported extension.
+        self.assertEqual(inventory.auto_file_ext("all")[0], ".py")
+        self.assertEqual(inventory.auto_file_ext("source")[0], ".ts")
+        self.assertEqual(inventory.auto_file_ext("changed")[0], ".py")
+        self.assertEqual(FileInventory(self.root, ["/repo/a.md"]).auto_file_ext()[0], None)
+
+    def test_scope_files(self):
+        inventory = FileInventory(self.root, self.files)
+        self.assertEqual(inventory.scope_files("source", ".py"), ["/repo/lib/core.py"])
+        self.assertEqual(inventory.scope_files("all", ".py"), ["/repo/scripts/tool.py", "/repo/lib/core.py"])
+        self.assertEqual(inventory.scope_files("changed", ".py"), [])
+        self.assertEqual(inventory.rel_path("/repo/web/view.tsx"), "web/view.tsx")
+        self.assertEqual(inventory.scope_files("source", "all"), ["/repo/src/app.ts", "/repo/src/util.ts", "/repo/lib/core.py"])
+
+    def test_unified_index_languages(self):
+        self.assertEqual(index_extensions(".py"), (".py",))
+        self.assertIn(".tsx", index_extensions("all"))
+        self.assertEqual(language_for_path("/repo/web/view.tsx"), "typescript")
+        self.assertIsNone(language_for_path("/repo/README.md"))
+        self.assertEqual(normalize_languages(["Python", ".jsx", "ts", "", "rust"]), {"python", "javascript", "typescript"})
+
+
+class InventoryCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+        self.listed = 0
+        self.changed_listed = 0
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def list_files(self, root):
+        self.listed += 1
+        return [os.path.join(root, "a.py")]
+
+    def list_changed(self, root):
+        self.changed_listed += 1
+        return [os.path.join(root, "a.py")]
+
+    def test_reuses_listing_until_fingerprint_changes(self):
+        cache = InventoryCache(self.list_files, self.list_changed, ttl=3600, changed_ttl=3600)
+        first = cache.get(self.root)
+        self.assertIs(cache.get(self.root), first)
+        self.assertEqual((self.listed, self.changed_listed), (1, 0))
+        self.assertEqual(cache.get(self.root, need_changed=True).changed, [os.path.join(self.root, "a.py")])
+        cache.get(self.root, need_changed=True)
+        self.assertEqual(self.changed_listed, 1)
+
+        Path(self.root, ".owlignore").write_text("build/\n", encoding="utf-8")
+        self.assertIsNot(cache.get(self.root), first)
+        self.assertEqual(self.listed, 2)
+
+    def test_expired_entries_are_relisted(self):
+        cache = InventoryCache(self.list_files, self.list_changed, ttl=-1, changed_ttl=-1)
+        cache.get(self.root, need_changed=True)
+        cache.get(self.root, need_changed=True)
+        self.assertEqual((self.listed, self.changed_listed), (2, 2))
+        cache.invalidate(self.root)
+        cache.get(self.root)
+        self.assertEqual(self.listed, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import sys
+import tempfile
+import textwrap
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from extractors import extract_functions
+from graph_store import GraphStore, strip_legacy_file_graphs
+
+
+class GraphStoreTests(unittest.TestCase):
+    def extract(self, root: Path, name: str, source: str) -> tuple[str, list[dict]]:
+        path = root / name
+        path.write_text(textwrap.dedent(source).lstrip(), encoding="utf-8")
+        functions = extract_functions(path)
+        for func in functions:
+            func["file"] = str(path)
+        return str(path), functions
+
+    def test_graphs_are_stored_once_per_file(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            root = Path(tmpdir)
+            api_path, api = self.extract(root, "api.py", """
+                import json
+
+                def helper():
+                    return json.dumps({})
+
+                def read_user():
+                    return helper()
+                """)
+            jobs_path, jobs = self.extract(root, "jobs.py", """
+                def run():
+                    return helper()
+
+                def helper():
+                    pass
+                """)
+            self.assertTrue(all("call_graph" not in func["python_static"] for func in api + jobs))
+
+            store = GraphStore.from_functions(api + jobs)
+            self.assertEqual(store.graph_for(api_path)["call_graph"], {"helper": [], "read_user": ["helper"]})
+            self.assertEqual(store.callers("helper"), [(api_path, "read_user"), (jobs_path, "run")])
+
+            store.update_files({}, removed=[jobs_path])
+            self.assertEqual(store.callers("helper"), [(api_path, "read_user")])
+            store.save(str(root / "graphs.json"))
+            self.assertEqual(GraphStore.load(str(root / "graphs.json")).files, store.files)
+
+    def test_strip_legacy_file_graphs(self):
+        functions = [{"name": "f", "python_static": {"calls": [], "call_graph": {"f": []}, "import_dependency": {}}}]
+        self.assertEqual(strip_legacy_file_graphs(functions), 1)
+        self.assertEqual(functions[0]["python_static"], {"calls": []})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import re
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from grep_engine import compile_prefilter, grep_file, iter_grep_matches
+
+
+def reference_grep(path: Path, compiled: re.Pattern) -> list[tuple[int, str]]:
+    text = path.read_bytes().decode("utf-8", errors="replace")
+    return [(number, line[:500]) for number, line in enumerate(text.splitlines(), start=1) if compiled.search(line)]
+
+
+class GrepEngineTests(unittest.TestCase):
+    def test_matches_line_scan(self):
+        samples = {
+            "crlf.txt": b"alpha\r\nretry_logic here\r\nomega\r\n",
+            "mixed.txt": b"one\rRetry_Logic\x0ctwo\nretry_logic\n",
+            "invalid.txt": b"\xffretry_logic\xfe\nnothing\n",
+        }
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for name, data in samples.items():
+                path = Path(tmpdir) / name
+                path.write_bytes(data)
+                for pattern, regex, case_sensitive in [
+                    ("retry_logic", False, True),
+                    ("retry_logic", False, False),
+                    ("retry_(logic|limit)", True, True),
+                    (r"\w+", True, True),
+                ]:
+                    compiled = re.compile(pattern if regex else re.escape(pattern), 0 if case_sensitive else re.IGNORECASE)
+                    prefilter = compile_prefilter(pattern, regex, case_sensitive)
+                    self.assertEqual(grep_file(str(path), compiled, prefilter, 100), reference_grep(path, compiled), (name, pattern))
+
+    def test_ordered_results_stop_at_limit(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            files = []
+            for index in range(200):
+                path = Path(tmpdir) / f"f{index:03d}.py"
+                path.write_text(f"x = {index}\nneedle_{index}\n", encoding="utf-8")
+                files.append(str(path))
+            compiled = re.compile("needle_")
+            prefilter = compile_prefilter("needle_", False, True)
+            matches = list(iter_grep_matches(tmpdir, files, compiled, prefilter, 5, max_workers=4))
+            self.assertEqual([match["path"] for match in matches], [f"f{index:03d}.py" for index in range(5)])
+            self.assertTrue(all(match["line"] == 2 for match in matches))
+
+
+if __name__ == "__main__":
+    unittest.main()
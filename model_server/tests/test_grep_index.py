@@ -0,0 +1,46 @@
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from grep_index import TrigramIndex, literal_requirements, query_trigrams
+
+
+class GrepIndexTests(unittest.TestCase):
+    def test_regex_planning(self):
+        self.assertEqual(literal_requirements("foo(bar|baz)+qux", True, True), [["foo", "ba", "qux"]])
+        self.assertEqual(literal_requirements("ClassA|ClassB", True, True), [["Class"]])
+        self.assertIsNone(query_trigrams(r"\w+", True, True))
+        # re.IGNORECASE matches "k" against the Kelvin sign, so it cannot be required.
+        self.assertIsNone(query_trigrams("kick", False, False))
+
+    def test_candidates_follow_file_changes(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            root = Path(tmpdir)
+            (root / "a.py").write_text("def retry_logic():\n    pass\n", encoding="utf-8")
+            (root / "b.py").write_text("def unrelated():\n    pass\n", encoding="utf-8")
+            (root / "c.bin").write_bytes(b"retry_logic\0binary")
+            files = [str(root / name) for name in ("a.py", "b.py", "c.bin")]
+            index = TrigramIndex(str(root / "index" / "grep.npz"))
+            index.refresh(files)
+            index.compact()
+            self.assertEqual(index.candidate_paths("retry_logic", False, True), {files[0]})
+            self.assertEqual(index.candidate_paths("RETRY_LOGIC", False, False), {files[0]})
+
+            (root / "b.py").write_text("retry_logic()\n", encoding="utf-8")
+            os.utime(root / "b.py", ns=(1, 1))
+            (root / "a.py").unlink()
+            index.refresh(files)
+            self.assertEqual(index.candidate_paths("retry_logic", False, True), {files[1]})
+
+            index.save()
+            reloaded = TrigramIndex(index.path)
+            self.assertEqual(reloaded.refresh(files[1:]), 0)
+            self.assertEqual(reloaded.candidate_paths("retry_logic", False, True), {files[1]})
+
+
+if __name__ == "__main__":
+    unittest.main()
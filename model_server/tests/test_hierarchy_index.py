@@ -0,0 +1,44 @@
+import sys
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from hierarchy_index import HierarchyIndex
+
+
+class HierarchyIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.functions = [
+            {"name": "a", "file": "/r/a.py", "class_name": "Parser"},
+            {"name": "b", "file": "/r/a.py", "class_name": "Parser"},
+            {"name": "c", "file": "/r/a.py", "class_name": None},
+            {"name": "d", "file": "/r/b.py", "class_name": "Writer"},
+        ]
+        self.embeddings = np.array([[1, 0], [3, 0], [2, 2], [0, 5]], dtype=np.float32)
+        self.index = HierarchyIndex()
+        self.index.update(self.functions, self.embeddings)
+
+    def test_mean_pooled_vectors_and_members(self):
+        keys, distances = self.index.distances(np.array([2, 0], dtype=np.float32), "class")
+        self.assertEqual(keys, [("/r/a.py", "Parser"), ("/r/b.py", "Writer")])
+        np.testing.assert_allclose(distances, [0.0, 29.0])
+        nearest = self.index.nearest(np.array([0, 4], dtype=np.float32), "file", 1)
+        self.assertEqual(nearest[0][0], "/r/b.py")
+        self.assertEqual(self.index.member_rows(["/r/a.py"], "file").tolist(), [0, 1, 2])
+        self.assertEqual(self.index.member_rows([("/r/a.py", "Parser")], "class").tolist(), [0, 1])
+
+    def test_incremental_update_repools_changed_files_only(self):
+        functions = [self.functions[3], {"name": "e", "file": "/r/c.py", "class_name": None}]
+        embeddings = np.array([[9, 9], [0, 1]], dtype=np.float32)
+        self.index.update(functions, embeddings, changed_files=["/r/c.py"], removed_files=["/r/a.py"])
+        self.assertEqual(sorted(self.index.pooled), ["/r/b.py", "/r/c.py"])
+        # b.py did not change, so its pooled vector is kept; rows follow the new layout.
+        np.testing.assert_allclose(self.index.pooled["/r/b.py"][0], [0, 5])
+        self.assertEqual(self.index.member_rows(["/r/c.py"], "file").tolist(), [1])
+
+
+if __name__ == "__main__":
+    unittest.main()
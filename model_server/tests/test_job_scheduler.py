@@ -0,0 +1,135 @@
+import asyncio
+import sys
+import threading
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import progress
+from job_scheduler import (
+    CANCELLED,
+    DONE,
+    FAILED,
+    PRIORITY_BULK,
+    PRIORITY_INTERACTIVE,
+    JobQueueFull,
+    JobScheduler,
+)
+
+
+def blocker():
+    """A job body that holds its resource until released."""
+    started = threading.Event()
+    release = threading.Event()
+
+    def run():
+        started.set()
+        release.wait(5)
+        return "blocker"
+
+    return run, started, release
+
+
+class JobSchedulerTests(unittest.TestCase):
+    def test_interactive_jobs_overtake_queued_bulk_work(self):
+        scheduler = JobScheduler(workers=1)
+        run, started, release = blocker()
+        scheduler.submit("build_index", run, "index")
+        self.assertTrue(started.wait(5))
+        order = []
+        bulk = scheduler.submit("embed", lambda: order.append("bulk"), "index", PRIORITY_BULK)
+        search = scheduler.submit("search", lambda: order.append("search"), "index", PRIORITY_INTERACTIVE)
+        release.set()
+        bulk.future.result(5)
+        search.future.result(5)
+        self.assertEqual(order, ["search", "bulk"])
+        self.assertEqual(search.status, DONE)
+        self.assertIsNotNone(search.summary()["queue_delay"])
+
+    def test_identical_jobs_share_one_run(self):
+        scheduler = JobScheduler(workers=1)
+        run, started, release = blocker()
+        first = scheduler.submit("build_index", run, "index", key=("build_index", "/repo", ".py"))
+        second = scheduler.submit("build_index", run, "index", key=("build_index", "/repo", ".py"))
+        self.assertIs(first, second)
+        self.assertEqual(first.submissions, 2)
+        release.set()
+        self.assertEqual(first.future.result(5), "blocker")
+        third = scheduler.submit("build_index", lambda: "again", "index", key=("build_index", "/repo", ".py"))
+        self.assertIsNot(third, first)
+        self.assertEqual(third.future.result(5), "again")
+
+    def test_resources_run_in_parallel_and_queue_is_bounded(self):
+        scheduler = JobScheduler(workers=2, max_queued=1)
+        run, started, release = blocker()
+        scheduler.submit("build_index", run, "index")
+        self.assertTrue(started.wait(5))
+        diff = scheduler.submit("prepare_diff_search", lambda: "diff", "diff")
+        self.assertEqual(diff.future.result(5), "diff")
+        scheduler.submit("search", lambda: None, "index")
+        with self.assertRaises(JobQueueFull):
+            scheduler.submit("search", lambda: None, "index")
+        release.set()
+
+    def test_cancel_queued_and_running_jobs(self):
+        scheduler = JobScheduler(workers=1)
+        run, started, release = blocker()
+        running = scheduler.submit("build_index", run, "index")
+        self.assertTrue(started.wait(5))
+        queued = scheduler.submit("search", lambda: "never", "index", operation_id="queued-op")
+        self.assertEqual(scheduler.cancel_operation("queued-op"), [queued.id])
+        self.assertEqual(queued.status, CANCELLED)
+        with self.assertRaises(progress.OperationCancelled):
+            queued.future.result(1)
+
+        self.assertTrue(scheduler.cancel(running.id))
+        self.assertTrue(running.operation.is_cancelled())
+        release.set()
+        running.future.result(5)
+
+        run, started, release = blocker()
+        scheduler.submit("build_index", run, "index")
+        self.assertTrue(started.wait(5))
+        cancelled_first = scheduler.submit("search", lambda: "never", "index")
+        progress.request_cancel(cancelled_first.operation_id)
+        release.set()
+        with self.assertRaises(progress.OperationCancelled):
+            cancelled_first.future.result(5)
+        self.assertEqual(cancelled_first.status, CANCELLED)
+        self.assertFalse(scheduler.cancel(cancelled_first.id))
+
+    def test_failures_and_async_waiters(self):
+        scheduler = JobScheduler(workers=1)
+
+        def boom():
+            raise ValueError("bad input")
+
+        failed = scheduler.submit("embed", boom, "embed")
+        with self.assertRaises(ValueError):
+            failed.future.result(5)
+        self.assertEqual(failed.status, FAILED)
+        self.assertIn("bad input", failed.summary()["error"])
+
+        job = scheduler.submit("search", lambda: {"results": []}, "index")
+        self.assertEqual(asyncio.run(job.wait_async()), {"results": []})
+        self.assertEqual(job.summary(include_result=True)["result"], {"results": []})
+        self.assertIsNotNone(scheduler.get(job.id))
+
+    def test_job_body_runs_inside_its_progress_operation(self):
+        scheduler = JobScheduler(workers=1)
+
+        def body():
+            progress.start("Embedding", 4)
+            progress.update(2, 4)
+            return progress.current_operation_id()
+
+        job = scheduler.submit("embed", body, "embed", operation_id="embed-op")
+        self.assertEqual(job.future.result(5), "embed-op")
+        snap = progress.snapshot("embed-op")
+        self.assertEqual((snap["current"], snap["total"]), (2, 4))
+        self.assertFalse(snap["running"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,192 @@
+import asyncio
+import json
+import sys
+import threading
+import time
+import unittest
+import urllib.error
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import mcp_server
+from mcp_server import ServerConnectionPool
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connections = 0
+    posts = 0
+
+    def setup(self):
+        super().setup()
+        type(self).connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.startswith("/missing"):
+            self._reply(404, {"detail": "missing"})
+        else:
+            self._reply(200, {"path": self.path})
+        if self.path.startswith("/drop"):
+            # Close without announcing it, like a server dropping an idle keep-alive socket.
+            self.close_connection = True
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        type(self).posts += 1
+        if self.path == "/crash":
+            # The request was received, but the connection drops before any reply.
+            self.close_connection = True
+            return
+        if self.path == "/search_stream":
+            self._stream([
+                {"type": "results", "final": False, "stage": "bm25", "results": [{"name": "draft"}]},
+                {"type": "progress", "phase": "Embedding", "current": 1, "total": 2},
+                {"type": "results", "final": True, "results": [{"name": "final"}], "file_ext": "all"},
+                {"type": "done", "result_count": 1},
+            ])
+            return
+        self._reply(200, {"echo": json.loads(body)})
+
+    def _stream(self, frames: list[dict]) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for frame in frames:
+            line = (json.dumps(frame) + "\n").encode("utf-8")
+            self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class ServerConnectionPoolTests(unittest.TestCase):
+    def setUp(self):
+        _Handler.connections = 0
+        _Handler.posts = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.base = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.pool = ServerConnectionPool()
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_requests_reuse_one_connection(self):
+        for i in range(5):
+            _status, data = self.pool.request("POST", f"{self.base}/echo", json.dumps({"i": i}).encode())
+            self.assertEqual(json.loads(data), {"echo": {"i": i}})
+        _status, data = self.pool.request("GET", f"{self.base}/x?limit=3")
+        self.assertEqual(json.loads(data), {"path": "/x?limit=3"})
+        self.assertEqual(_Handler.connections, 1)
+
+    def test_error_status_raises_http_error_with_body(self):
+        with self.assertRaises(urllib.error.HTTPError) as ctx:
+            self.pool.request("GET", f"{self.base}/missing")
+        self.assertEqual(ctx.exception.code, 404)
+        self.assertIn("missing", ctx.exception.read().decode())
+        # The connection stays usable after an error response.
+        self.pool.request("GET", f"{self.base}/ok")
+        self.assertEqual(_Handler.connections, 1)
+
+    def test_stale_connection_is_replaced(self):
+        self.pool.request("GET", f"{self.base}/drop")
+        _status, data = self.pool.request("GET", f"{self.base}/b")
+        self.assertEqual(json.loads(data), {"path": "/b"})
+        self.assertEqual(_Handler.connections, 2)
+
+    def test_post_on_stale_idle_connection_uses_a_fresh_one(self):
+        self.pool.request("GET", f"{self.base}/drop")
+        time.sleep(0.2)
+        _status, data = self.pool.request("POST", f"{self.base}/echo", b'{"i": 1}')
+        self.assertEqual(json.loads(data), {"echo": {"i": 1}})
+        self.assertEqual(_Handler.connections, 2)
+
+    def test_post_dropped_after_sending_is_not_resent(self):
+        self.pool.request("GET", f"{self.base}/a")
+        with self.assertRaises(urllib.error.URLError):
+            self.pool.request("POST", f"{self.base}/crash", b"{}")
+        self.assertEqual(_Handler.posts, 1)
+
+    def test_search_stream_returns_final_frame_on_a_reused_connection(self):
+        original_pool = mcp_server._connection_pool
+        mcp_server._connection_pool = self.pool
+        try:
+            result = mcp_server.search_stream(self.base, {"query": "q"})
+            self.assertEqual(result["results"], [{"name": "final"}])
+            self.assertTrue(result["final"])
+            lines = list(self.pool.stream_lines("POST", f"{self.base}/search_stream", b"{}"))
+            self.assertEqual(len(lines), 4)
+        finally:
+            mcp_server._connection_pool = original_pool
+        self.assertEqual(_Handler.connections, 1)
+
+    def test_unreachable_server_raises_url_error(self):
+        self.server.shutdown()
+        self.server.server_close()
+        port = self.server.server_address[1]
+        with self.assertRaises(urllib.error.URLError):
+            self.pool.request("GET", f"http://127.0.0.1:{port}/a", timeout=2)
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+
+class ToolCallDispatcherTests(unittest.TestCase):
+    def test_timed_out_call_keeps_its_slot_until_the_thread_returns(self):
+        release = threading.Event()
+        calls, messages = [], []
+
+        def slow_tool(name, arguments, progress_token, operation_id):
+            calls.append(name)
+            if name == "first":
+                release.wait(5)
+            return {"name": name}
+
+        patched = {
+            "call_tool": slow_tool,
+            "tool_timeout": lambda name: 0.05,
+            "call_cancel_embedding": lambda arguments: {},
+            "write_message": messages.append,
+        }
+        originals = {name: getattr(mcp_server, name) for name in patched}
+        for name, value in patched.items():
+            setattr(mcp_server, name, value)
+
+        async def scenario():
+            dispatcher = mcp_server.ToolCallDispatcher(max_concurrency=1)
+            dispatcher.submit(1, "first", {})
+            await asyncio.sleep(0.2)
+            # The first call timed out but its thread is still running.
+            dispatcher.submit(2, "second", {})
+            await asyncio.sleep(0.1)
+            self.assertEqual(calls, ["first"])
+            release.set()
+            await dispatcher.drain()
+
+        try:
+            asyncio.run(scenario())
+        finally:
+            release.set()
+            for name, value in originals.items():
+                setattr(mcp_server, name, value)
+        self.assertEqual(calls, ["first", "second"])
+        self.assertIn("timed out", messages[0]["error"]["message"])
+        self.assertEqual(messages[1]["result"], {"name": "second"})
+
+
+if __name__ == "__main__":
+    unittest.main()
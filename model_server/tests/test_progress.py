@@ -0,0 +1,105 @@
+import asyncio
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import progress
+
+
+class ProgressVersionTests(unittest.TestCase):
+    def tearDown(self):
+        progress.clear_cancel()
+        progress.finish()
+
+    def test_count_updates_bump_version_but_not_phase_version(self):
+        progress.start("Embedding", 100)
+        version, phase_version = progress.versions()
+        self.assertEqual(version, phase_version)
+
+        for current in range(1, 6):
+            progress.update(current, 100)
+        after_counts = progress.versions()
+        self.assertEqual(after_counts[0], version + 5)
+        self.assertEqual(after_counts[1], phase_version)
+
+        progress.update(6, 100, phase="Building FAISS index")
+        self.assertEqual(progress.versions()[1], progress.versions()[0])
+
+    def test_cancel_and_finish_are_phase_changes(self):
+        progress.start("Embedding", 10)
+        progress.update(3, 10)
+        _, phase_version = progress.versions()
+        progress.request_cancel()
+        version, cancel_phase_version = progress.versions()
+        self.assertGreater(cancel_phase_version, phase_version)
+        self.assertEqual(version, cancel_phase_version)
+        snap = progress.snapshot()
+        self.assertTrue(snap["cancel_requested"])
+        self.assertEqual(snap["version"], version)
+
+    def test_snapshot_reports_rate(self):
+        progress.start("Embedding", 10)
+        progress.update(4, 10)
+        snap = progress.snapshot()
+        self.assertIn("rate", snap)
+        if snap["elapsed"] > 0:
+            self.assertGreater(snap["rate"], 0)
+
+
+class OperationTests(unittest.TestCase):
+    def test_cancel_is_scoped_to_one_operation(self):
+        with progress.operation("build_index") as build, progress.operation("prepare_diff_search", "diff-1") as diff:
+            self.assertEqual(diff.id, "diff-1")
+            self.assertEqual(progress.request_cancel("diff-1"), ["diff-1"])
+            self.assertTrue(diff.is_cancelled())
+            self.assertFalse(build.is_cancelled())
+            with self.assertRaises(progress.OperationCancelled):
+                diff.raise_if_cancelled()
+        self.assertFalse(progress.snapshot(build.id)["running"])
+        self.assertTrue(progress.snapshot("diff-1")["cancel_requested"])
+        self.assertIsNone(progress.snapshot("missing"))
+
+    def test_progress_follows_the_operation_into_worker_threads(self):
+        def embed(total):
+            progress.start("Embedding", total)
+            progress.update(total // 2, total)
+            progress.raise_if_cancelled()
+
+        async def run(op_id, total):
+            with progress.operation("search", op_id):
+                await asyncio.to_thread(embed, total)
+                return progress.snapshot(op_id)
+
+        async def main():
+            return await asyncio.gather(run("op-a", 10), run("op-b", 40))
+
+        snap_a, snap_b = asyncio.run(main())
+        self.assertEqual((snap_a["current"], snap_a["total"]), (5, 10))
+        self.assertEqual((snap_b["current"], snap_b["total"]), (20, 40))
+        self.assertEqual(snap_a["phase"], "Embedding")
+
+    def test_nested_and_same_id_calls_join_the_running_operation(self):
+        with progress.operation("search_batch") as outer:
+            with progress.operation("search") as nested:
+                self.assertIs(nested, outer)
+            joined = progress.begin("search", outer.id)
+            self.assertIs(joined, outer)
+            progress.end(joined)
+            self.assertTrue(progress.snapshot(outer.id)["running"])
+        self.assertFalse(progress.snapshot(outer.id)["running"])
+        with progress.operation("search", outer.id) as reused:
+            self.assertIsNot(reused, outer)
+            self.assertFalse(reused.is_cancelled())
+
+    def test_unscoped_snapshot_lists_running_operations(self):
+        with progress.operation("build_index", "listed") as op:
+            progress.start("Scanning files", 3)
+            snap = progress.snapshot()
+            self.assertEqual(snap["op_id"], op.id)
+            self.assertIn(op.id, [item["op_id"] for item in snap["operations"]])
+
+
+if __name__ == "__main__":
+    unittest.main()
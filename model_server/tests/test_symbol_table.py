@@ -0,0 +1,80 @@
+import sys
+import tempfile
+import textwrap
+import time
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from extractors import extract_functions
+from symbol_table import SymbolTable
+
+
+class SymbolTableTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmpdir.name)
+        self.service = self.write("service.py", """
+            class UserService:
+                def get_user(self):
+                    pass
+
+                def get_user_name(self):
+                    pass
+
+            def load_config():
+                pass
+            """)
+        self.table = SymbolTable()
+        self.table.update_files({self.service: self.extract(self.service)})
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, name: str, source: str) -> str:
+        path = self.root / name
+        path.write_text(textwrap.dedent(source).lstrip(), encoding="utf-8")
+        return str(path)
+
+    def extract(self, path: str) -> list[dict]:
+        functions = extract_functions(path)
+        for func in functions:
+            func["file"] = path
+        return functions
+
+    def test_classes_carry_line_ranges_and_parent_links(self):
+        symbols, total = self.table.query("get_user", "prefix")
+        self.assertEqual(total, 2)
+        self.assertEqual({symbol["parent"] for symbol in symbols}, {"UserService"})
+        user_service = self.table.symbol(symbols[0]["parent_id"])
+        self.assertEqual((user_service["kind"], user_service["lineno"], user_service["end_lineno"]), ("class", 1, 6))
+
+    def test_prefix_and_fuzzy_lookup(self):
+        self.assertEqual([s["name"] for s in self.table.query("GET_U", "prefix")[0]], ["get_user", "get_user_name"])
+        self.assertEqual([s["name"] for s in self.table.query("usrsvc", "fuzzy")[0]], ["UserService"])
+        self.assertEqual([s["name"] for s in self.table.query("get_user", "fuzzy")[0]], ["get_user", "get_user_name"])
+        self.assertEqual([s["name"] for s in self.table.query("", kinds=["function"])[0]], ["load_config"])
+
+    def test_fuzzy_near_miss_on_long_name_is_fast(self):
+        long_name = self.write("long.py", f"def {'a' * 40}():\n    pass\n")
+        self.table.update_files({long_name: self.extract(long_name)})
+        started = time.monotonic()
+        self.assertEqual(self.table.query("a" * 30 + "b", "fuzzy"), ([], 0))
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertEqual(self.table.query("a" * 30, "fuzzy")[1], 1)
+
+    def test_per_file_update_and_persistence(self):
+        other = self.write("other.py", "def load_data():\n    pass\n")
+        self.table.update_files({other: self.extract(other)})
+        self.assertEqual(self.table.query("load", "prefix")[1], 2)
+        self.table.update_files({}, removed=[self.service])
+        path = str(self.root / "symbols.npz")
+        self.table.save(path)
+        reloaded = SymbolTable.load(path)
+        self.assertEqual(reloaded.query("load", "prefix")[0], self.table.query("load", "prefix")[0])
+        self.assertEqual(reloaded.query("", file_path=other)[1], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
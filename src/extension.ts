@@ -601,6 +601,75 @@ function getServerUrl(endpoint: string, port: number = activeServerPort): string
 	return `${getServerBaseUrl(port)}${endpoint}`;
 }
 
+// Calls onEvent for each Server-Sent Event (event name + parsed JSON data) as it arrives.
+async function readServerSentEvents(res: Response, onEvent: (event: string, data: any) => void): Promise<void> {
+	if (!res.body) {
+		return;
+	}
+	const reader = res.body.getReader();
+	const decoder = new TextDecoder();
+	let buffered = '';
+	for (;;) {
+		const { done, value } = await reader.read();
+		if (done) {
+			break;
+		}
+		buffered += decoder.decode(value, { stream: true }).replace(/\r\n/g, '\n');
+		let boundary = buffered.indexOf('\n\n');
+		while (boundary >= 0) {
+			const block = buffered.slice(0, boundary);
+			buffered = buffered.slice(boundary + 2);
+			let event = 'message';
+			const dataLines: string[] = [];
+			for (const line of block.split('\n')) {
+				if (line.startsWith('event:')) {
+					event = line.slice(6).trim();
+				} else if (line.startsWith('data:')) {
+					dataLines.push(line.slice(5).trimStart());
+				}
+			}
+			if (dataLines.length > 0) {
+				try {
+					onEvent(event, JSON.parse(dataLines.join('\n')));
+				} catch {
+					// Skip malformed events rather than dropping the connection.
+				}
+			}
+			boundary = buffered.indexOf('\n\n');
+		}
+	}
+}
+
+// Calls onFrame for each JSON line of an NDJSON response as soon as it arrives.
+async function readNdjsonFrames(res: Response, onFrame: (frame: any) => void): Promise<void> {
+	if (!res.body) {
+		return;
+	}
+	const reader = res.body.getReader();
+	const decoder = new TextDecoder();
+	let buffered = '';
+	for (;;) {
+		const { done, value } = await reader.read();
+		if (done) {
+			break;
+		}
+		buffered += decoder.decode(value, { stream: true });
+		let newline = buffered.indexOf('\n');
+		while (newline >= 0) {
+			const line = buffered.slice(0, newline).trim();
+			buffered = buffered.slice(newline + 1);
+			if (line) {
+				onFrame(JSON.parse(line));
+			}
+			newline = buffered.indexOf('\n');
+		}
+	}
+	const rest = (buffered + decoder.decode()).trim();
+	if (rest) {
+		onFrame(JSON.parse(rest));
+	}
+}
+
 async function isOwlServerReachable(port: number): Promise<boolean> {
 	try {
 		const res = await fetch(getServerUrl('/index_status', port));
@@ -1597,8 +1666,7 @@ function getOwlIgnorePayload(workspaceRoot: string, maxDepth = 4) {
 class OwlspotlightSidebarProvider implements vscode.WebviewViewProvider {
 	public static readonly viewType = 'owlspotlight.sidebar';
 	private _view?: vscode.WebviewView;
-	private _agentSearchPoll?: NodeJS.Timeout;
-	private _indexProgressPoll?: NodeJS.Timeout;
+	private _serverEvents?: AbortController;
 	private _lastAgentSearchEventId = 0;
 	private readonly _webviewSessionId = `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
 
@@ -1608,8 +1676,7 @@ class OwlspotlightSidebarProvider implements vscode.WebviewViewProvider {
 	) {
 		this._context.subscriptions.push({
 			dispose: () => {
-				this.stopAgentSearchPolling();
-				this.stopIndexProgressPolling();
+				this.stopServerEvents();
 			}
 		});
 	}
@@ -1622,72 +1689,52 @@ class OwlspotlightSidebarProvider implements vscode.WebviewViewProvider {
 		this._view?.webview.postMessage({ type: 'error', message });
 	}
 
-	private stopAgentSearchPolling() {
-		if (this._agentSearchPoll) {
-			clearInterval(this._agentSearchPoll);
-			this._agentSearchPoll = undefined;
+	private stopServerEvents() {
+		if (this._serverEvents) {
+			this._serverEvents.abort();
+			this._serverEvents = undefined;
 		}
 	}
 
-	private stopIndexProgressPolling() {
-		if (this._indexProgressPoll) {
-			clearInterval(this._indexProgressPoll);
-			this._indexProgressPoll = undefined;
-		}
-	}
-
-	private startAgentSearchPolling(webviewView: vscode.WebviewView) {
-		this.stopAgentSearchPolling();
-		const poll = async () => {
-			if (!webviewView.visible) {
-				return;
-			}
-			const serverPort = await resolveActiveServerPort();
-			if (serverPort === undefined) {
-				return;
-			}
-			try {
-				const res = await fetch(getServerUrl('/agent_search_events?since_id=0&limit=20', serverPort));
-				if (!res.ok) {
-					return;
-				}
-				const data: any = await res.json();
-				const events: AgentSearchEvent[] = Array.isArray(data?.events) ? data.events : [];
-				if (events.length === 0) {
-					return;
+	// Progress and agent search events are pushed by the server over SSE (/events);
+	// the connection is re-opened whenever the server restarts or changes port.
+	private startServerEvents(webviewView: vscode.WebviewView) {
+		this.stopServerEvents();
+		const controller = new AbortController();
+		this._serverEvents = controller;
+		const connect = async () => {
+			while (!controller.signal.aborted) {
+				const serverPort = await resolveActiveServerPort();
+				if (serverPort !== undefined) {
+					try {
+						const res = await fetch(getServerUrl('/events?limit=20', serverPort), {
+							headers: { Accept: 'text/event-stream' },
+							signal: controller.signal
+						});
+						if (res.ok) {
+							await readServerSentEvents(res, (event, data) => {
+								if (event === 'progress') {
+									webviewView.webview.postMessage({ type: 'indexProgress', progress: data });
+								} else if (event === 'agent_events') {
+									const events: AgentSearchEvent[] = Array.isArray(data?.events) ? data.events : [];
+									if (events.length === 0) {
+										return;
+									}
+									this._lastAgentSearchEventId = Math.max(this._lastAgentSearchEventId, ...events.map((item) => Number(item.id) || 0));
+									webviewView.webview.postMessage({ type: 'agentSearchEvents', events });
+								}
+							});
+						}
+					} catch {
+						// The server can be started/stopped independently; reconnect below.
+					}
 				}
-				this._lastAgentSearchEventId = Math.max(this._lastAgentSearchEventId, ...events.map((event) => Number(event.id) || 0));
-				webviewView.webview.postMessage({ type: 'agentSearchEvents', events });
-			} catch {
-				// The server can be started/stopped independently; ignore transient polling failures.
-			}
-		};
-		this._agentSearchPoll = setInterval(poll, 2500);
-		void poll();
-	}
-
-	private startIndexProgressPolling(webviewView: vscode.WebviewView) {
-		this.stopIndexProgressPolling();
-		const tick = async () => {
-			if (!webviewView.visible) {
-				return;
-			}
-			const serverPort = await resolveActiveServerPort();
-			if (serverPort === undefined) {
-				return;
-			}
-			try {
-				const res = await fetch(getServerUrl('/index_progress', serverPort));
-				if (res.ok) {
-					const data: any = await res.json();
-					webviewView.webview.postMessage({ type: 'indexProgress', progress: data });
+				if (!controller.signal.aborted) {
+					await new Promise((resolve) => setTimeout(resolve, 2500));
 				}
-			} catch {
-				// Progress polling is best-effort; ignore transient failures.
 			}
 		};
-		this._indexProgressPoll = setInterval(tick, 500);
-		void tick();
+		void connect();
 	}
 
 	private async setupAndStartServer(webviewView: vscode.WebviewView): Promise<boolean> {
@@ -1745,8 +1792,7 @@ class OwlspotlightSidebarProvider implements vscode.WebviewViewProvider {
                } catch {}
                const langs = await detectLanguages();
                webviewView.webview.html = this.getHtmlForWebview(webviewView.webview, langs);
-               this.startAgentSearchPolling(webviewView);
-               this.startIndexProgressPolling(webviewView);
+               this.startServerEvents(webviewView);
 
                 const config = vscode.workspace.getConfiguration('owlspotlight');
                 // フラットな設定取得に対応
@@ -1912,6 +1958,27 @@ class OwlspotlightSidebarProvider implements vscode.WebviewViewProvider {
                                 }
                                 return;
                         }
+                        if (msg.command === 'loadAgentSearchEvent') {
+                                // Events pushed over /events carry result references only; fetch the code on demand.
+                                const eventId = Number(msg.eventId);
+                                const serverPort = await resolveActiveServerPort();
+                                if (serverPort === undefined) {
+                                        webviewView.webview.postMessage({ type: 'agentSearchEventDetail', eventId, message: 'OwlSpotlight server is not running.' });
+                                        return;
+                                }
+                                try {
+                                        const res = await fetch(getServerUrl(`/agent_search_events/${eventId}`, serverPort));
+                                        if (res.ok) {
+                                                const data: any = await res.json();
+                                                webviewView.webview.postMessage({ type: 'agentSearchEventDetail', eventId, event: data.event });
+                                        } else {
+                                                webviewView.webview.postMessage({ type: 'agentSearchEventDetail', eventId, message: 'Agent search event is no longer stored.' });
+                                        }
+                                } catch {
+                                        webviewView.webview.postMessage({ type: 'agentSearchEventDetail', eventId, message: 'Failed to load agent search results.' });
+                                }
+                                return;
+                        }
                         if (msg.command === 'prepareDiffSearch') {
                                 const workspaceFolders = vscode.workspace.workspaceFolders;
                                 if (!workspaceFolders || workspaceFolders.length === 0) {
@@ -2059,7 +2126,9 @@ class OwlspotlightSidebarProvider implements vscode.WebviewViewProvider {
 					return;
 				}
 				try {
-					const res = await fetch(getServerUrl('/search_functions_simple', serverPort), {
+					// Streamed search: BM25 preview results arrive first while embeddings are built,
+					// then the final semantic/hybrid ranking replaces them.
+					const res = await fetch(getServerUrl('/search_stream', serverPort), {
 						method: 'POST',
 						headers: { 'Content-Type': 'application/json' },
 						body: JSON.stringify({
@@ -2075,15 +2144,29 @@ class OwlspotlightSidebarProvider implements vscode.WebviewViewProvider {
 							diff_head_ref: diffHeadRef
 						})
 					});
-					const data: any = await res.json();
-					if (data?.cancelled) {
-						webviewView.webview.postMessage({ type: 'status', message: data.message || 'Indexing / embedding cancelled.' });
+					if (!res.ok) {
 						webviewView.webview.postMessage({ type: 'results', results: [], folderPath });
 						return;
 					}
-					if (data && data.results && Array.isArray(data.results) && data.results.length > 0) {
-						webviewView.webview.postMessage({ type: 'results', results: data.results, folderPath });
-					} else {
+					let received = false;
+					await readNdjsonFrames(res, (frame) => {
+						if (frame?.type === 'error') {
+							received = true;
+							webviewView.webview.postMessage({ type: 'error', message: frame.message || 'Search failed.' });
+						} else if (frame?.type === 'cancelled') {
+							received = true;
+							webviewView.webview.postMessage({ type: 'status', message: frame.message || 'Indexing / embedding cancelled.' });
+							webviewView.webview.postMessage({ type: 'results', results: [], folderPath });
+						} else if (frame?.type === 'results') {
+							received = true;
+							const results = Array.isArray(frame.results) ? frame.results : [];
+							webviewView.webview.postMessage({ type: 'results', results, folderPath });
+							if (!frame.final) {
+								webviewView.webview.postMessage({ type: 'status', message: 'Showing keyword matches while embeddings are prepared...' });
+							}
+						}
+					});
+					if (!received) {
 						webviewView.webview.postMessage({ type: 'results', results: [], folderPath });
 					}
 				} catch {